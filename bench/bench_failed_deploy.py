@@ -0,0 +1,79 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""bench_failed_deploy -- how much of a group a bad deploy takes down.
+
+Usage: %s [numprocs]
+
+Restarts a group of 10 processes (unless another size is given) whose
+every spawn fails, as a broken deploy would, with batch_size=2,
+max_unavailable=2 and canary=1. A rolling restart must not take down more
+processes than its limit allows just because the ones it already
+restarted failed, so each policy reports how many processes ended up not
+running, the most it may leave down, how long the restart took on a
+virtual clock and the faults it returned. The exit status is 1 if any
+policy took down more than it may.
+"""
+import sys
+from supervisor import events
+from supervisor.states import ProcessStates
+from supervisor.plugins import restarter
+from fakesupervisord import FakeSupervisord,install_clock
+
+# name, restart options and how many processes it may leave down
+POLICIES = (('batch_size=2',{'batch_size':2},2),
+            ('max_unavailable=2',{'max_unavailable':2},2),
+            ('canary=1',{'canary':1,'canary_soak':5.0},1))
+
+def run(numprocs,options):
+  events.clear()
+  supervisord = FakeSupervisord(virtual=True,seed=1)
+  group = supervisord.add_group('bench',numprocs,startsecs=1.0,
+                                spawn_error_rate=1.0,startretries=1)
+  restore = install_clock(supervisord.clock)
+  try:
+    rpc = restarter.RPCInterface(supervisord,delay=0.2,timeout=300.0)
+    start = supervisord.clock()
+    result,ticks = supervisord.call(rpc.restartProcessGroup('bench',options))
+    elapsed = supervisord.clock() - start
+  finally:
+    restore()
+  down = len([p for p in group.processes.itervalues()
+                if p.get_state() != ProcessStates.RUNNING])
+  return down,elapsed,result
+
+def main(args=None):
+  if args is None:
+    args = sys.argv[1:]
+  numprocs = 10
+  if args:
+    numprocs = int(args[0])
+  failed = False
+  print '%18s %6s %8s %12s  %s' % ('policy','down','allowed','restart (s)','faults')
+  for name,options,allowed in POLICIES:
+    down,elapsed,result = run(numprocs,options)
+    faults = []
+    if result is not True:
+      faults = [restarter._fault_name(fault['code'])
+                for fault in restarter._fault_dicts(result)]
+    if down > allowed:
+      failed = True
+    print '%18s %6d %8d %12.2f  %s' % (name,down,allowed,elapsed,
+                                       ', '.join(sorted(set(faults))))
+  if failed:
+    print 'a policy took down more processes than it allows'
+    sys.exit(1)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,88 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""bench_restart -- restartProcessGroup timings against a fake supervisord.
+
+Usage: %s [sizes ...]
+
+Restarts groups of 1, 10 and 100 processes (unless other group sizes are
+given) on a virtual clock, with supervisord's main loop polling at most
+once a second as it really does. Processes take 0.05s to stop and 1s to
+start, less than the 2s delay, and three ways of driving the restart are
+compared:
+
+  fixed     use_events=false and min_delay=delay, every tick delay apart
+  adaptive  use_events=false, ticks min_delay apart while processes change
+            phase, backing off towards delay while they don't
+  events    use_events=true, ticks delay apart unless a process state
+            change wakes the restart early
+
+Each reports the simulated time the restart took and how many ticks it
+ran; speedup is fixed over events.
+"""
+import sys
+from supervisor import events
+from supervisor.plugins import restarter
+from fakesupervisord import FakeSupervisord,install_clock
+
+DELAY = 2.0
+STARTSECS = 1.0
+
+# name, use_events and whether min_delay is delay
+MODES = (('fixed',False,True),
+         ('adaptive',False,False),
+         ('events',True,False))
+
+def run(numprocs,use_events,fixed,delay=DELAY,timeout=600.0,stagger_factor=1):
+  events.clear()
+  supervisord = FakeSupervisord(virtual=True,seed=1)
+  supervisord.add_group('bench',numprocs,startsecs=STARTSECS)
+  restore = install_clock(supervisord.clock)
+  try:
+    min_delay = restarter.MIN_DELAY
+    if fixed:
+      min_delay = delay
+    rpc = restarter.RPCInterface(supervisord,delay=delay,min_delay=min_delay,
+                                 timeout=timeout,stagger_factor=stagger_factor,
+                                 use_events=use_events)
+    start = supervisord.clock()
+    result,ticks = supervisord.call(rpc.restartProcessGroup('bench'))
+    elapsed = supervisord.clock() - start
+  finally:
+    restore()
+  if result is not True:
+    raise RuntimeError('restart failed: %r' % (result,))
+  return elapsed,ticks
+
+def main(args=None):
+  if args is None:
+    args = sys.argv[1:]
+  sizes = [int(a) for a in args] or [1,10,100]
+  header = ['%8s' % ('procs',)]
+  for name,use_events,fixed in MODES:
+    header.append('%13s %6s' % (name + ' (s)','ticks'))
+  header.append('%8s' % ('speedup',))
+  print ' '.join(header)
+  for n in sizes:
+    line = ['%8d' % (n,)]
+    times = []
+    for name,use_events,fixed in MODES:
+      elapsed,ticks = run(n,use_events,fixed)
+      times.append(elapsed)
+      line.append('%13.2f %6d' % (elapsed,ticks))
+    line.append('%7.1fx' % (times[0] / times[-1],))
+    print ' '.join(line)
+
+if __name__ == '__main__':
+  main()
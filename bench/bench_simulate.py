@@ -0,0 +1,115 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""bench_simulate -- restartProcessGroup over a matrix of settings on a virtual clock.
+
+Usage: %s [options]
+
+Runs a restart for every combination of group size, delay and
+stagger_factor against a fake supervisord whose clock only moves when its
+main loop sleeps. Reports the simulated restart duration, the wall-clock
+time the plugin's code actually took, ticks and cpu time per tick, so
+changes to the restart loop show up as numbers without real processes.
+"""
+import sys,time
+from optparse import OptionParser
+from supervisor import events
+from supervisor.plugins import restarter
+from fakesupervisord import FakeSupervisord,install_clock
+
+def _floats(value):
+  return [float(v) for v in value.split(',') if v]
+
+def _ints(value):
+  return [int(v) for v in value.split(',') if v]
+
+def make_parser():
+  parser = OptionParser(usage=__doc__.split('\n\n',1)[1].split('\n',1)[0] % 'bench_simulate.py')
+  parser.add_option('--sizes',default='10,100,1000',
+                    help='comma separated group sizes [%default]')
+  parser.add_option('--delays',default='0.05,0.2,1.0',
+                    help='comma separated delay values [%default]')
+  parser.add_option('--staggers',default='1,4',
+                    help='comma separated stagger_factor values [%default]')
+  parser.add_option('--stop-latency',type='float',default=0.05,
+                    help='seconds a process takes to stop [%default]')
+  parser.add_option('--start-latency',type='float',default=0.1,
+                    help='startsecs of every process [%default]')
+  parser.add_option('--backoff-rate',type='float',default=0.0,
+                    help='chance a start ends in BACKOFF [%default]')
+  parser.add_option('--spawn-error-rate',type='float',default=0.0,
+                    help='chance a spawn fails [%default]')
+  parser.add_option('--timeout',type='float',default=600.0,
+                    help='restart timeout in simulated seconds [%default]')
+  parser.add_option('--tick-budget-ops',type='int',default=0,
+                    help='operations allowed per tick, 0 for no limit [%default]')
+  parser.add_option('--seed',type='int',default=1,
+                    help='random seed for failures [%default]')
+  parser.add_option('--no-events',action='store_false',dest='use_events',
+                    default=True,help='poll every delay instead of using events')
+  parser.add_option('--real-clock',action='store_false',dest='virtual',
+                    default=True,help='run in real time')
+  return parser
+
+def run(numprocs,delay,stagger_factor,opts):
+  events.clear()
+  supervisord = FakeSupervisord(virtual=opts.virtual,seed=opts.seed)
+  supervisord.add_group('bench',numprocs,
+                        stop_latency=opts.stop_latency,
+                        startsecs=opts.start_latency,
+                        backoff_rate=opts.backoff_rate,
+                        spawn_error_rate=opts.spawn_error_rate)
+  restore = install_clock(supervisord.clock)
+  try:
+    rpc = restarter.RPCInterface(supervisord,delay=delay,timeout=opts.timeout,
+                                 stagger_factor=stagger_factor,
+                                 use_events=opts.use_events,
+                                 tick_budget_ops=opts.tick_budget_ops)
+    started = supervisord.clock()
+    wall = time.time()
+    result,ticks = supervisord.call(rpc.restartProcessGroup('bench'))
+    wall = time.time() - wall
+    simulated = supervisord.clock() - started
+  finally:
+    restore()
+  faults = 0
+  if result is not True:
+    if isinstance(result,list):
+      faults = len(result)
+    else:
+      faults = 1
+  cpu = rpc.stats.histograms['tick_cpu_seconds']
+  per_tick = 0.0
+  if cpu.count:
+    per_tick = cpu.sum / cpu.count
+  return simulated,wall,ticks,per_tick,faults
+
+def main(args=None):
+  if args is None:
+    args = sys.argv[1:]
+  opts,args = make_parser().parse_args(args)
+  print '%8s %7s %8s %13s %10s %7s %14s %7s' % ('procs','delay','stagger',
+                                               'simulated (s)','wall (s)',
+                                               'ticks','cpu/tick (us)',
+                                               'faults')
+  for numprocs in _ints(opts.sizes):
+    for delay in _floats(opts.delays):
+      for stagger in _ints(opts.staggers):
+        simulated,wall,ticks,per_tick,faults = run(numprocs,delay,stagger,opts)
+        print '%8d %7.2f %8d %13.3f %10.4f %7d %14.1f %7d' % \
+              (numprocs,delay,stagger,simulated,wall,ticks,
+               per_tick * 1e6,faults)
+
+if __name__ == '__main__':
+  main()
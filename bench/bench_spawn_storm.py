@@ -0,0 +1,63 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""bench_spawn_storm -- restart time under cpu contention for various max_starting.
+
+Usage: %s [numprocs [cpus [thrash]]]
+
+Every process needs 0.2s of cpu to start. The fake host has a few cores
+(4 by default) and thrash models how much extra work each process costs once
+more processes are starting than there are cores (0.05 by default). The
+main loop is polled every 20ms, as a supervisord busy with the output of
+many starting processes would be.
+"""
+import sys,time
+from supervisor import events
+from supervisor.plugins import restarter
+from fakesupervisord import FakeSupervisord
+
+def run(numprocs,cpus,thrash,max_starting):
+  events.clear()
+  supervisord = FakeSupervisord(cpus=cpus,thrash=thrash)
+  supervisord.poll_timeout = 0.02
+  supervisord.add_group('bench',numprocs,startsecs=0.2,stop_latency=0.01)
+  rpc = restarter.RPCInterface(supervisord,delay=0.2,timeout=600.0,
+                               stagger_factor=1)
+  start = time.time()
+  result,ticks = supervisord.call(rpc.restartProcessGroup('bench',
+                                  {'max_starting':max_starting}))
+  if result is not True:
+    raise RuntimeError('restart failed: %r' % (result,))
+  return time.time() - start,ticks
+
+def main(args=None):
+  if args is None:
+    args = sys.argv[1:]
+  numprocs = 100
+  cpus = 4
+  thrash = 0.05
+  if args:
+    numprocs = int(args[0])
+  if len(args) > 1:
+    cpus = int(args[1])
+  if len(args) > 2:
+    thrash = float(args[2])
+  print '%d procs, %d cpus, thrash %.2f' % (numprocs,cpus,thrash)
+  print '%14s %12s %8s' % ('max_starting','restart (s)','ticks')
+  for max_starting in (0,cpus,cpus * 2,cpus * 4):
+    elapsed,ticks = run(numprocs,cpus,thrash,max_starting)
+    print '%14s %12.3f %8d' % (max_starting or 'unlimited',elapsed,ticks)
+
+if __name__ == '__main__':
+  main()
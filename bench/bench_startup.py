@@ -0,0 +1,112 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""bench_startup -- startup time and peak memory of the client and plugin.
+
+Usage: %s [runs]
+
+Starts a fresh interpreter 20 times (unless another count is given) for
+each of: doing nothing, importing pkg_resources, importing the plugin and
+running supervisorctl_restart_group against a server which isn't there,
+with and without pkg_resources loaded first as a console_scripts wrapper
+would. Reports the fastest and median wall-clock time and the peak
+resident set size of each.
+
+The plugin import and the client must not load pkg_resources; if either
+does the exit status is 1.
+"""
+import os,sys,time
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                      '..','scripts','supervisorctl_restart_group')
+
+CLIENT = '''import sys
+sys.argv = [%r,'-s','unix:///nonexistent/supervisor.sock','bench']
+try:
+  execfile(sys.argv[0],{'__name__':'__main__'})
+except SystemExit:
+  pass
+''' % (SCRIPT,)
+
+# name, code and whether it must leave pkg_resources alone
+TARGETS = (('python','pass',False),
+           ('pkg_resources','import pkg_resources',False),
+           ('plugin','import supervisor.plugins.restarter',True),
+           ('client',CLIENT,True),
+           ('client+pkg_res','import pkg_resources\n' + CLIENT,False))
+
+CHECK = '''
+print 'pkg_resources' in sys.modules
+'''
+
+def run(code):
+  '''Run code in a fresh interpreter, returns (seconds, peak rss in KB).'''
+  devnull = os.open(os.devnull,os.O_RDWR)
+  start = time.time()
+  pid = os.fork()
+  if pid == 0:
+    os.dup2(devnull,1)
+    os.dup2(devnull,2)
+    os.execv(sys.executable,[sys.executable,'-c',code])
+  pid,status,usage = os.wait4(pid,0)
+  elapsed = time.time() - start
+  os.close(devnull)
+  return elapsed,usage.ru_maxrss
+
+def loads_pkg_resources(code):
+  r,w = os.pipe()
+  pid = os.fork()
+  if pid == 0:
+    os.close(r)
+    os.dup2(w,1)
+    os.dup2(os.open(os.devnull,os.O_RDWR),2)
+    os.execv(sys.executable,[sys.executable,'-c','import sys\n' + code + CHECK])
+  os.close(w)
+  f = os.fdopen(r)
+  try:
+    # the client's own output comes first
+    answer = f.read().strip().split()[-1]
+  finally:
+    f.close()
+  os.waitpid(pid,0)
+  return answer == 'True'
+
+def main(args=None):
+  if args is None:
+    args = sys.argv[1:]
+  runs = 20
+  if args:
+    runs = int(args[0])
+  failed = False
+  print '%16s %12s %12s %10s %14s' % ('target','fastest (ms)','median (ms)','rss (KB)','pkg_resources')
+  for name,code,lean in TARGETS:
+    times = []
+    rss = 0
+    for i in xrange(runs):
+      elapsed,peak = run(code)
+      times.append(elapsed)
+      rss = max(rss,peak)
+    times.sort()
+    loaded = loads_pkg_resources(code)
+    if lean and loaded:
+      failed = True
+    print '%16s %12.1f %12.1f %10d %14s' % (name,times[0] * 1000,
+                                           times[len(times) // 2] * 1000,rss,
+                                           str(loaded).lower())
+  if failed:
+    print 'pkg_resources was loaded by the plugin or the client'
+    sys.exit(1)
+
+if __name__ == '__main__':
+  main()
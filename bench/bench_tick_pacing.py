@@ -0,0 +1,76 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""bench_tick_pacing -- fixed tick delays against adaptive pacing.
+
+Usage: %s [sizes ...]
+
+Restarts groups of 10, 100 and 1000 processes (unless other sizes are given)
+with max_unavailable at 10%. Most processes stop in 50ms and start in
+200ms but one in twenty takes 5 seconds to stop, as a process waiting out
+its stopwaitsecs would, which leaves a long tail with nothing to do. The
+main loop is polled every 5ms, as a supervisord busy with other work would
+be, and runs on a virtual clock so restart times are simulated seconds.
+
+Each size is restarted with a fixed delay of 10ms and of 200ms (min_delay
+equal to delay) and with ticks paced between 10ms and 200ms, first polling
+alone (use_events=false) and then woken by process state events as well.
+The plugin's own cpu time is reported alongside the number of ticks.
+"""
+import sys
+from supervisor import events
+from supervisor.plugins import restarter
+from fakesupervisord import FakeSupervisord,install_clock
+
+MODES = (('fixed 10ms',0.01,0.01),
+         ('fixed 200ms',0.2,0.2),
+         ('paced',0.2,0.01))
+
+def run(numprocs,delay,min_delay,use_events):
+  events.clear()
+  supervisord = FakeSupervisord(virtual=True,seed=1)
+  supervisord.poll_timeout = 0.005
+  group = supervisord.add_group('bench',numprocs,startsecs=0.2,stop_latency=0.05)
+  for i,name in enumerate(sorted(group.processes)):
+    if i % 20 == 19:
+      group.processes[name].config.stop_latency = 5.0
+  restore = install_clock(supervisord.clock)
+  try:
+    rpc = restarter.RPCInterface(supervisord,delay=delay,min_delay=min_delay,
+                                 timeout=3600.0,use_events=use_events)
+    start = supervisord.clock()
+    result,ticks = supervisord.call(rpc.restartProcessGroup('bench',
+                                    {'max_unavailable':'10%'}))
+    elapsed = supervisord.clock() - start
+  finally:
+    restore()
+  if result is not True:
+    raise RuntimeError('restart failed: %r' % (result,))
+  cpu = rpc.getRestartStats()['restarts'][-1]['cpu']
+  return elapsed,ticks,cpu
+
+def main(args=None):
+  if args is None:
+    args = sys.argv[1:]
+  sizes = [int(a) for a in args] or [10,100,1000]
+  for use_events in (False,True):
+    print 'use_events=%s' % (str(use_events).lower(),)
+    print '%8s %12s %12s %8s %10s' % ('procs','mode','restart (s)','ticks','cpu (ms)')
+    for n in sizes:
+      for name,delay,min_delay in MODES:
+        elapsed,ticks,cpu = run(n,delay,min_delay,use_events)
+        print '%8d %12s %12.2f %8d %10.1f' % (n,name,elapsed,ticks,cpu * 1000)
+
+if __name__ == '__main__':
+  main()
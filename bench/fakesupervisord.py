@@ -0,0 +1,420 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""fakesupervisord -- just enough of supervisord to drive the restarter plugin.
+
+Processes change state after configurable latencies and send the same
+PROCESS_STATE events that supervisor.process.Subprocess does. The main loop
+models supervisord.runforever(): deferred rpc callbacks are only polled when
+their http channel is writable and the poller sleeps for up to one second
+unless a child exits (SIGCHLD) or a channel wants to write.
+
+When created with cpus the host is modelled as that many cores shared by all
+STARTING processes: each needs startsecs of cpu time to come up and, once
+there are more of them than cores, thrash adds a proportional overhead for
+context switching and cache misses.
+
+Processes can be made to fail: spawn_error_rate is the chance that a spawn
+fails outright and backoff_rate the chance that a started process exits
+before startsecs. Either puts the process into BACKOFF, from where it is
+respawned after as many seconds as it has failed, and into FATAL after
+startretries failures, as supervisord does. reload_error_rate is the chance
+that a reload signal makes a process exit.
+
+With virtual=True the clock only advances when the main loop sleeps so a
+restart taking minutes of simulated time runs in however long the plugin's
+own code takes. install_clock() points the plugin at the same clock.
+"""
+import time
+import heapq
+import random
+
+from supervisor import events
+from supervisor.states import ProcessStates,SupervisorStates
+from supervisor.http import NOT_DONE_YET
+from supervisor.xmlrpc import RPCError
+from supervisor.plugins import restarter,restarter_probes,restarter_resources,\
+                               restarter_journal
+
+# plugin modules which do "from time import time"
+CLOCK_MODULES = (restarter,restarter_probes,restarter_resources,
+                 restarter_journal)
+
+def install_clock(clock):
+  '''Make the plugin use clock instead of time.time(). Returns a function
+  which puts the real clock back.
+  '''
+  saved = [(module,module.time) for module in CLOCK_MODULES]
+  for module in CLOCK_MODULES:
+    module.time = clock
+  def restore():
+    for module,value in saved:
+      module.time = value
+  return restore
+
+class ProcessConfig(object):
+  def __init__(self,name,priority=999,stop_latency=0.05,startsecs=0.1,
+                    backoff_rate=0.0,spawn_error_rate=0.0,startretries=3,
+                    reload_error_rate=0.0,autostart=True):
+    super(ProcessConfig,self).__init__()
+    self.name = name
+    self.priority = priority
+    self.stop_latency = stop_latency
+    self.startsecs = startsecs
+    self.backoff_rate = backoff_rate
+    self.spawn_error_rate = spawn_error_rate
+    self.startretries = startretries
+    self.reload_error_rate = reload_error_rate
+    self.autostart = autostart
+
+  def __eq__(self,other):
+    return self.__class__ is other.__class__ and self.__dict__ == other.__dict__
+
+  def __ne__(self,other):
+    return not self == other
+
+  def create_autochildlogs(self):
+    pass
+
+  def make_process(self,group=None):
+    p = FakeProcess(group.supervisord,self,group)
+    p.state = ProcessStates.STOPPED
+    return p
+
+class FakeProcess(object):
+  event_map = {
+    ProcessStates.BACKOFF: events.ProcessStateBackoffEvent,
+    ProcessStates.FATAL: events.ProcessStateFatalEvent,
+    ProcessStates.UNKNOWN: events.ProcessStateUnknownEvent,
+    ProcessStates.STOPPED: events.ProcessStateStoppedEvent,
+    ProcessStates.EXITED: events.ProcessStateExitedEvent,
+    ProcessStates.RUNNING: events.ProcessStateRunningEvent,
+    ProcessStates.STARTING: events.ProcessStateStartingEvent,
+    ProcessStates.STOPPING: events.ProcessStateStoppingEvent,
+  }
+
+  def __init__(self,supervisord,config,group=None):
+    super(FakeProcess,self).__init__()
+    self.supervisord = supervisord
+    self.config = config
+    self.group = group
+    self.state = ProcessStates.RUNNING
+    self.pid = 0
+    self.backoff = 0
+    self.spawnerr = None
+    self.laststart = 0
+    self.progress = 0.0
+    self.retry_at = None
+    self.signals = []
+
+  def get_state(self):
+    return self.state
+
+  def change_state(self,new_state,expected=True):
+    old_state = self.state
+    if new_state == old_state:
+      return False
+    event_class = self.event_map.get(new_state)
+    if event_class is not None:
+      events.notify(event_class(self,old_state,expected))
+    self.state = new_state
+
+  def spawn(self):
+    self.spawnerr = None
+    self.laststart = self.supervisord.clock()
+    self.progress = 0.0
+    self.retry_at = None
+    self.change_state(ProcessStates.STARTING)
+    if self.supervisord.chance(self.config.spawn_error_rate):
+      self.spawnerr = 'simulated spawn error'
+      self.fail()
+      return None
+    self.pid = self.supervisord.next_pid()
+    return self.pid
+
+  def fail(self):
+    '''Exited too quickly or could not be spawned.'''
+    self.pid = 0
+    self.backoff += 1
+    self.change_state(ProcessStates.BACKOFF)
+    self.retry_at = self.supervisord.clock() + self.backoff
+
+  def signal(self,sig):
+    '''A reload signal, which kills the process with reload_error_rate.'''
+    if self.state not in (ProcessStates.RUNNING,ProcessStates.STARTING):
+      return 'not running'
+    self.signals.append(sig)
+    if self.supervisord.chance(self.config.reload_error_rate):
+      self.pid = 0
+      self.change_state(ProcessStates.EXITED,expected=False)
+
+  def stop(self):
+    if self.state == ProcessStates.BACKOFF:
+      self.retry_at = None
+      self.change_state(ProcessStates.STOPPED)
+      return None
+    if self.state not in (ProcessStates.RUNNING,ProcessStates.STARTING):
+      return 'not running'
+    self.change_state(ProcessStates.STOPPING)
+    self.supervisord.schedule_exit(self.config.stop_latency,self)
+
+  def finish(self):
+    self.pid = 0
+    self.change_state(ProcessStates.STOPPED)
+
+  def transition(self):
+    if self.state == ProcessStates.STARTING:
+      if self.supervisord.cpus:
+        up = self.progress >= self.config.startsecs
+      else:
+        up = self.supervisord.clock() - self.laststart >= self.config.startsecs
+      if up:
+        if self.supervisord.chance(self.config.backoff_rate):
+          self.fail()
+        else:
+          self.backoff = 0
+          self.change_state(ProcessStates.RUNNING)
+    elif self.state == ProcessStates.BACKOFF and self.retry_at is not None:
+      if self.backoff > self.config.startretries:
+        self.retry_at = None
+        self.change_state(ProcessStates.FATAL)
+      elif self.supervisord.clock() >= self.retry_at:
+        self.spawn()
+
+class ProcessGroupConfig(object):
+  def __init__(self,name,process_configs=()):
+    super(ProcessGroupConfig,self).__init__()
+    self.name = name
+    self.process_configs = list(process_configs)
+
+class FakeProcessGroup(object):
+  def __init__(self,supervisord,name):
+    super(FakeProcessGroup,self).__init__()
+    self.supervisord = supervisord
+    self.config = ProcessGroupConfig(name)
+    self.processes = {}
+
+  def get_unstopped_processes(self):
+    return [p for p in self.processes.itervalues()
+              if p.get_state() not in (ProcessStates.STOPPED,
+                                       ProcessStates.EXITED,
+                                       ProcessStates.FATAL,
+                                       ProcessStates.BACKOFF)]
+
+  def transition(self):
+    for p in self.processes.itervalues():
+      p.transition()
+
+class FakeOptions(object):
+  def __init__(self):
+    super(FakeOptions,self).__init__()
+    self.mood = SupervisorStates.RUNNING
+    self.socket_map = {}
+
+  def get_socket_map(self):
+    return self.socket_map
+
+class FakeChannel(object):
+  '''Mimics supervisor.http.deferring_http_channel.'''
+  def __init__(self,producer,clock=time.time):
+    super(FakeChannel,self).__init__()
+    self.clock = clock
+    self.producer_fifo = FakeFifo([producer])
+    self.connected = True
+    self.delay = 0
+    self.last_writable_check = 0
+    self.result = None
+    self.done = False
+
+  def writable(self,now=None):
+    if self.done:
+      return False
+    if now is None:
+      now = self.clock()
+    if self.delay:
+      elapsed = now - self.last_writable_check
+      if (elapsed > self.delay) or (elapsed < 0):
+        self.last_writable_check = now
+        return True
+      return False
+    return True
+
+  def refill_buffer(self):
+    p = self.producer_fifo.first()
+    data = p.more()
+    if data is NOT_DONE_YET:
+      self.delay = p.delay
+      return
+    self.result = data
+    self.done = True
+    self.connected = False
+
+  def handle_write_event(self):
+    self.refill_buffer()
+
+class FakeFifo(object):
+  def __init__(self,items):
+    super(FakeFifo,self).__init__()
+    self.list = items
+
+  def __len__(self):
+    return len(self.list)
+
+  def first(self):
+    return self.list[0]
+
+class DeferredResponse(object):
+  '''Mimics supervisor.xmlrpc.DeferredXMLRPCResponse.'''
+  def __init__(self,callback):
+    super(DeferredResponse,self).__init__()
+    self.callback = callback
+    self.delay = float(callback.delay)
+    self.calls = 0
+
+  def more(self):
+    self.calls += 1
+    try:
+      return self.callback()
+    except RPCError, e:
+      return e
+
+class FakeSupervisord(object):
+  poll_timeout = 1.0
+
+  def __init__(self,cpus=0,thrash=0.0,virtual=False,seed=None):
+    super(FakeSupervisord,self).__init__()
+    self.options = FakeOptions()
+    self.process_groups = {}
+    self.cpus = cpus
+    self.thrash = thrash
+    self.virtual = virtual
+    self.random = random.Random(seed)
+    self._now = time.time()
+    self._pid = 1000
+    self._exits = []
+    self._last_advance = None
+
+  def clock(self):
+    if self.virtual:
+      return self._now
+    return time.time()
+
+  def sleep(self,seconds):
+    if self.virtual:
+      self._now += seconds
+    else:
+      time.sleep(seconds)
+
+  def chance(self,rate):
+    return rate > 0 and self.random.random() < rate
+
+  def next_pid(self):
+    self._pid += 1
+    return self._pid
+
+  def add_group(self,name,numprocs,spares=0,**kw):
+    '''Add a group of numprocs RUNNING processes followed by spares
+    STOPPED autostart=false ones.
+    '''
+    group = FakeProcessGroup(self,name)
+    for i in xrange(numprocs + spares):
+      spare = i >= numprocs
+      config = ProcessConfig('%s_%03d' % (name,i),autostart=not spare,**kw)
+      p = FakeProcess(self,config,group)
+      if spare:
+        p.state = ProcessStates.STOPPED
+      else:
+        p.pid = self.next_pid()
+      group.processes[config.name] = p
+      group.config.process_configs.append(config)
+    self.process_groups[name] = group
+    return group
+
+  def schedule_exit(self,delay,process):
+    heapq.heappush(self._exits,(self.clock() + delay,process.config.name,process))
+
+  def reap(self):
+    now = self.clock()
+    while self._exits and self._exits[0][0] <= now:
+      p = heapq.heappop(self._exits)[2]
+      p.finish()
+
+  def advance_starting(self):
+    '''Share the modelled cpus between STARTING processes.'''
+    now = self.clock()
+    last,self._last_advance = self._last_advance,now
+    if not self.cpus or last is None:
+      return
+    starting = [p for g in self.process_groups.itervalues()
+                  for p in g.processes.itervalues()
+                  if p.state == ProcessStates.STARTING]
+    n = len(starting)
+    if not n:
+      return
+    rate = min(1.0,float(self.cpus) / n)
+    if n > self.cpus:
+      rate /= 1.0 + self.thrash * (n - self.cpus) / float(self.cpus)
+    step = (now - last) * rate
+    for p in starting:
+      p.progress += step
+
+  def loop_once(self):
+    '''One iteration of supervisord.runforever().'''
+    now = self.clock()
+    timeout = self.poll_timeout
+    for dispatcher in self.options.socket_map.values():
+      if dispatcher.writable():
+        dispatcher.handle_write_event()
+        timeout = 0
+    if timeout and self._exits:
+      # SIGCHLD interrupts the poller
+      timeout = max(0,min(timeout,self._exits[0][0] - now))
+    if timeout:
+      self.sleep(timeout)
+    self.advance_starting()
+    for group in self.process_groups.values():
+      group.transition()
+    self.reap()
+
+  def run_until(self,predicate):
+    while not predicate():
+      self.loop_once()
+
+  def defer(self,callback):
+    '''Start serving a deferred rpc callback, returns its channel.'''
+    channel = FakeChannel(DeferredResponse(callback),self.clock)
+    self.options.socket_map[id(channel)] = channel
+    return channel
+
+  def hangup(self,channel):
+    '''The client of a deferred rpc callback goes away.'''
+    self.options.socket_map.pop(id(channel),None)
+
+  def call_many(self,callbacks):
+    '''Run several deferred rpc callbacks side by side until they are all
+    done. Returns a (result,ticks) pair for each.
+    '''
+    channels = [self.defer(callback) for callback in callbacks]
+    try:
+      self.run_until(lambda: not [c for c in channels if not c.done])
+    finally:
+      for channel in channels:
+        self.hangup(channel)
+    return [(c.result,c.producer_fifo.first().calls) for c in channels]
+
+  def call(self,callback):
+    '''Run a deferred rpc callback to completion through the fake main
+    loop. Returns (result,ticks).
+    '''
+    return self.call_many([callback])[0]
@@ -44,7 +44,5 @@ numbers of processes VERY slow.
         namespace_packages=['supervisor','supervisor.plugins'],
         install_requires=requires,
         zip_safe=False,
-        entry_points={
-          'console_scripts': ['supervisorctl_restart_group = supervisor.plugins.supervisorctl_restart_group:main'],
-        }
+        scripts=['scripts/supervisorctl_restart_group'],
       )
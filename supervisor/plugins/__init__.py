@@ -1 +1,8 @@
-__import__('pkg_resources').declare_namespace(__name__)
\ No newline at end of file
+# importing pkg_resources takes longer than loading the client or the plugin,
+# so it only declares the namespace if something has imported it already
+_pkg_resources = __import__('sys').modules.get('pkg_resources')
+if _pkg_resources is not None:
+  _pkg_resources.declare_namespace(__name__)
+else:
+  __path__ = __import__('pkgutil').extend_path(__path__,__name__)
+del _pkg_resources
@@ -12,23 +12,217 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from time import time
-import pkg_resources
-pkg_resources.require('supervisor >= 3.0a')
+import os
+import re
+import copy
+import math
+import fnmatch
+from time import time,clock
 
-from supervisor import xmlrpc
+from supervisor import xmlrpc,events
 from supervisor.xmlrpc import Faults
 from supervisor.states import RUNNING_STATES,STOPPED_STATES,\
                               ProcessStates,SupervisorStates,\
                               getProcessStateDescription
 from supervisor.http import NOT_DONE_YET
-from weakref import WeakValueDictionary
+from supervisor.datatypes import boolean,byte_size,signal_number
+from supervisor.medusa import asyncore_25 as asyncore
+from supervisor.plugins.restarter_probes import ProbeSpec,process_num
+from supervisor.plugins.restarter_stats import RestartStats
+from supervisor.plugins.restarter_resources import ProcSampler,ResourceLimits
+from supervisor.plugins.restarter_journal import RestartJournal,estimate,round_seconds
+from collections import deque
+from weakref import ref
 
 API_VERSION = '3.0'
 STARTING = ProcessStates.STARTING
 STOPPING = ProcessStates.STOPPING
 BACKOFF = ProcessStates.BACKOFF
 
+# process state events which can let a restart make progress; STARTING and
+# STOPPING are only ever caused by the restarter itself so they are ignored.
+WAKE_EVENTS = (events.ProcessStateStoppedEvent,
+               events.ProcessStateExitedEvent,
+               events.ProcessStateRunningEvent,
+               events.ProcessStateBackoffEvent,
+               events.ProcessStateFatalEvent,
+               events.ProcessStateUnknownEvent)
+
+def _count_or_percent(value):
+  '''Validate a process count which may also be given as a percentage of
+  the group size, eg "25%".
+  '''
+  if isinstance(value,basestring):
+    value = value.strip()
+    if value.endswith('%'):
+      percent = float(value[:-1])
+      if percent < 0 or percent > 100:
+        raise ValueError('percentage out of range: %r' % (value,))
+      return value
+  value = int(value)
+  if value < 0:
+    raise ValueError('negative count: %r' % (value,))
+  return value
+
+def _resolve_count(value,total):
+  '''Turn the result of _count_or_percent() into a process count.'''
+  if isinstance(value,basestring):
+    percent = float(value[:-1])
+    if percent <= 0:
+      return 0
+    return max(int(math.ceil(total * percent / 100.0)),1)
+  return value
+
+def _byte_size(value):
+  return byte_size(str(value).strip())
+
+def _globs(value):
+  '''Split a comma or whitespace separated list of globs.'''
+  if isinstance(value,basestring):
+    value = value.replace(',',' ').split()
+  return [str(glob) for glob in value]
+
+def _signal(value):
+  '''Parse a signal name or number, an empty value means a real restart.'''
+  if isinstance(value,basestring) and not value.strip():
+    return None
+  return signal_number(value)
+
+def _flag(value):
+  if isinstance(value,bool):
+    return value
+  return boolean(str(value))
+
+def _dependencies(config):
+  '''Parse the depends.<group> options into a map of group names to the
+  groups they depend on, refusing cycles.
+  '''
+  depends = {}
+  for key,value in config.items():
+    if key.startswith('depends.'):
+      depends[key.split('.',1)[1]] = _globs(value)
+  visiting = set()
+  done = set()
+  def visit(name,path):
+    if name in done:
+      return
+    if name in visiting:
+      raise ValueError('restarter: dependency cycle %s' % ' -> '.join(path + [name]))
+    visiting.add(name)
+    for prerequisite in depends.get(name,()):
+      visit(prerequisite,path + [name])
+    visiting.discard(name)
+    done.add(name)
+  for name in depends.keys():
+    visit(name,[])
+  return depends
+
+def _configured_group(name,groups):
+  '''Return the group in groups which name refers to, or None.
+  ConfigParser lower cases option names so a group with capitals in its
+  name can only be named in lower case.
+  '''
+  if name in groups:
+    return name
+  for group in sorted(groups):
+    if group.lower() == name:
+      return group
+  return None
+
+def _schedules(config,options,groups=None):
+  '''Parse the schedule.<group> options into RestartSchedules, in group
+  order. groups, if given, are the names of the configured groups and a
+  schedule for any other group is an error.
+  '''
+  schedules = []
+  for key,value in sorted(config.items()):
+    if key.startswith('schedule.'):
+      from supervisor.plugins.restarter_schedule import parse_schedule
+      group = key.split('.',1)[1]
+      if groups is not None:
+        name = _configured_group(group,groups)
+        if name is None:
+          raise ValueError('restarter: schedule for unknown group %s' % (group,))
+        group = name
+      try:
+        schedules.append(parse_schedule(group,value,options))
+      except ValueError, e:
+        raise ValueError('restarter: bad schedule for %s: %s' % (group,e))
+  return schedules
+
+def _probe_spec(value):
+  '''Parse a readiness probe spec, an empty spec disables probing.'''
+  value = value.strip()
+  if not value:
+    return False
+  return ProbeSpec(value)
+
+def _fault_dicts(errs):
+  faults = []
+  for e in errs:
+    if isinstance(e,dict):
+      faults.append(e)
+    else:
+      faults.append({'code':e.code,'text':e.text})
+  return faults
+
+def _fault_name(code):
+  name = RestarterFaults._codes.get(code)
+  if name is None:
+    name = xmlrpc.getFaultDescription(code)
+  return name
+
+_NUM_RANGE = re.compile(r'^(\d+)(?:-(\d+))?$')
+
+def _selector(value):
+  '''Validate a process selector: a list of process names, fnmatch globs
+  and process_num ranges such as "0-19".
+  '''
+  if isinstance(value,(basestring,int,long)):
+    value = [value]
+  items = [str(item).strip() for item in value]
+  if not items or '' in items:
+    raise ValueError('empty process selector')
+  for item in items:
+    m = _NUM_RANGE.match(item)
+    if m and m.group(2) and int(m.group(2)) < int(m.group(1)):
+      raise ValueError('backwards range %r' % (item,))
+  return items
+
+def _select_processes(group,selector):
+  '''Return the set of names of the processes in group matched by
+  selector. Exact names win over process_num ranges, every item must
+  match at least one process.
+  '''
+  names = group.processes.keys()
+  numbers = None
+  selected = set()
+  for item in selector:
+    m = _NUM_RANGE.match(item)
+    if item in group.processes:
+      matched = [item]
+    elif m:
+      if numbers is None:
+        numbers = [(process_num(name),name) for name in names]
+      low = int(m.group(1))
+      high = int(m.group(2) or low)
+      matched = [name for num,name in numbers
+                 if num is not None and low <= num <= high]
+    else:
+      matched = fnmatch.filter(names,item)
+    if not matched:
+      raise RPCError(Faults.BAD_NAME,'%s:%s' % (group.config.name,item))
+    selected.update(matched)
+  return selected
+
+FAULT_MODES = ('list','summary')
+
+def _fault_mode(value):
+  value = str(value).strip().lower()
+  if value not in FAULT_MODES:
+    raise ValueError('unknown fault reporting mode %r' % (value,))
+  return value
+
 def _get_state_desc(state):
   desc = getProcessStateDescription(state)
   if desc:
@@ -62,12 +256,288 @@ class Timer(object):
     self._counter += value
     return self._counter
 
+  def get_counter(self):
+    return self._counter
+
+class RestartPhases(object):
+  PENDING_STOP = 0
+  STOPPING = 10
+  SETTLING = 15
+  PENDING_START = 20
+  STARTING = 30
+  PROBING = 40
+  DONE = 100
+  FAILED = 200
+  CANCELLED = 250
+  REMOVED = 300
+
+RestartPhases._names = dict((getattr(RestartPhases,a),a.lower())
+                            for a in dir(RestartPhases) if a.isupper())
+ACTIVE_PHASES = (RestartPhases.PENDING_STOP,RestartPhases.STOPPING,
+                 RestartPhases.SETTLING,RestartPhases.PENDING_START,
+                 RestartPhases.STARTING,RestartPhases.PROBING)
+TRANSIT_PHASES = (RestartPhases.STOPPING,RestartPhases.STARTING)
+START_PHASES = TRANSIT_PHASES + (RestartPhases.PENDING_START,)
+# phases in which a process state change needs looking at
+WATCHED_PHASES = TRANSIT_PHASES + (RestartPhases.SETTLING,)
+
+# a restart which hasn't been ticked for this long (or twice its delay, if
+# that is longer) is assumed to have lost whoever was driving it
+STALL_SECONDS = 2.0
+
+# how often processes are checked against stop_timeout and start_timeout
+PHASE_CHECK_SECONDS = 1.0
+
+# default shortest delay between ticks while processes are changing phase,
+# and how much longer each tick which finds nothing changed waits
+MIN_DELAY = 0.01
+DELAY_BACKOFF = 1.5
+# a tick meant to come when a stagger wave is due may come a little early
+WAVE_SLACK = MIN_DELAY
+
+COALESCE_MODES = ('attach','queue')
+
+SURGE_POLICIES = ('park','keep')
+
+def _surge_policy(value):
+  value = str(value).strip().lower()
+  if value not in SURGE_POLICIES:
+    raise ValueError('unknown surge policy %r' % (value,))
+  return value
+
+def _coalesce_mode(value):
+  value = str(value).strip().lower()
+  if value not in COALESCE_MODES:
+    raise ValueError('unknown coalesce mode %r' % (value,))
+  return value
+
+# how long a process took in each phase, as (summary key, phase left,
+# phases entered) for each timed transition.
+TIMED_PHASES = (('stop',RestartPhases.STOPPING,None),
+                ('start',RestartPhases.STARTING,
+                 (RestartPhases.PROBING,RestartPhases.DONE)),
+                ('settle',RestartPhases.SETTLING,
+                 (RestartPhases.PROBING,RestartPhases.DONE)),
+                ('ready',RestartPhases.PROBING,(RestartPhases.DONE,)))
+
+TIMED_KEYS = ('stop','spawn','start','settle','ready')
+
+class ProcRecord(object):
+  '''Per-process restart bookkeeping. stamp is when the current phase was
+  entered, the *_time slots hold how long the process took to stop, spawn,
+  start, settle after a reload signal and pass its readiness probe. pid is
+  the pid a reload signal was sent to.
+  '''
+  __slots__ = ('name','order','priority','phase','ref','probe','stamp','pid',
+               'stop_time','spawn_time','start_time','settle_time',
+               'ready_time')
+
+  def __init__(self,process,order,phase):
+    super(ProcRecord,self).__init__()
+    self.name = process.config.name
+    self.order = order
+    self.priority = getattr(process.config,'priority',999)
+    self.phase = phase
+    self.ref = ref(process)
+    self.probe = None
+    self.stamp = None
+    self.pid = None
+    self.stop_time = None
+    self.spawn_time = None
+    self.start_time = None
+    self.settle_time = None
+    self.ready_time = None
+
+  def timings(self):
+    d = {}
+    for key in TIMED_KEYS:
+      value = getattr(self,key + '_time')
+      if value is not None:
+        d[key] = value
+    return d
+
+  def durations(self):
+    '''Return the seconds the process took to stop and to come back (from
+    spawning until RUNNING and ready, or settled after a reload), either of
+    which is None if it was not seen.
+    '''
+    start = None
+    for value in (self.spawn_time,self.start_time,self.settle_time,self.ready_time):
+      if value is not None:
+        start = (start or 0.0) + value
+    return self.stop_time,start
+
+  def __repr__(self):
+    return '<ProcRecord %s %s>' % (self.name,RestartPhases._names.get(self.phase))
+
+def _find_deferred_channel(socket_map,callback):
+  '''Locate the http channel which is currently deferring on callback.'''
+  for dispatcher in socket_map.values():
+    fifo = getattr(dispatcher,'producer_fifo',None)
+    if not fifo:
+      continue
+    try:
+      producer = fifo.first()
+    except (AttributeError,IndexError):
+      continue
+    if getattr(producer,'callback',None) is callback:
+      return dispatcher
+  return None
+
+class Waker(object):
+  '''Forces supervisord to run a deferred rpc callback on its next loop
+  iteration rather than waiting out the remainder of the callback's delay.
+  '''
+  __slots__ = ('socket_map','callback','channel','abandon')
+
+  def __init__(self,socket_map,callback,abandon=None):
+    super(Waker,self).__init__()
+    self.socket_map = socket_map
+    self.callback = callback
+    self.channel = None
+    self.abandon = abandon
+
+  def wake(self):
+    if self.callback is None:
+      return
+    channel = self.channel
+    if channel is None or not getattr(channel,'connected',True):
+      channel = self.channel = _find_deferred_channel(self.socket_map,self.callback)
+    if channel is not None:
+      # deferring_http_channel.writable() only polls the producer once
+      # delay seconds have passed since the last check.
+      channel.last_writable_check = 0
+    elif self.abandon is not None:
+      # the client has gone away, nothing will ever call us again
+      self.abandon()
+
+  def release(self):
+    self.channel = None
+    self.callback = None
+    self.abandon = None
+
+class TickPacer(object):
+  '''Adapts the delay between ticks of a restart to how it is going. The
+  delay drops to floor whenever a tick finds processes have changed phase
+  and grows by DELAY_BACKOFF, up to ceiling, after each tick which finds nothing
+  changed.
+  '''
+  __slots__ = ('floor','ceiling','delay','moves','producer')
+
+  def __init__(self,ceiling,floor=MIN_DELAY):
+    super(TickPacer,self).__init__()
+    self.ceiling = ceiling
+    self.floor = min(floor,ceiling)
+    self.delay = self.floor
+    self.moves = None
+    self.producer = None
+
+  def pace(self,moves,wait=None):
+    '''Return the delay before the next tick, given the number of phase
+    changes made so far or None to wait the full ceiling. wait, if given,
+    is how soon something is due and caps the delay.
+    '''
+    if moves is None:
+      self.delay = self.ceiling
+    elif moves != self.moves:
+      self.delay = self.floor
+    else:
+      self.delay = min(self.delay * DELAY_BACKOFF,self.ceiling)
+    self.moves = moves
+    if wait is not None and wait < self.delay:
+      self.delay = max(wait,MIN_DELAY)
+    return self.delay
+
+  def apply(self,socket_map,callback):
+    '''Make supervisord wait the current delay before calling callback
+    again. The deferred response takes the callback's delay when it is
+    created and its channel takes the response's after each call, so it
+    is the response's which is changed.
+    '''
+    callback.delay = self.delay
+    producer = self.producer
+    if producer is None:
+      channel = _find_deferred_channel(socket_map,callback)
+      if channel is None:
+        return
+      producer = self.producer = channel.producer_fifo.first()
+    producer.delay = self.delay
+
+class TickDriver(asyncore.file_dispatcher):
+  '''Runs restart jobs from supervisord's main loop when no http request
+  is around to poll them.
+
+  The write end of a pipe is always writable so returning True from
+  writable() gets handle_write() called on the next loop iteration, exactly
+  like supervisor.http.deferring_http_channel does for deferred callbacks.
+  '''
+  def __init__(self,socket_map,logger=None):
+    self.jobs = []
+    self.current = None
+    self.logger = logger
+    self.closed = False
+    self._rfd,wfd = os.pipe()
+    asyncore.file_dispatcher.__init__(self,wfd,map=socket_map)
+
+  def add(self,job):
+    self.jobs.append(job)
+
+  def readable(self):
+    return False
+
+  def writable(self):
+    if not self.jobs:
+      self.close()
+      return False
+    now = time()
+    for job in self.jobs:
+      if job.due(now):
+        return True
+    return False
+
+  def handle_write(self):
+    now = time()
+    for job in self.jobs[:]:
+      # remembered so handle_error() knows which job broke
+      self.current = job
+      if job.due(now):
+        if job.tick(now):
+          self.jobs.remove(job)
+    self.current = None
+
+  def handle_error(self):
+    # never let a broken job take out supervisord's main loop, or the
+    # jobs and timers which had nothing to do with it
+    if self.logger is not None:
+      import traceback
+      self.logger.critical('restarter: uncaptured python exception in restart job\n%s' % \
+                           traceback.format_exc())
+    job,self.current = self.current,None
+    if job is None or job not in self.jobs:
+      return
+    self.jobs.remove(job)
+    if job.running():
+      job.abort(RPCError(Faults.FAILED,'restart job raised an exception'))
+
+  def close(self):
+    self.jobs = []
+    self.closed = True
+    if self._rfd is not None:
+      os.close(self._rfd)
+      self._rfd = None
+    asyncore.file_dispatcher.close(self)
+
 class RestarterFaults(object):
   BAD_GROUP = 0x400
   BAD_STATE = 0x410
   TIMEOUT = 0x420
   START_FAILED = 0x430
   STOP_FAILED = 0x431
+  NOT_READY = 0x432
+  CANARY_FAILED = 0x433
+  BAD_JOB = 0x440
+  BAD_REPORT = 0x441
+  CANCELLED = 0x450
 
 RestarterFaults._codes = dict((getattr(RestarterFaults,a),a)
                               for a in dir(RestarterFaults) if a.isupper())
@@ -84,15 +554,1984 @@ class RPCError(xmlrpc.RPCError):
     else:
       xmlrpc.RPCError.__init__(self,code,extra)
 
+class ConcurrencyBudget(object):
+  '''A limit on how many processes may be unavailable across several
+  restarts which are running at the same time.
+  '''
+  def __init__(self,limit=0):
+    super(ConcurrencyBudget,self).__init__()
+    self.limit = limit
+    self.restarts = []
+
+  def add(self,restart):
+    self.restarts.append(restart)
+
+  def remove(self,restart):
+    if restart in self.restarts:
+      self.restarts.remove(restart)
+
+  def room(self):
+    if not self.limit:
+      return None
+    return max(self.limit - sum(r.unavailable() for r in self.restarts),0)
+
+def _cpu_count():
+  try:
+    return max(int(os.sysconf('SC_NPROCESSORS_ONLN')),1)
+  except (AttributeError,ValueError,OSError):
+    return 1
+
+def _cpu_pressure(path='/proc/pressure/cpu'):
+  '''Return the kernel's 10 second "some" cpu pressure percentage, or None
+  if the kernel doesn't provide pressure stall information.
+  '''
+  try:
+    f = open(path,'r')
+    try:
+      line = f.readline()
+    finally:
+      f.close()
+  except IOError:
+    return None
+  for field in line.split():
+    if field.startswith('avg10='):
+      return float(field[6:])
+  return None
+
+class SpawnThrottle(object):
+  '''Limits how many processes the restarts sharing it may have starting at
+  the same time. With max_load (1 minute load average per cpu) or
+  max_cpu_pressure (percent) set, only one process at a time may be starting
+  while the host is above either threshold.
+  '''
+  sample_interval = 1.0
+
+  def __init__(self,max_starting=0,max_load=0.0,max_cpu_pressure=0.0):
+    super(SpawnThrottle,self).__init__()
+    self.max_starting = max_starting
+    self.max_load = max_load
+    self.max_cpu_pressure = max_cpu_pressure
+    self.restarts = []
+    self._overloaded = False
+    self._sampled = None
+    self._ncpu = _cpu_count()
+
+  def add(self,restart):
+    self.restarts.append(restart)
+
+  def remove(self,restart):
+    if restart in self.restarts:
+      self.restarts.remove(restart)
+
+  def starting(self):
+    return sum(len(r.buckets[RestartPhases.STARTING]) for r in self.restarts)
+
+  def overloaded(self,now):
+    if not (self.max_load or self.max_cpu_pressure):
+      return False
+    if self._sampled is None or now - self._sampled >= self.sample_interval:
+      self._sampled = now
+      overloaded = False
+      if self.max_load:
+        try:
+          overloaded = os.getloadavg()[0] / self._ncpu > self.max_load
+        except (AttributeError,OSError):
+          pass
+      if not overloaded and self.max_cpu_pressure:
+        pressure = _cpu_pressure()
+        overloaded = pressure is not None and pressure > self.max_cpu_pressure
+      self._overloaded = overloaded
+    return self._overloaded
+
+  def room(self,now):
+    limit = self.max_starting
+    if self.overloaded(now):
+      limit = 1
+    if not limit:
+      return None
+    return max(limit - self.starting(),0)
+
+class TickBudget(object):
+  '''Bounds the work done in one restart tick, in milliseconds of wall clock
+  time and/or operations (process checks, spawns and stops). At least one
+  operation is always allowed so every tick makes progress. Ticks taking
+  longer than slow_ms are logged.
+  '''
+  __slots__ = ('ms','ops','slow_ms','logger','started','deadline','used')
+
+  def __init__(self,ms=0,ops=0,slow_ms=0,logger=None):
+    super(TickBudget,self).__init__()
+    self.ms = ms or 0
+    self.ops = ops or 0
+    self.slow_ms = slow_ms or 0
+    self.logger = logger
+    self.started = 0
+    self.deadline = None
+    self.used = 0
+
+  def limited(self):
+    return bool(self.ms or self.ops)
+
+  def start(self):
+    self.started = time()
+    if self.ms:
+      self.deadline = self.started + self.ms / 1000.0
+    self.used = 0
+
+  def spend(self):
+    self.used += 1
+
+  def exhausted(self):
+    if not self.used:
+      return False
+    if self.ops and self.used >= self.ops:
+      return True
+    return self.deadline is not None and time() >= self.deadline
+
+  def done(self,what,pending):
+    '''Log the tick if it was slow.'''
+    if self.slow_ms and self.logger is not None:
+      elapsed = (time() - self.started) * 1000.0
+      if elapsed >= self.slow_ms:
+        self.logger.warn('restarter: slow tick restarting %s: %.1fms, '
+                         '%d operations, %d procs pending' % \
+                         (what,elapsed,self.used,pending))
+
+class GroupRestart(object):
+  '''State machine for restarting one process group, see the README for
+  what each restart option does.
+
+  Each process is tracked by a ProcRecord which lives in exactly one phase
+  bucket, and a round only looks at the buckets whose members can change
+  phase. Whoever starts a restart drives it by calling it, other requests
+  for the same group follow it with poll().
+  '''
+  # number of processes listed in the summary's slowest
+  slowest = 5
+
+  def __init__(self,group,stagger_factor=1,timeout=5.0,
+                     batch_size=0,max_unavailable=0,
+                     readiness=None,readiness_timeout=30.0,
+                     readiness_interval=0.5,socket_map=None,
+                     budget=None,max_starting=0,throttle=None,
+                     stats=None,tick_budget=None,only=None,configs=None,
+                     signal=None,settle=1.0,surge=0,surge_policy='park',
+                     stop_timeout=0.0,start_timeout=0.0,idle_timeout=0.0,
+                     timeout_per_process=0.0,by_priority=False,canary=0,
+                     canary_soak=0.0):
+    super(GroupRestart,self).__init__()
+    self.name = group.config.name
+    self.timeout = timeout or 0
+    self.stop_timeout = stop_timeout
+    self.start_timeout = start_timeout
+    self.idle_timeout = idle_timeout
+    self.last_progress = None
+    # phase changes so far, for pacing ticks
+    self.moves = 0
+    self.next_phase_check = 0
+    self.timer = Timer()
+    self.errs = list()
+    self.records = {}
+    self.buckets = dict((phase,set()) for phase in RestartPhases._names)
+    self.dirty = set()
+    self.waker = None
+    self.watcher = None
+    self.in_tick = False
+    self.cancelled = False
+    self.timed_out = False
+    self.result = None
+    self.cpu_time = 0.0
+    self.stats = stats
+    # where a record of the restart goes when it is done, and what it says
+    # asked for it
+    self.journal = None
+    self.method = None
+    self.trigger = ''
+    self.selector = None
+    if tick_budget is None:
+      tick_budget = TickBudget()
+    self.tick_budget = tick_budget
+    self.yielded = False
+    self.final = None
+    self.last_tick = time()
+    self.stall_after = STALL_SECONDS
+    self.waiters = []
+    self.on_finish = None
+    self.job = None
+    # a queued RestartJob to run once this restart is done
+    self.follow_up = None
+    self.report = None
+    self.round_count = -1
+    # the next stagger wave and when it may be stopped, wave_delay after
+    # the one before
+    self.wave = 0
+    self.wave_delay = 0.0
+    self.next_wave = 0
+    self.stages = []
+    self.starts = []
+    self.start_cursor = 0
+    self.probes = []
+    self.probe_cursor = 0
+    self.batch_cursor = 0
+    self.readiness = readiness
+    self.readiness_timeout = readiness_timeout
+    self.readiness_interval = readiness_interval
+    self.socket_map = socket_map
+    self.only = only
+    # new configs to swap in just before a process is spawned again, so it
+    # is stopped as it was configured before
+    self.configs = configs or {}
+    self.signal = signal
+    self.settle = settle
+    self.fallbacks = 0
+    self.surge_policy = surge_policy
+    self.spares = None
+    self.parked = False
+    self.parking = set()
+
+    unstopped = set(p.config.name for p in group.get_unstopped_processes())
+    processes = group.processes.values()
+    if only is not None:
+      processes = [p for p in processes if p.config.name in only]
+    spares = []
+    if surge:
+      # spares are picked from the whole group even when only is given
+      idle = [p for p in group.processes.values()
+                if p.config.name not in unstopped and
+                   not getattr(p.config,'autostart',True)]
+      idle.sort(key=lambda p: p.config.name)
+      running = [p for p in processes if p.config.name in unstopped]
+      spares = idle[:_resolve_count(surge,len(running))]
+      if not spares:
+        raise RPCError(RestarterFaults.BAD_STATE,
+                       '%s: no stopped autostart=false processes to surge with' % (self.name,))
+      idle = set(p.config.name for p in idle)
+      processes = [p for p in processes if p.config.name not in idle]
+    processes.sort(key=lambda p: (getattr(p.config,'priority',999),p.config.name))
+    for i,p in enumerate(processes + spares):
+      if p.config.name in unstopped:
+        phase = RestartPhases.PENDING_STOP
+      else:
+        phase = RestartPhases.PENDING_START
+      rec = self.records[p.config.name] = ProcRecord(p,i,phase)
+      self.buckets[phase].add(rec)
+    if spares:
+      self.spares = [self.records[p.config.name] for p in spares]
+    if timeout_per_process:
+      self.timeout += timeout_per_process * len(self.records)
+
+    # unfinished processes in each priority, if priorities are restarted in turn
+    self.tiers = None
+    if by_priority:
+      tiers = {}
+      for rec in self.records.itervalues():
+        tiers[rec.priority] = tiers.get(rec.priority,0) + 1
+      if len(tiers) > 1:
+        self.tiers = tiers
+    stop_order = sorted(self.buckets[RestartPhases.PENDING_STOP],
+                        key=lambda rec: rec.order)
+    self.batch_size = batch_size or 0
+    self.max_unavailable = _resolve_count(max_unavailable or 0,len(self.records))
+    self.budget = budget
+    if budget is not None:
+      budget.add(self)
+    self.max_starting = max_starting or 0
+    self.throttle = throttle
+    if throttle is not None:
+      throttle.add(self)
+    # the first processes to be restarted and when they all came up,
+    # until they have stayed up for canary_soak
+    self.canaries = None
+    self.canary_soak = canary_soak
+    self.soak_started = None
+    self.soak_pids = None
+    canary = _resolve_count(canary or 0,len(stop_order))
+    if canary:
+      self.canaries = stop_order[:canary]
+      if self.timeout:
+        # the soak is no reason to give up
+        self.timeout += canary_soak
+    # anything limiting how many processes are down at once rolls through
+    # stop_order, otherwise processes are stopped in stagger waves
+    if self.batch_size or self.max_unavailable or budget is not None or \
+       self.spares is not None or self.tiers is not None or \
+       self.canaries is not None:
+      self.stop_order = stop_order
+      self.stop_cursor = 0
+      self.stop_batches = []
+    else:
+      # stagger_factor is how "often" we stop procs
+      # 2 = every other call
+      # 3 = every third call, etc
+      stagger = min(stagger_factor or 1,len(stop_order) or 1)
+      self.stop_batches = [stop_order[i::stagger] for i in xrange(stagger)]
+      self.stop_order = None
+
+  def _set_phase(self,rec,phase):
+    old = rec.phase
+    if old == phase:
+      return
+    self.buckets[old].discard(rec)
+    self.buckets[phase].add(rec)
+    rec.phase = phase
+    if self.tiers is not None:
+      active = phase in ACTIVE_PHASES
+      if active != (old in ACTIVE_PHASES):
+        if active:
+          self.tiers[rec.priority] += 1
+        else:
+          self.tiers[rec.priority] -= 1
+    now = time()
+    if rec.stamp is not None:
+      for key,left,entered in TIMED_PHASES:
+        if old == left and (entered is None or phase in entered):
+          elapsed = now - rec.stamp
+          setattr(rec,key + '_time',elapsed)
+          if self.stats is not None:
+            self.stats.observe(key + '_seconds',elapsed)
+          break
+    rec.stamp = now
+    self.last_progress = now
+    self.moves += 1
+
+  def _fail(self,rec,err):
+    self.errs.append(err)
+    self._set_phase(rec,RestartPhases.FAILED)
+
+  def _get_proc(self,rec):
+    p = rec.ref()
+    if p is None:
+      # process removed from supervisord out from under us
+      self._set_phase(rec,RestartPhases.REMOVED)
+    return p
+
+  def pending(self):
+    return sum(len(self.buckets[phase]) for phase in ACTIVE_PHASES)
+
+  def phase_counts(self):
+    return dict((RestartPhases._names[phase],len(bucket))
+                for phase,bucket in self.buckets.iteritems())
+
+  def state_counts(self):
+    '''Count the current states of processes which have not been
+    restarted.
+    '''
+    counts = {}
+    for rec in self.records.itervalues():
+      if rec.phase == RestartPhases.DONE:
+        continue
+      p = rec.ref()
+      if p is None:
+        state = 'REMOVED'
+      else:
+        state = _get_state_desc(p.get_state())
+      counts[state] = counts.get(state,0) + 1
+    return counts
+
+  def progress(self):
+    '''Return how many times processes have changed phase, for pacing
+    ticks, or None while stagger waves are still to be stopped since they
+    are meant to be a full delay apart.
+    '''
+    if self.stop_order is None and self.wave < len(self.stop_batches):
+      return None
+    return self.moves
+
+  def wave_wait(self):
+    '''Return how many seconds until the next stagger wave is due, or None
+    if there is none waiting.
+    '''
+    if self.stop_order is not None or self.wave >= len(self.stop_batches) or \
+       not self.wave:
+      return None
+    return max(self.next_wave - time(),0.0)
+
+  def unfinished(self):
+    '''True if the restart has not been ticked yet, its last round was cut
+    short or processes have changed state since it began.
+    '''
+    return self.round_count < 0 or bool(self.stages) or bool(self.dirty)
+
+  def wake(self):
+    if self.waker is not None and not self.in_tick:
+      self.waker.wake()
+
+  def process_changed(self,name):
+    rec = self.records.get(name)
+    if rec is not None and rec.phase in WATCHED_PHASES:
+      self.dirty.add(rec)
+      self.wake()
+
+  def cancel(self):
+    '''Stop no further processes. Processes which have already been stopped
+    are still started again before the restart completes.
+    '''
+    if not self.cancelled:
+      self.cancelled = True
+      for rec in list(self.buckets[RestartPhases.PENDING_STOP]):
+        self._set_phase(rec,RestartPhases.CANCELLED)
+      self.errs.append(RPCError(RestarterFaults.CANCELLED,
+                       '%d procs were not restarted' % \
+                       len(self.buckets[RestartPhases.CANCELLED])))
+
+  def finish(self,result):
+    if self.result is None:
+      if result is True:
+        self.result = 'done'
+      elif self.cancelled:
+        self.result = 'cancelled'
+      elif self.timed_out:
+        self.result = 'timeout'
+      elif result is None:
+        self.result = 'aborted'
+      else:
+        self.result = 'failed'
+      if not self.in_tick:
+        self._report()
+      self._notify()
+    if self.watcher is not None:
+      self.watcher._unwatch(self)
+    if isinstance(self.waker,Waker):
+      self.waker.release()
+    if self.budget is not None:
+      self.budget.remove(self)
+    if self.throttle is not None:
+      self.throttle.remove(self)
+    for rec in self.records.itervalues():
+      if rec.probe is not None:
+        rec.probe.close()
+        rec.probe = None
+    return result
+
+  def _notify(self):
+    on_finish,self.on_finish = self.on_finish,None
+    if on_finish is not None:
+      on_finish(self)
+    waiters,self.waiters = self.waiters,[]
+    for waiter in waiters:
+      waiter.wake()
+      if isinstance(waiter,Waker):
+        waiter.release()
+
+  def outcome(self):
+    '''Return what the restart returned when it finished, or NOT_DONE_YET.'''
+    if self.result is None:
+      return NOT_DONE_YET
+    final = self.final
+    if isinstance(final,RPCError):
+      raise final
+    if final is None:
+      # finished from outside a tick
+      return self.errs + [RPCError(Faults.FAILED,'restart was aborted')]
+    return final
+
+  def covers(self,names):
+    '''True if this restart includes all of names (None for the whole
+    group).
+    '''
+    if self.only is None:
+      return True
+    return names is not None and names <= self.only
+
+  def stalled(self,now):
+    return now - self.last_tick > self.stall_after
+
+  def poll(self,budget=None):
+    '''Follow a restart that something else is driving.'''
+    if self.result is None and self.stalled(time()):
+      # the driver's client has gone away, take over
+      return self(budget)
+    return self.outcome()
+
+  def _report(self):
+    stats,self.stats = self.stats,None
+    journal,self.journal = self.journal,None
+    if stats is None and journal is None:
+      return
+    summary = self.summary()
+    if stats is not None:
+      stats.restart_finished(summary)
+    if journal is not None:
+      journal.append(self.journal_record(summary))
+
+  def journal_record(self,summary):
+    '''Return the compact record of the finished restart kept in the
+    journal.
+    '''
+    faults = {}
+    for e in self.errs:
+      name = _fault_name(e.code)
+      faults[name] = faults.get(name,0) + 1
+    # xmlrpc has no None so durations which were not seen are left out
+    times = {}
+    for rec in self.records.itervalues():
+      stop,start = rec.durations()
+      d = {}
+      if stop is not None:
+        d['stop'] = round_seconds(stop)
+      if start is not None:
+        d['start'] = round_seconds(start)
+      if d:
+        times[rec.name] = d
+    record = {'group':self.name,
+              'method':self.method or '',
+              'trigger':self.trigger,
+              'started':round_seconds(summary['started']),
+              'elapsed':round_seconds(summary['elapsed']),
+              'result':summary['result'],
+              'procs':summary['procs'],
+              'faults':faults,
+              'times':times}
+    for key in TIMED_KEYS:
+      if key in summary:
+        record[key] = {'mean':round_seconds(summary[key]['mean']),
+                       'max':round_seconds(summary[key]['max'])}
+    if self.selector is not None:
+      record['selector'] = self.selector
+    if self.signal is not None:
+      record['signal'] = self.signal
+    return record
+
+  def summary(self):
+    '''Return restart duration, cost and per-phase process latencies.'''
+    elapsed = 0.0
+    if self.timer.is_started():
+      elapsed = self.timer.elapsed()
+    d = {'group':self.name,
+         'started':self.timer.start_time,
+         'elapsed':elapsed,
+         'ticks':self.timer.get_counter()+1,
+         'cpu':self.cpu_time,
+         'result':self.result or 'running',
+         'procs':len(self.records)}
+    if self.signal is not None:
+      d['signal'] = self.signal
+      d['fallbacks'] = self.fallbacks
+    timed = []
+    for key in TIMED_KEYS:
+      values = [v for v in (getattr(rec,key + '_time')
+                            for rec in self.records.itervalues())
+                  if v is not None]
+      if values:
+        d[key] = {'mean':sum(values) / len(values),'max':max(values)}
+    for rec in self.records.itervalues():
+      timings = rec.timings()
+      if timings:
+        timed.append((sum(timings.values()),rec.name,timings))
+    timed.sort(reverse=True)
+    slowest = []
+    for total,name,timings in timed[:self.slowest]:
+      timings['name'] = name
+      slowest.append(timings)
+    d['slowest'] = slowest
+    return d
+
+  def __call__(self,budget=None):
+    '''Run one tick. budget may be a TickBudget shared with other
+    restarts being ticked together, in which case the caller starts it.
+    '''
+    own = budget is None
+    if own:
+      budget = self.tick_budget
+      budget.start()
+    self.in_tick = True
+    self.last_tick = time()
+    started = clock()
+    try:
+      try:
+        result = self.tick(budget)
+      except RPCError, e:
+        self.final = e
+        raise
+      if result is not NOT_DONE_YET:
+        self.final = result
+      return result
+    finally:
+      self.in_tick = False
+      cost = clock() - started
+      self.cpu_time += cost
+      if own:
+        budget.done(self.name,self.pending())
+      if self.stats is not None:
+        self.stats.observe('tick_cpu_seconds',cost)
+      if self.result is not None:
+        self._report()
+      if self.yielded:
+        self.yielded = False
+        if self.result is None:
+          # carry on as soon as supervisord has had a look at everything else
+          self.wake()
+
+  def tick(self,budget=None):
+    if budget is None:
+      budget = self.tick_budget
+    loop_count = self.timer.inc_counter()
+    if not self.timer.is_started():
+      self.timer.start()
+      self.last_progress = time()
+    else:
+      expired = self._expired()
+      if expired is not None:
+        e = RPCError(RestarterFaults.TIMEOUT,
+          '%s, loop count %d, %d procs pending restart' % \
+          (expired,loop_count,self.pending()))
+        self.timed_out = True
+        self.finish(None)
+        if self.errs:
+          self.errs.append(e)
+          return self.errs
+        raise e
+      if self.stop_timeout or self.start_timeout:
+        self._check_phase_timeouts()
+      if self.canaries is not None:
+        self._check_canaries()
+
+    if not self.stages:
+      self._new_round()
+    # a round is normally done in one tick; a stage cut short by the tick
+    # budget goes to the back of the queue so none starves the others
+    stages = self.stages
+    while stages:
+      if not stages[0](budget):
+        stages.append(stages.pop(0))
+        self.yielded = True
+        break
+      stages.pop(0)
+
+    if self.spares is not None and not self.parked and self._actives_done():
+      self._park()
+
+    if not self.pending():
+      if self.errs:
+        return self.finish(self.errs)
+      return self.finish(True)
+    return NOT_DONE_YET
+
+  def _expired(self):
+    '''Return why the restart has run out of time, or None.'''
+    elapsed = self.timer.elapsed()
+    if self.timeout and elapsed > self.timeout:
+      return 'timeout expired after %.1f seconds' % (elapsed,)
+    if self.idle_timeout and self.soak_started is None:
+      idle = time() - self.last_progress
+      if idle > self.idle_timeout:
+        return 'no progress for %.1f seconds' % (idle,)
+    return None
+
+  def _check_phase_timeouts(self):
+    now = time()
+    if now < self.next_phase_check:
+      return
+    self.next_phase_check = now + PHASE_CHECK_SECONDS
+    for phase,limit,code,doing in ((RestartPhases.STOPPING,self.stop_timeout,
+                                    RestarterFaults.STOP_FAILED,'stopping'),
+                                   (RestartPhases.STARTING,self.start_timeout,
+                                    RestarterFaults.START_FAILED,'starting')):
+      if not limit:
+        continue
+      for rec in list(self.buckets[phase]):
+        if now - rec.stamp > limit:
+          self._fail(rec,RPCError(code,'%s: still %s after %.1f seconds' % \
+                                  (rec.name,doing,now - rec.stamp)))
+
+  def _new_round(self):
+    self.round_count += 1
+    buckets = self.buckets
+    if self.waker is not None and self.dirty:
+      # only processes which have reported a state change need looking at
+      candidates = [rec for rec in self.dirty if rec.phase in TRANSIT_PHASES]
+    else:
+      candidates = list(buckets[RestartPhases.STOPPING])
+      candidates.extend(buckets[RestartPhases.STARTING])
+    self.dirty.clear()
+    candidates.extend(buckets[RestartPhases.PENDING_START])
+    # settling ends with time as well as with state changes
+    candidates.extend(buckets[RestartPhases.SETTLING])
+    candidates.sort(key=lambda rec: rec.order)
+    self.starts = candidates
+    self.start_cursor = 0
+    self.probes = sorted(buckets[RestartPhases.PROBING],key=lambda rec: rec.order)
+    self.probe_cursor = 0
+    self.batch_cursor = 0
+    self.stages = [self._run_starts,self._run_probes,self._run_stops]
+
+  # each stage returns False if it ran out of budget before finishing
+
+  def _run_starts(self,budget):
+    starts = self.starts
+    while self.start_cursor < len(starts):
+      if budget.exhausted():
+        return False
+      rec = starts[self.start_cursor]
+      self.start_cursor += 1
+      if rec.phase in START_PHASES:
+        self._check_start(rec,self.round_count)
+        budget.spend()
+      elif rec.phase == RestartPhases.SETTLING:
+        self._check_settle(rec)
+        budget.spend()
+    self.starts = []
+    return True
+
+  def _run_probes(self,budget):
+    probes = self.probes
+    now = time()
+    while self.probe_cursor < len(probes):
+      if budget.exhausted():
+        return False
+      rec = probes[self.probe_cursor]
+      self.probe_cursor += 1
+      if rec.phase == RestartPhases.PROBING:
+        self._check_probe(rec,self.round_count,now)
+        budget.spend()
+    self.probes = []
+    return True
+
+  def _run_stops(self,budget):
+    if self.stop_order is not None:
+      return self._roll(budget)
+    if self.wave < len(self.stop_batches):
+      # waves go by time, a tick woken early by an event doesn't bring
+      # the next one forward
+      if not self.batch_cursor and time() + WAVE_SLACK < self.next_wave:
+        return True
+      batch = self.stop_batches[self.wave]
+      while self.batch_cursor < len(batch):
+        if budget.exhausted():
+          return False
+        rec = batch[self.batch_cursor]
+        self.batch_cursor += 1
+        if rec.phase == RestartPhases.PENDING_STOP:
+          self._check_stop(rec)
+          budget.spend()
+      self.wave += 1
+      self.batch_cursor = 0
+      self.next_wave = time() + self.wave_delay
+    return True
+
+  def unavailable(self):
+    buckets = self.buckets
+    return len(buckets[RestartPhases.STOPPING]) + \
+           len(buckets[RestartPhases.SETTLING]) + \
+           len(buckets[RestartPhases.PENDING_START]) + \
+           len(buckets[RestartPhases.STARTING]) + \
+           len(buckets[RestartPhases.PROBING])
+
+  def _failed_down(self):
+    '''How many processes failed to restart and are not running, spares
+    aside. With a readiness probe a failed process which is running is
+    not known to be ready and so counts as down too.
+    '''
+    down = 0
+    for rec in self.buckets[RestartPhases.FAILED]:
+      if self.spares is not None and rec in self.spares:
+        continue
+      p = rec.ref()
+      if p is None or p.get_state() != ProcessStates.RUNNING or \
+         self.readiness is not None:
+        down += 1
+    return down
+
+  def _halt(self,failed):
+    '''Stop the processes still waiting to be stopped from being
+    restarted, since failures have used up the room to take any down.
+    '''
+    pending = list(self.buckets[RestartPhases.PENDING_STOP])
+    for rec in pending:
+      self._set_phase(rec,RestartPhases.CANCELLED)
+    if pending:
+      self.errs.append(RPCError(RestarterFaults.BAD_STATE,
+                       '%s: %d procs failed to restart, %d procs were not restarted' % \
+                       (self.name,failed,len(pending))))
+
+  def _roll(self,budget):
+    # processes which failed to come back stay down, so they count against
+    # batch_size and max_unavailable until they are running again
+    in_flight = self.unavailable()
+    failed = self._failed_down()
+    unavailable = in_flight + failed
+    allowed = None
+    if self.batch_size:
+      # wait for the whole previous batch to be back up
+      if unavailable:
+        if failed and not in_flight:
+          self._halt(failed)
+        return True
+      allowed = self.batch_size
+    if self.spares is not None and not self.parked:
+      room = self._surge_room(unavailable)
+      if allowed is None or room < allowed:
+        allowed = room
+    if self.max_unavailable:
+      room = self.max_unavailable - unavailable
+      if room <= 0 and failed and not in_flight:
+        self._halt(failed)
+        return True
+      if allowed is None or room < allowed:
+        allowed = room
+    if self.budget is not None:
+      room = self.budget.room()
+      if room is not None and (allowed is None or room < allowed):
+        allowed = room
+    if allowed is None:
+      allowed = len(self.stop_order)
+    stop_order = self.stop_order
+    while allowed > 0 and self.stop_cursor < len(stop_order):
+      if budget.exhausted():
+        return False
+      rec = stop_order[self.stop_cursor]
+      if self.tiers is not None and rec.priority > self._current_tier():
+        break
+      if self.canaries is not None and self.stop_cursor >= len(self.canaries):
+        # the rest wait for the canaries to soak
+        break
+      self.stop_cursor += 1
+      if rec.phase == RestartPhases.PENDING_STOP:
+        self._check_stop(rec)
+        budget.spend()
+        allowed -= 1
+    return True
+
+  def _check_canaries(self):
+    '''Let the rest of the group be restarted once every canary has been
+    up for canary_soak seconds, or give up on it if any canary fails.
+    '''
+    canaries = self.canaries
+    failed = [rec.name for rec in canaries if rec.phase == RestartPhases.FAILED]
+    if not failed:
+      for rec in canaries:
+        if rec.phase != RestartPhases.DONE:
+          return
+      now = time()
+      if self.soak_started is None:
+        self.soak_started = now
+        self.soak_pids = {}
+        for rec in canaries:
+          p = rec.ref()
+          if p is not None:
+            self.soak_pids[rec.name] = p.pid
+      for rec in canaries:
+        p = rec.ref()
+        if p is None or p.get_state() != ProcessStates.RUNNING or \
+           p.pid != self.soak_pids.get(rec.name):
+          failed.append(rec.name)
+      if not failed:
+        if now - self.soak_started >= self.canary_soak:
+          self.canaries = None
+          self.soak_started = None
+          self.last_progress = now
+        return
+    self.canaries = None
+    self.soak_started = None
+    pending = list(self.buckets[RestartPhases.PENDING_STOP])
+    for rec in pending:
+      self._set_phase(rec,RestartPhases.CANCELLED)
+    self.errs.append(RPCError(RestarterFaults.CANARY_FAILED,
+                     '%s: canary %s failed, %d procs were not restarted' % \
+                     (self.name,', '.join(sorted(failed)),len(pending))))
+
+  def _current_tier(self):
+    '''The lowest priority with processes still to be restarted.'''
+    return min([priority for priority,count in self.tiers.iteritems() if count] or [None])
+
+  def _surge_room(self,unavailable):
+    '''How many more running processes may be stopped with the spares
+    that are up standing in for them.
+    '''
+    up = coming = 0
+    for rec in self.spares:
+      if rec.phase in ACTIVE_PHASES:
+        coming += 1
+      elif rec.phase == RestartPhases.DONE:
+        p = rec.ref()
+        if p is not None and p.get_state() == ProcessStates.RUNNING:
+          up += 1
+    if not up and not coming:
+      pending = list(self.buckets[RestartPhases.PENDING_STOP])
+      if pending:
+        # without spares stopping anything would drop capacity
+        for rec in pending:
+          self._set_phase(rec,RestartPhases.CANCELLED)
+        self.errs.append(RPCError(RestarterFaults.BAD_STATE,
+                         '%s: no spare process came up, %d procs were not restarted' % \
+                         (self.name,len(pending))))
+      return 0
+    return up - (unavailable - coming)
+
+  def _actives_done(self):
+    spares = 0
+    for rec in self.spares:
+      if rec.phase in ACTIVE_PHASES:
+        spares += 1
+    return self.pending() == spares
+
+  def _park(self):
+    '''Stop the spares again once everything else has been restarted.'''
+    self.parked = True
+    if self.surge_policy != 'park':
+      return
+    for rec in self.spares:
+      if rec.phase == RestartPhases.DONE:
+        self.parking.add(rec.name)
+        self._set_phase(rec,RestartPhases.PENDING_STOP)
+        self._check_stop(rec)
+
+  def _check_start(self,rec,loop_count):
+    p = self._get_proc(rec)
+    if p is None:
+      return
+    name = rec.name
+    state = p.get_state()
+    if state == BACKOFF:
+      if loop_count > 0:
+        self._fail(rec,RPCError(RestarterFaults.START_FAILED,
+                   '%s: process failing startup, in backoff mode' % (name,)))
+      else:
+        msg = p.stop()
+        if msg is not None:
+          self._fail(rec,RPCError(RestarterFaults.STOP_FAILED,'BACKOFF/%s: %s' % (name,msg)))
+        else:
+          self._set_phase(rec,RestartPhases.STOPPING)
+    elif state != STARTING and state in RUNNING_STATES:
+      if self.readiness is None:
+        self._set_phase(rec,RestartPhases.DONE)
+      else:
+        self._start_probe(rec,p)
+    elif state in STOPPED_STATES:
+      if name in self.parking:
+        self._set_phase(rec,RestartPhases.DONE)
+        return
+      if not self._may_spawn() or \
+         (self.tiers is not None and rec.priority > self._current_tier()):
+        self._set_phase(rec,RestartPhases.PENDING_START)
+        return
+      if name in self.configs:
+        p.config = self.configs.pop(name)
+      started = time()
+      p.spawn()
+      rec.spawn_time = time() - started
+      if self.stats is not None:
+        self.stats.observe('spawn_seconds',rec.spawn_time)
+      if p.spawnerr:
+        self._fail(rec,RPCError(Faults.SPAWN_ERROR,name))
+      else:
+        if self.readiness is not None:
+          self._create_probe(rec,p)
+        self._set_phase(rec,RestartPhases.STARTING)
+    elif state == STARTING:
+      self._set_phase(rec,RestartPhases.STARTING)
+    elif state == STOPPING:
+      self._set_phase(rec,RestartPhases.STOPPING)
+    else:
+      self._fail(rec,RPCError(RestarterFaults.BAD_STATE,
+                 '%s: bad state during start [%s]' % (name,_get_state_desc(state))))
+
+  def _may_spawn(self):
+    if self.max_starting and \
+       len(self.buckets[RestartPhases.STARTING]) >= self.max_starting:
+      return False
+    if self.throttle is not None:
+      room = self.throttle.room(time())
+      if room is not None and room <= 0:
+        return False
+    return True
+
+  def _create_probe(self,rec,p):
+    if rec.probe is not None:
+      rec.probe.close()
+    rec.probe = self.readiness.create(p,self.socket_map,
+                                      interval=self.readiness_interval,
+                                      wake=self.wake)
+
+  def _start_probe(self,rec,p):
+    if rec.probe is None:
+      self._create_probe(rec,p)
+    rec.probe.deadline = time() + self.readiness_timeout
+    self._set_phase(rec,RestartPhases.PROBING)
+
+  def _check_probe(self,rec,loop_count,now):
+    p = self._get_proc(rec)
+    if p is None:
+      return
+    probe = rec.probe
+    if p.get_state() != ProcessStates.RUNNING:
+      # died or was restarted behind our back, start over
+      probe.close()
+      rec.probe = None
+      self._set_phase(rec,RestartPhases.STARTING)
+      self._check_start(rec,loop_count)
+    elif probe.poll(now):
+      probe.close()
+      rec.probe = None
+      self._set_phase(rec,RestartPhases.DONE)
+    elif now > probe.deadline:
+      probe.close()
+      rec.probe = None
+      self._fail(rec,RPCError(RestarterFaults.NOT_READY,
+                 '%s: readiness probe %s did not pass within %.1f seconds (%s)' % \
+                 (rec.name,self.readiness.spec,self.readiness_timeout,
+                  probe.error or 'no match')))
+
+  def _check_settle(self,rec):
+    p = self._get_proc(rec)
+    if p is None:
+      return
+    if p.get_state() != ProcessStates.RUNNING or p.pid != rec.pid:
+      # the reload did not leave it running, restart it for real
+      self.fallbacks += 1
+      self._set_phase(rec,RestartPhases.STARTING)
+      self._check_start(rec,0)
+    elif time() - rec.stamp >= self.settle:
+      if self.readiness is None:
+        self._set_phase(rec,RestartPhases.DONE)
+      else:
+        self._start_probe(rec,p)
+
+  def _reload(self,rec,p):
+    '''Send the reload signal, returns False if it could not be sent.'''
+    send = getattr(p,'signal',None)
+    try:
+      if send is None:
+        # supervisor before 3.2
+        msg = p.config.options.kill(p.pid,self.signal)
+      else:
+        msg = send(self.signal)
+    except (OSError,AssertionError):
+      return False
+    if msg is not None:
+      return False
+    rec.pid = p.pid
+    self._set_phase(rec,RestartPhases.SETTLING)
+    return True
+
+  def _check_stop(self,rec):
+    p = self._get_proc(rec)
+    if p is None:
+      return
+    name = rec.name
+    state = p.get_state()
+    if self.signal is not None and state == ProcessStates.RUNNING and \
+       name not in self.parking:
+      if self._reload(rec,p):
+        return
+      self.fallbacks += 1
+    if state in RUNNING_STATES:
+      msg = p.stop()
+      if msg is not None:
+        self._fail(rec,RPCError(RestarterFaults.STOP_FAILED,'%s: %s' % (name,msg)))
+      else:
+        self._set_phase(rec,RestartPhases.STOPPING)
+    elif state in STOPPED_STATES:
+      self._set_phase(rec,RestartPhases.PENDING_START)
+    elif state == STOPPING:
+      self._set_phase(rec,RestartPhases.STOPPING)
+    else:
+      self._fail(rec,RPCError(Faults.BAD_STATE,
+                 '%s: bad state during stop [%s]' % (name,_get_state_desc(state))))
+
+class MultiRestart(object):
+  '''Drives several GroupRestarts from a single tick so that their stop and
+  start phases interleave. The group ticked first rotates every tick so no
+  group can starve the others of a shared ConcurrencyBudget or of the
+  tick_budget, which bounds the work done by all of them in a tick.
+  Restarts in attached were started by another request and are only
+  polled. report turns a restart and its list of faults into the value
+  returned for that group. depends maps group names to the groups being
+  restarted alongside which must be restarted first; a restart whose
+  prerequisite fails is not run at all.
+  '''
+  def __init__(self,restarts,tick_budget=None,attached=(),report=None,
+                    depends=None):
+    super(MultiRestart,self).__init__()
+    self.restarts = list(restarts)
+    self.attached = list(attached)
+    self.depends = depends or {}
+    if report is None:
+      report = lambda restart,faults: _fault_dicts(faults)
+    self.report = report
+    self.results = {}
+    self.first = 0
+    if tick_budget is None:
+      tick_budget = TickBudget()
+    self.tick_budget = tick_budget
+
+  def __call__(self):
+    restarts = self.restarts
+    budget = self.tick_budget
+    budget.start()
+    if restarts:
+      self.first = (self.first + 1) % len(restarts)
+      skipped = []
+      for restart in restarts[self.first:] + restarts[:self.first]:
+        if budget.exhausted():
+          skipped.append(restart)
+          continue
+        waiting = self._waiting(restart)
+        if waiting:
+          # keep it from looking abandoned while it waits its turn
+          restart.last_tick = time()
+          continue
+        try:
+          if waiting is None:
+            result = self._skip(restart)
+          elif restart in self.attached:
+            result = restart.poll(budget)
+          else:
+            result = restart(budget)
+        except RPCError, e:
+          result = [e]
+        if result is NOT_DONE_YET:
+          continue
+        if result is not True:
+          result = self.report(restart,result)
+        self.results[restart.name] = result
+        restarts.remove(restart)
+        for other in restarts:
+          if restart.name in self.depends.get(other.name,()):
+            # its turn may have come
+            other.wake()
+      budget.done(','.join(r.name for r in restarts) or 'groups',
+                  sum(r.pending() for r in restarts))
+      for restart in skipped:
+        if restart.unfinished():
+          restart.wake()
+    if restarts:
+      return NOT_DONE_YET
+    return self.results
+
+  def _waiting(self,restart):
+    '''True while restart's prerequisites are being restarted, None if one
+    of them failed.
+    '''
+    if restart in self.attached:
+      return False
+    for name in self.depends.get(restart.name,()):
+      if name not in self.results:
+        return True
+      if self.results[name] is not True:
+        return None
+    return False
+
+  def _skip(self,restart):
+    failed = [name for name in self.depends[restart.name]
+                   if self.results.get(name,True) is not True]
+    restart.errs.append(RPCError(RestarterFaults.BAD_STATE,
+                        '%s: not restarted, prerequisite %s failed' % \
+                        (restart.name,','.join(sorted(failed)))))
+    restart.final = restart.errs
+    return restart.finish(restart.errs)
+
+  def finish(self):
+    for restart in self.restarts:
+      if restart not in self.attached:
+        restart.finish(None)
+
+class JobStates(object):
+  QUEUED = 'queued'
+  RUNNING = 'running'
+  DONE = 'done'
+  FAILED = 'failed'
+  TIMEOUT = 'timeout'
+  CANCELLED = 'cancelled'
+
+class RestartJob(object):
+  '''A GroupRestart running in the background, ticked by TickDriver
+  rather than by a deferred http response.
+
+  An attached job follows a restart which something else is driving. A
+  job created without a restart is queued: it waits for the restart of its
+  group which is in progress and is start()ed with a restart made from
+  settings once that is done.
+  '''
+  def __init__(self,id,restart,pacer,attached=False,group=None,settings=None):
+    super(RestartJob,self).__init__()
+    self.id = id
+    self.restart = restart
+    self.pacer = pacer
+    self.attached = attached
+    self.settings = settings
+    if restart is None:
+      self.group = group
+      self.state = JobStates.QUEUED
+    else:
+      self.group = restart.name
+      self.state = JobStates.RUNNING
+    self.faults = []
+    self.created = time()
+    self.finished = None
+    self.next_tick = 0
+    self.woken = False
+    self.on_finish = None
+    self.waiters = []
+
+  def start(self,restart):
+    self.restart = restart
+    self.state = JobStates.RUNNING
+
+  def wake(self):
+    self.woken = True
+
+  def running(self):
+    return self.state in (JobStates.RUNNING,JobStates.QUEUED)
+
+  def due(self,now):
+    return self.woken or now >= self.next_tick
+
+  def tick(self,now):
+    '''Advance the restart, returns True once the job has finished.'''
+    self.woken = False
+    try:
+      if self.attached:
+        result = self.restart.poll()
+      else:
+        result = self.restart()
+    except RPCError, e:
+      result = [e]
+    if result is NOT_DONE_YET:
+      self.next_tick = now + self.pacer.pace(self.restart.progress(),
+                                             self.restart.wave_wait())
+      return False
+    self._finish(result)
+    return True
+
+  def cancel(self):
+    if not self.running():
+      return False
+    if self.restart is None:
+      self._finish([RPCError(RestarterFaults.CANCELLED,'queued restart was cancelled')])
+      return True
+    self.restart.cancel()
+    self.wake()
+    return True
+
+  def abort(self,err):
+    if not self.attached:
+      self.restart.finish(None)
+    self._finish(self.restart.errs + [err])
+
+  def _finish(self,result):
+    self.finished = time()
+    if result is True:
+      self.state = JobStates.DONE
+      return self._finished()
+    codes = [e.code for e in result]
+    if self.restart is None or self.restart.cancelled:
+      self.state = JobStates.CANCELLED
+    elif RestarterFaults.TIMEOUT in codes:
+      self.state = JobStates.TIMEOUT
+    else:
+      self.state = JobStates.FAILED
+    self.faults = _fault_dicts(result)
+    self._finished()
+
+  def _finished(self):
+    if self.on_finish is not None:
+      self.on_finish(self)
+      self.on_finish = None
+    waiters,self.waiters = self.waiters,[]
+    for waiter in waiters:
+      waiter.wake()
+      if isinstance(waiter,Waker):
+        waiter.release()
+
+  def outcome(self):
+    '''The job's result in the form restartProcessGroup returns it.'''
+    if self.running():
+      return NOT_DONE_YET
+    if self.state == JobStates.DONE:
+      return True
+    return self.faults
+
+  def status(self):
+    if self.finished is None:
+      elapsed = time() - self.created
+    else:
+      elapsed = self.finished - self.created
+    restart = self.restart
+    if restart is None:
+      ticks,pending,phases = 0,0,{}
+    else:
+      ticks = restart.timer.get_counter()+1
+      pending = restart.pending()
+      phases = restart.phase_counts()
+    return {'id':self.id,
+            'group':self.group,
+            'state':self.state,
+            'done':not self.running(),
+            'elapsed':elapsed,
+            'ticks':ticks,
+            'pending':pending,
+            'phases':phases,
+            'faults':self.faults}
+
+class TickTimer(object):
+  '''Periodic work ticked by TickDriver alongside restart jobs, for as long
+  as supervisord is running; it stops once supervisord is shutting down or
+  reloading. Subclasses say when they are next due in _due() and do their
+  work in _tick(). An exception from _tick() is logged and the timer keeps
+  going.
+  '''
+  # what the timer does, for the log
+  doing = 'running a timer'
+
+  def __init__(self,rpcinterface,logger=None):
+    super(TickTimer,self).__init__()
+    self.rpcinterface = rpcinterface
+    self.logger = logger
+
+  def running(self):
+    return self.rpcinterface.supervisord.options.mood >= SupervisorStates.RUNNING
+
+  def due(self,now):
+    return self._due(now) or not self.running()
+
+  def tick(self,now):
+    if not self.running():
+      self._stop(now)
+      return True
+    try:
+      self._tick(now)
+    except Exception:
+      self.abort(None)
+    return False
+
+  def _due(self,now):
+    return False
+
+  def _tick(self,now):
+    pass
+
+  def _stop(self,now):
+    pass
+
+  def abort(self,err):
+    if self.logger is not None:
+      import traceback
+      self.logger.critical('restarter: uncaptured python exception %s\n%s' % \
+                           (self.doing,traceback.format_exc()))
+
+class RecycleTimer(TickTimer):
+  '''Recycles processes over their resource limits every interval
+  seconds.
+  '''
+  doing = 'while recycling'
+
+  def __init__(self,rpcinterface,interval,logger=None):
+    super(RecycleTimer,self).__init__(rpcinterface,logger)
+    self.interval = interval
+    self.next_tick = time() + interval
+
+  def _due(self,now):
+    return now >= self.next_tick
+
+  def _tick(self,now):
+    self.next_tick = now + self.interval
+    self.rpcinterface._recycle_groups(now)
+
+class JournalFlusher(TickTimer):
+  '''Writes out the restart journal's batched records once they are due,
+  and for the last time as supervisord stops.
+  '''
+  doing = 'writing the journal'
+
+  def __init__(self,rpcinterface,journal,logger=None):
+    super(JournalFlusher,self).__init__(rpcinterface,logger)
+    self.journal = journal
+
+  def _due(self,now):
+    return self.journal.due(now)
+
+  def _tick(self,now):
+    self.journal.flush()
+
+  def _stop(self,now):
+    self.journal.flush()
+
+class RestartScheduler(TickTimer):
+  '''Starts scheduled restarts as background restart jobs once they are
+  due. At most concurrency scheduled restarts run at once (0 for no
+  limit), the others wait their turn in the order they came due. A
+  schedule coming due again while its last run is still waiting or
+  running is skipped.
+  '''
+  doing = 'running schedules'
+
+  def __init__(self,rpcinterface,schedules,concurrency=1,logger=None):
+    super(RestartScheduler,self).__init__(rpcinterface,logger)
+    self.schedules = schedules
+    self.concurrency = concurrency
+    self.waiting = deque()
+    self.active = []
+    self.woken = False
+    now = time()
+    for schedule in schedules:
+      schedule.plan(now)
+    self.next_tick = min([schedule.next_run for schedule in schedules])
+
+  def wake(self):
+    self.woken = True
+
+  def _due(self,now):
+    return self.woken or now >= self.next_tick
+
+  def _tick(self,now):
+    self.woken = False
+    try:
+      self._run(now)
+    finally:
+      self.next_tick = min([schedule.next_run for schedule in self.schedules])
+
+  def _run(self,now):
+    for schedule in self.schedules:
+      if now < schedule.next_run:
+        continue
+      schedule.plan(now)
+      if schedule in self.waiting or \
+         (schedule.job is not None and schedule.job.running()):
+        if self.logger is not None:
+          self.logger.warn('restarter: skipping scheduled restart of %s, '
+                           'the last one has not finished' % (schedule.group,))
+        continue
+      schedule.job = None
+      self.waiting.append(schedule)
+    self.active = [job for job in self.active if job.running()]
+    while self.waiting and (not self.concurrency or len(self.active) < self.concurrency):
+      schedule = self.waiting.popleft()
+      job = self._start(schedule,now)
+      if job is not None and job.running():
+        self.active.append(job)
+        job.waiters.append(self)
+
+  def _start(self,schedule,now):
+    rpcinterface = self.rpcinterface
+    schedule.last_run = now
+    try:
+      group = rpcinterface._get_group(schedule.group)
+      settings = rpcinterface._restart_options(dict(schedule.options))
+      settings['method'] = 'schedule'
+      if not settings['trigger']:
+        settings['trigger'] = schedule.when
+      schedule.job = rpcinterface._get_job(rpcinterface._start_job(group,settings))
+    except RPCError, e:
+      if self.logger is not None:
+        self.logger.warn('restarter: scheduled restart of %s failed: %s' % \
+                         (schedule.group,e.text))
+      return None
+    if self.logger is not None:
+      self.logger.info('restarter: scheduled restart of %s started as job %d' % \
+                       (schedule.group,schedule.job.id))
+    return schedule.job
+
+  def status(self):
+    status = []
+    for schedule in self.schedules:
+      job = schedule.job
+      id,state = 0,''
+      if schedule in self.waiting:
+        state = JobStates.QUEUED
+      elif job is not None:
+        id,state = job.id,job.state
+      status.append({'group':schedule.group,
+                     'when':schedule.when,
+                     'jitter':schedule.jitter,
+                     'next':schedule.next_run,
+                     'last':schedule.last_run or 0,
+                     'job':id,
+                     'state':state})
+    return status
+
+# per-call restart options and how to convert them
+RESTART_OPTIONS = {'delay':float,
+                   'min_delay':float,
+                   'timeout':float,
+                   'stagger_factor':int,
+                   'batch_size':int,
+                   'max_unavailable':_count_or_percent,
+                   'readiness':_probe_spec,
+                   'readiness_timeout':float,
+                   'readiness_interval':float,
+                   'max_starting':int,
+                   'tick_budget_ms':float,
+                   'tick_budget_ops':int,
+                   'coalesce':_coalesce_mode,
+                   'faults':_fault_mode,
+                   'processes':_selector,
+                   'signal':_signal,
+                   'settle':float,
+                   'surge':_count_or_percent,
+                   'surge_policy':_surge_policy,
+                   'stop_timeout':float,
+                   'start_timeout':float,
+                   'idle_timeout':float,
+                   'timeout_per_process':float,
+                   'by_priority':_flag,
+                   'canary':_count_or_percent,
+                   'canary_soak':float,
+                   'trigger':str}
+
+# per-call recycle thresholds, on top of the restart options
+RECYCLE_OPTIONS = {'max_rss':_byte_size,
+                   'max_cpu_percent':float,
+                   'max_uptime':float,
+                   'recycle_limit':_count_or_percent}
+
 class RPCInterface(object):
-  def __init__(self, supervisord,delay=None,
-                     timeout=None,stagger_factor=None):
+  def __init__(self, supervisord,delay=None,min_delay=MIN_DELAY,
+                     timeout=None,stagger_factor=None,
+                     use_events=True,job_history=100,
+                     batch_size=0,max_unavailable=0,
+                     readiness=None,readiness_timeout=30.0,
+                     readiness_interval=0.5,concurrency=0,
+                     max_starting=0,max_load=0.0,max_cpu_pressure=0.0,
+                     stats_history=20,stats_textfile=None,
+                     tick_budget_ms=0.0,tick_budget_ops=0,slow_tick_ms=100.0,
+                     coalesce='attach',faults='list',fault_sample=20,
+                     fault_history=20,recycle_interval=0.0,recycle_groups=(),
+                     max_rss=0,max_cpu_percent=0.0,max_uptime=0.0,
+                     recycle_limit=1,settle=1.0,surge=0,surge_policy='park',
+                     stop_timeout=0.0,start_timeout=0.0,idle_timeout=0.0,
+                     timeout_per_process=0.0,by_priority=False,depends=None,
+                     canary=0,canary_soak=10.0,journal_file=None,
+                     journal_maxbytes=10*1024*1024,journal_backups=5,
+                     journal_flush=5.0,schedules=(),schedule_concurrency=1):
     self.supervisord = supervisord
     self.delay = delay
+    self.min_delay = min_delay
     self.timeout = timeout
     self.stagger_factor = stagger_factor
+    self.batch_size = batch_size
+    self.max_unavailable = max_unavailable
+    self.readiness = readiness or {}
+    self.readiness_timeout = readiness_timeout
+    self.readiness_interval = readiness_interval
+    self.concurrency = concurrency
+    self.tick_budget_ms = tick_budget_ms
+    self.tick_budget_ops = tick_budget_ops
+    self.slow_tick_ms = slow_tick_ms
+    self.coalesce = coalesce
+    self.faults = faults
+    self.fault_sample = fault_sample
+    self.fault_history = fault_history
+    self.settle = settle
+    self.surge = surge
+    self.surge_policy = surge_policy
+    self.stop_timeout = stop_timeout
+    self.start_timeout = start_timeout
+    self.idle_timeout = idle_timeout
+    self.timeout_per_process = timeout_per_process
+    self.by_priority = by_priority
+    self.depends = depends or {}
+    self.canary = canary
+    self.canary_soak = canary_soak
+    self.throttle = SpawnThrottle(max_starting=max_starting,
+                                  max_load=max_load,
+                                  max_cpu_pressure=max_cpu_pressure)
+    self.stats = RestartStats(history=stats_history,textfile=stats_textfile,
+                              logger=getattr(supervisord.options,'logger',None))
+    self.use_events = use_events
+    self.job_history = job_history
     self._version = None
+    self._watchers = {}
+    self._jobs = {}
+    self._finished_jobs = deque()
+    self._next_job_id = 1
+    self._driver = None
+    self._inflight = {}
+    self._reports = {}
+    self._report_ids = deque()
+    self._next_report_id = 1
+    self.limits = ResourceLimits(max_rss=max_rss,
+                                 max_cpu_percent=max_cpu_percent,
+                                 max_uptime=max_uptime)
+    self.recycle_limit = recycle_limit
+    self.recycle_groups = _globs(recycle_groups)
+    self.sampler = ProcSampler()
+    self.journal = None
+    if journal_file:
+      self.journal = RestartJournal(journal_file,maxbytes=journal_maxbytes,
+                                    backups=journal_backups,
+                                    flush_interval=journal_flush,
+                                    logger=getattr(supervisord.options,'logger',None))
     super(RPCInterface,self).__init__()
+    if recycle_interval > 0 and self.recycle_groups and self.limits.limited():
+      logger = getattr(supervisord.options,'logger',None)
+      self._get_driver().add(RecycleTimer(self,recycle_interval,logger))
+    if self.journal is not None:
+      self._get_driver().add(JournalFlusher(self,self.journal,
+                                            getattr(supervisord.options,'logger',None)))
+    self.scheduler = None
+    if schedules:
+      self.scheduler = RestartScheduler(self,list(schedules),schedule_concurrency,
+                                        getattr(supervisord.options,'logger',None))
+      self._get_driver().add(self.scheduler)
+
+  def _process_state_changed(self,event):
+    process = event.process
+    if process.group is None:
+      return
+    name = process.config.name
+    watchers = self._watchers.get((process.group.config.name,name))
+    if watchers:
+      # waking may unwatch a restart whose client has gone away
+      for restart in list(watchers):
+        restart.process_changed(name)
+
+  def _watch(self,restart,callback):
+    '''Tell restart about state changes to any of its processes and wake
+    callback when they happen. callback is either the function handed back
+    to supervisord as a deferred response or anything with a wake() method.
+    _unwatch() must be called once the restart is complete.
+    '''
+    subscription = (WAKE_EVENTS,self._process_state_changed)
+    if subscription not in events.callbacks:
+      events.subscribe(*subscription)
+    self._set_waker(restart,callback)
+    restart.watcher = self
+    for name in restart.records:
+      self._watchers.setdefault((restart.name,name),[]).append(restart)
+
+  def _set_waker(self,restart,callback):
+    if hasattr(callback,'wake'):
+      restart.waker = callback
+    else:
+      restart.waker = Waker(self.supervisord.options.get_socket_map(),callback,
+                            abandon=lambda: self._abandon(restart))
+
+  def _follow(self,restart,callback):
+    '''Arrange for callback to be run early when restart needs it, either
+    because one of its processes changed state or because its last tick
+    ran out of budget.
+    '''
+    if self.use_events:
+      self._watch(restart,callback)
+    elif restart.tick_budget.limited():
+      self._set_waker(restart,callback)
+
+  def _abandon(self,restart):
+    '''The client driving restart has gone away.'''
+    self._unwatch(restart)
+    if not restart.waiters and restart.stalled(time()):
+      # nobody else wants the result either
+      restart.finish(None)
+
+  def _unwatch(self,restart):
+    for name in restart.records:
+      key = (restart.name,name)
+      watchers = self._watchers.get(key)
+      if watchers and restart in watchers:
+        watchers.remove(restart)
+        if not watchers:
+          del self._watchers[key]
+    if isinstance(restart.waker,Waker):
+      restart.waker.release()
+    restart.watcher = None
+
+  def _restart_options(self,options):
+    '''Merge per-call restart options over the configured defaults.'''
+    settings = {'delay':self.delay,
+                'min_delay':self.min_delay,
+                'timeout':self.timeout,
+                'stagger_factor':self.stagger_factor,
+                'batch_size':self.batch_size,
+                'max_unavailable':self.max_unavailable,
+                'readiness':None,
+                'readiness_timeout':self.readiness_timeout,
+                'readiness_interval':self.readiness_interval,
+                'max_starting':0,
+                'tick_budget_ms':self.tick_budget_ms,
+                'tick_budget_ops':self.tick_budget_ops,
+                'coalesce':self.coalesce,
+                'faults':self.faults,
+                'processes':None,
+                'signal':None,
+                'settle':self.settle,
+                'surge':self.surge,
+                'surge_policy':self.surge_policy,
+                'stop_timeout':self.stop_timeout,
+                'start_timeout':self.start_timeout,
+                'idle_timeout':self.idle_timeout,
+                'timeout_per_process':self.timeout_per_process,
+                'by_priority':self.by_priority,
+                'canary':self.canary,
+                'canary_soak':self.canary_soak,
+                'trigger':'',
+                # the rpc method asked to restart, for the journal
+                'method':getattr(self,'update_text',None)}
+    if not options:
+      return settings
+    if not isinstance(options,dict):
+      raise RPCError(Faults.BAD_ARGUMENTS,'options must be a struct')
+    for key,value in options.iteritems():
+      convert = RESTART_OPTIONS.get(key)
+      if convert is None:
+        raise RPCError(Faults.BAD_ARGUMENTS,'unknown restart option %r' % (key,))
+      try:
+        value = convert(value)
+      except (TypeError,ValueError):
+        raise RPCError(Faults.BAD_ARGUMENTS,'bad value for %s: %r' % (key,value))
+      settings[key] = value
+    return settings
+
+  def _prerequisites(self,names):
+    '''Map each of names to the others it depends on, directly or through
+    groups which are not among names.
+    '''
+    prerequisites = {}
+    for name in names:
+      found = set()
+      seen = set()
+      pending = list(self.depends.get(name,self.depends.get(name.lower(),())))
+      while pending:
+        other = pending.pop()
+        if other in seen:
+          continue
+        seen.add(other)
+        if other in names:
+          found.add(other)
+        else:
+          pending.extend(self.depends.get(other,self.depends.get(other.lower(),())))
+      if found:
+        prerequisites[name] = found
+    return prerequisites
+
+  def _select(self,group,settings):
+    '''Names of the processes in group which settings selects, None for
+    all of them.
+    '''
+    if not settings['processes']:
+      return None
+    return _select_processes(group,settings['processes'])
+
+  def _make_restart(self,group,settings,budget=None,configs=None):
+    readiness = settings['readiness']
+    if readiness is None:
+      # ConfigParser lower cases option names
+      readiness = self.readiness.get(group.config.name,
+                                     self.readiness.get(group.config.name.lower()))
+    restart = GroupRestart(group,stagger_factor=settings['stagger_factor'],
+                              timeout=settings['timeout'],
+                              batch_size=settings['batch_size'],
+                              max_unavailable=settings['max_unavailable'],
+                              readiness=readiness or None,
+                              readiness_timeout=settings['readiness_timeout'],
+                              readiness_interval=settings['readiness_interval'],
+                              socket_map=self.supervisord.options.get_socket_map(),
+                              budget=budget,
+                              max_starting=settings['max_starting'],
+                              throttle=self.throttle,
+                              stats=self.stats,
+                              tick_budget=self._make_tick_budget(settings),
+                              only=self._select(group,settings),
+                              configs=configs,
+                              signal=settings['signal'],
+                              settle=settings['settle'],
+                              surge=settings['surge'],
+                              surge_policy=settings['surge_policy'],
+                              stop_timeout=settings['stop_timeout'],
+                              start_timeout=settings['start_timeout'],
+                              idle_timeout=settings['idle_timeout'],
+                              timeout_per_process=settings['timeout_per_process'],
+                              by_priority=settings['by_priority'],
+                              canary=settings['canary'],
+                              canary_soak=settings['canary_soak'])
+    restart.stall_after = max(STALL_SECONDS,2 * settings['delay'])
+    restart.wave_delay = settings['delay'] or 0.0
+    restart.journal = self.journal
+    restart.method = settings['method']
+    restart.trigger = settings['trigger']
+    restart.selector = settings['processes']
+    restart.on_finish = self._restart_finished
+    self._inflight[restart.name] = restart
+    return restart
+
+  def _restart_finished(self,restart):
+    if self._inflight.get(restart.name) is restart:
+      del self._inflight[restart.name]
+    job,restart.follow_up = restart.follow_up,None
+    if job is None or job.state != JobStates.QUEUED:
+      return
+    try:
+      group = self._get_group(restart.name)
+      follow_up = self._make_restart(group,job.settings)
+    except RPCError, e:
+      job._finish([e])
+      return
+    follow_up.job = job
+    job.start(follow_up)
+    self._follow(follow_up,job)
+    self._get_driver().add(job)
+
+  def _new_job(self,restart,settings,attached=False,group=None):
+    job = RestartJob(self._next_job_id,restart,self._pacer(settings),
+                     attached=attached,group=group,settings=settings)
+    self._next_job_id += 1
+    job.on_finish = self._job_finished
+    self._jobs[job.id] = job
+    return job
+
+  def _queue_follow_up(self,running,settings):
+    '''Return the job queued to restart running's group again once it is
+    done, queueing one if there isn't one yet.
+    '''
+    job = running.follow_up
+    if job is None or job.state != JobStates.QUEUED:
+      job = running.follow_up = self._new_job(None,settings,group=running.name)
+    else:
+      # the follow-up restarts everything any of the queued requests asked for
+      queued = job.settings['processes']
+      if queued and settings['processes']:
+        job.settings['processes'] = queued + [item for item in settings['processes']
+                                              if item not in queued]
+      else:
+        job.settings['processes'] = None
+      if settings['signal'] is None:
+        # a restart for real takes care of a reload as well
+        job.settings['signal'] = None
+    return job
+
+  def _running(self,group,settings):
+    '''Return the restart of group already in progress, if any. If it
+    does not cover the processes settings selects the request has to
+    queue behind it.
+    '''
+    running = self._inflight.get(group.config.name)
+    if running is None:
+      return None
+    if not running.covers(self._select(group,settings)) or \
+       (running.signal is not None and settings['signal'] is None):
+      settings['coalesce'] = 'queue'
+    return running
+
+  def _summarize(self,restart,faults,group=None):
+    '''Aggregate a failed restart's faults into counts per fault and per
+    process state plus a small sample. The full list is kept as a report
+    which getRestartFaults() pages through.
+    '''
+    faults = _fault_dicts(faults)
+    if restart is not None:
+      group = restart.name
+      report = restart.report
+    else:
+      report = None
+    if report is None or report not in self._reports:
+      report = self._next_report_id
+      self._next_report_id += 1
+      self._reports[report] = (group,faults)
+      self._report_ids.append(report)
+      while len(self._report_ids) > self.fault_history:
+        self._reports.pop(self._report_ids.popleft(),None)
+      if restart is not None:
+        restart.report = report
+    codes = {}
+    for fault in faults:
+      name = _fault_name(fault['code'])
+      codes[name] = codes.get(name,0) + 1
+    states = {}
+    if restart is not None:
+      states = restart.state_counts()
+    return {'group':group,
+            'total':len(faults),
+            'codes':codes,
+            'states':states,
+            'sample':faults[:self.fault_sample],
+            'report':report}
+
+  def _reporter(self,settings):
+    '''Return a function which turns a restart's outcome into the result
+    sent back to the client, according to the faults option.
+    '''
+    if settings['faults'] != 'summary':
+      return lambda restart,result: result
+    def report(restart,result):
+      if result is True or result is NOT_DONE_YET:
+        return result
+      return self._summarize(restart,result)
+    return report
+
+  def _attach(self,running,settings):
+    '''Return a deferred callback which shares the result of running, or
+    of the restart queued to follow it.
+    '''
+    if settings['coalesce'] == 'queue':
+      job = self._queue_follow_up(running,settings)
+      def tick():
+        return job.outcome()
+      def moves():
+        if job.restart is None:
+          return 0
+        return job.restart.progress()
+      waiters = job.waiters
+    else:
+      report = self._reporter(settings)
+      def tick():
+        return report(running,running.poll())
+      def moves():
+        return running.progress()
+      waiters = running.waiters
+    restartem = self._paced(tick,moves,settings)
+    waiters.append(Waker(self.supervisord.options.get_socket_map(),restartem))
+    return restartem
+
+  def _pacer(self,settings):
+    '''Return a TickPacer for a restart. Events already wake a restart as
+    soon as one of its processes changes state so with use_events ticks
+    are left delay apart.
+    '''
+    if self.use_events:
+      return TickPacer(settings['delay'],settings['delay'])
+    return TickPacer(settings['delay'],settings['min_delay'])
+
+  def _paced(self,tick,moves,settings,wait=None):
+    '''Wrap tick as a deferred rpc callback which is called again after
+    min_delay while moves() keeps changing, backing off towards delay
+    while it doesn't (see TickPacer), or sooner if wait() says something
+    is due.
+    '''
+    pacer = self._pacer(settings)
+    socket_map = self.supervisord.options.get_socket_map()
+    def restartem():
+      result = tick()
+      if result is NOT_DONE_YET:
+        if wait is None:
+          pacer.pace(moves())
+        else:
+          pacer.pace(moves(),wait())
+        pacer.apply(socket_map,restartem)
+      return result
+    restartem.delay = pacer.delay
+    restartem.rpcinterface = self
+    return restartem
+
+  def _make_tick_budget(self,settings):
+    return TickBudget(ms=settings['tick_budget_ms'],
+                      ops=settings['tick_budget_ops'],
+                      slow_ms=self.slow_tick_ms,
+                      logger=getattr(self.supervisord.options,'logger',None))
+
+  def _get_group(self,name):
+    group = self.supervisord.process_groups.get(name)
+    if group is None:
+      raise RPCError(RestarterFaults.BAD_GROUP)
+    return group
+
+  def _get_job(self,id):
+    try:
+      return self._jobs[int(id)]
+    except (KeyError,TypeError,ValueError):
+      raise RPCError(RestarterFaults.BAD_JOB,str(id))
+
+  def _get_driver(self):
+    if self._driver is None or self._driver.closed:
+      self._driver = TickDriver(self.supervisord.options.get_socket_map(),
+                                getattr(self.supervisord.options,'logger',None))
+    return self._driver
+
+  def _job_finished(self,job):
+    if job.faults and job.settings and job.settings['faults'] == 'summary':
+      job.faults = self._summarize(job.restart,job.faults,group=job.group)
+    self._finished_jobs.append(job.id)
+    while len(self._finished_jobs) > self.job_history:
+      self._jobs.pop(self._finished_jobs.popleft(),None)
 
   def _update(self,text):
     self.update_text = text
@@ -127,113 +2566,658 @@ class RPCInterface(object):
     self._update('getAPIVersion')
     return API_VERSION
 
-  def restartProcessGroup(self, name):
+  def restartProcessGroup(self, name, options=None):
     '''Restart all procs in supervisor process group .. rapidly!
     Returns a list of rpc faults if an error occurs.
 
+    If the group is already being restarted the call shares that
+    restart's result, or with coalesce set to "queue" waits for a single
+    follow-up restart queued behind it.
+
     @param string name          name of process group to restart
+    @param struct options       optional overrides for delay, min_delay,
+                                timeout, stagger_factor, batch_size,
+                                max_unavailable, readiness,
+                                readiness_timeout, readiness_interval,
+                                max_starting, tick_budget_ms,
+                                tick_budget_ops, coalesce, faults,
+                                processes (a selector as for
+                                restartProcesses()), signal and settle (as
+                                for reloadProcessGroup()), surge,
+                                surge_policy, stop_timeout, start_timeout,
+                                idle_timeout, timeout_per_process,
+                                by_priority, canary, canary_soak and
+                                trigger
     @return boolean result      true if successful
     '''
     self._update('restartProcessGroup')
-    group = self.supervisord.process_groups.get(name)
-    if group is None:
-      raise RPCError(RestarterFaults.BAD_GROUP)
+    return self._restart_group(name,options)
 
-    transit_states = (STARTING,STOPPING)
-    processes = WeakValueDictionary((p.config.name,p) for p in group.processes.itervalues())
-    allprocs = set(processes.keys())
-    procnames = [p.config.name for p in group.get_unstopped_processes()]
-    unstopped = set(procnames)
-    started = set()
-    ignore = set()
-    errs = list()
-    timer = Timer()
-
-    def get_proc(name):
-      try:
-        return processes[name]
-      except KeyError:
-        if name in procnames:
-          procnames.remove(name)
-        unstopped.discard(name)
-        started.discard(name)
-        ignore.discard(name)
+  def restartProcesses(self, group, selector, options=None):
+    '''Restart some of the procs in a process group, as rapidly and with
+    the same settings as restartProcessGroup() restarts all of them.
 
-    def restartem():
-      loop_count = timer.inc_counter()
-      # stagger_factor is how "often" we stop procs
-      # 2 = every other call
-      # 3 = every third call, etc
-      stagger = min(self.stagger_factor or 1,len(unstopped) or 1)
-      stop_modulus = loop_count % stagger
-      if not timer.is_started():
-        timer.start()
-      elif timer.elapsed() > self.timeout:
-        nremaining = (len(allprocs) - len(started.union(ignore))) + len(unstopped)
-        e = RPCError(RestarterFaults.TIMEOUT,
-          'timeout expired after %.1f seconds, loop count %d, %d procs pending restart' % \
-          (timer.elapsed(),loop_count,nremaining))
-        if errs:
-          errs.append(e)
-          return errs
-        raise e
-      for name in sorted(allprocs):
-        p = get_proc(name)
-        if p is None:
-          continue
-        if name not in unstopped and name not in started and name not in ignore:
-          state = p.get_state()
-          if state == BACKOFF:
-            if loop_count > 0:
-              errs.append(RPCError(RestarterFaults.START_FAILED,
-                          '%s: process failing startup, in backoff mode' % (name,)))
-              ignore.add(name)
-            else:
-              msg = p.stop()
-              if msg is not None:
-                errs.append(RPCError(RestarterFaults.STOP_FAILED,'BACKOFF/%s: %s' % (name,msg)))
-                ignore.add(name)
-          elif state != STARTING and state in RUNNING_STATES:
-            started.add(name)
-          elif state in STOPPED_STATES:
-            p.spawn()
-            if p.spawnerr:
-              errs.append(RPCError(Faults.SPAWN_ERROR,name))
-              ignore.add(name)
-          elif state not in transit_states:
-            errs.append(RPCError(RestarterFaults.BAD_STATE,
-                        '%s: bad state during start [%s]' % (name,_get_state_desc(state))))
-            ignore.add(name)
-
-      for i,name in enumerate(sorted(unstopped,reverse=True)):
-        if loop_count < stagger and (i % stagger) != stop_modulus:
-          continue
-        p = get_proc(name)
-        if p is None:
-          continue
-        state = p.get_state()
-        unstopped.discard(name)
-        if state in RUNNING_STATES:
-          msg = p.stop()
-          if msg is not None:
-            errs.append(RPCError(RestarterFaults.STOP_FAILED,'%s: %s' % (name,msg)))
-            ignore.add(name)
-        elif state not in STOPPED_STATES and state not in transit_states:
-          errs.append(RPCError(Faults.BAD_STATE,
-                      '%s: bad state during stop [%s]' % (name,_get_state_desc(state))))
-          ignore.add(name)
-
-      if not unstopped and started.union(ignore) == allprocs:
-        if errs:
-          return errs
-        return True
-      return NOT_DONE_YET
- 
-    restartem.delay = self.delay
-    restartem.rpcinterface = self
+    @param string group         name of process group
+    @param array selector       process names, fnmatch globs and process
+                                number ranges such as "0-19"
+    @param struct options       optional restart settings, as for
+                                restartProcessGroup()
+    @return boolean result      true if successful
+    '''
+    self._update('restartProcesses')
+    options = dict(options or {})
+    options['processes'] = selector
+    return self._restart_group(group,options)
+
+  def reloadProcessGroup(self, name, signal, options=None):
+    '''Reload the procs in a process group by sending each of them a
+    signal, such as HUP, with the same staggering and limits as
+    restartProcessGroup(). A proc which is still RUNNING with the same pid
+    settle seconds later has reloaded, any other is restarted for real.
+
+    @param string name          name of process group to reload
+    @param string signal        signal name or number
+    @param struct options       optional restart settings, as for
+                                restartProcessGroup(), plus settle
+    @return boolean result      true if successful
+    '''
+    self._update('reloadProcessGroup')
+    options = dict(options or {})
+    options['signal'] = signal
+    if options['signal'] in (None,''):
+      raise RPCError(Faults.BAD_ARGUMENTS,'no reload signal given')
+    return self._restart_group(name,options)
+
+  def _restart_group(self,name,options):
+    group = self._get_group(name)
+    settings = self._restart_options(options)
+    running = self._running(group,settings)
+    if running is not None:
+      return self._attach(running,settings)
+
+    restart = self._make_restart(group,settings)
+    report = self._reporter(settings)
+    def tick():
+      return report(restart,restart())
+    restartem = self._paced(tick,restart.progress,settings,restart.wave_wait)
+    self._follow(restart,restartem)
     return restartem
-        
+
+  def _config_changes(self,group):
+    '''Compare group's processes with its config as last read by
+    reread. Returns the new group config, new configs of processes whose
+    config differs and the names of processes added and removed.
+    '''
+    name = group.config.name
+    for config in self.supervisord.options.process_group_configs:
+      if config.name == name:
+        break
+    else:
+      raise RPCError(RestarterFaults.BAD_GROUP,'%s is no longer configured' % (name,))
+    if config.__class__ is not group.config.__class__:
+      raise RPCError(Faults.BAD_ARGUMENTS,'%s cannot be updated in place' % (name,))
+    changed = {}
+    added = []
+    for process_config in config.process_configs:
+      process = group.processes.get(process_config.name)
+      if process is None:
+        added.append(process_config)
+      elif process.config != process_config:
+        changed[process_config.name] = process_config
+    names = set(process_config.name for process_config in config.process_configs)
+    removed = [process_name for process_name in group.processes
+                            if process_name not in names]
+    return config,changed,added,removed
+
+  def _set_group_config(self,group,config):
+    '''Make group's config the new one from reread, listing the configs
+    its processes really have so that a process which was not restarted
+    still shows up as changed to update.
+    '''
+    config = copy.copy(config)
+    config.process_configs = [group.processes[process_config.name].config
+                              for process_config in config.process_configs
+                              if process_config.name in group.processes]
+    group.config = config
+
+  def updateProcessGroup(self, name, options=None):
+    '''Apply a process group's config as last read by reread without
+    removing and re-adding the group: only procs whose config changed are
+    restarted, as rapidly as restartProcessGroup() and with the same
+    settings. Added procs are started if autostart is set, removed procs
+    must be stopped first.
+
+    @param string name          name of process group to update
+    @param struct options       optional restart settings, as for
+                                restartProcessGroup(), except processes
+    @return boolean result      true if successful
+    '''
+    self._update('updateProcessGroup')
+    group = self._get_group(name)
+    settings = self._restart_options(options)
+    if settings['processes']:
+      raise RPCError(Faults.BAD_ARGUMENTS,'processes cannot be used with updateProcessGroup')
+    if group.config.name in self._inflight:
+      raise RPCError(RestarterFaults.BAD_STATE,'%s is being restarted' % (name,))
+    config,changed,added,removed = self._config_changes(group)
+    running = [process_name for process_name in removed
+                            if group.processes[process_name].get_state() not in STOPPED_STATES]
+    if running:
+      raise RPCError(Faults.STILL_RUNNING,','.join(sorted(running)))
+
+    for process_name in removed:
+      del group.processes[process_name]
+    for process_config in changed.values() + added:
+      process_config.create_autochildlogs()
+    unstopped = set(p.config.name for p in group.get_unstopped_processes())
+    selected = set()
+    for process_name,process_config in changed.items():
+      if process_name in unstopped:
+        selected.add(process_name)
+      else:
+        # not running, it is enough for its next start to use the new config
+        group.processes[process_name].config = process_config
+        del changed[process_name]
+    for process_config in added:
+      group.processes[process_config.name] = process_config.make_process(group)
+      if process_config.autostart:
+        selected.add(process_config.name)
+    if not selected:
+      self._set_group_config(group,config)
+      return True
+
+    settings['processes'] = sorted(selected)
+    restart = self._make_restart(group,settings,configs=changed)
+    def finished(restart):
+      self._set_group_config(group,config)
+      self._restart_finished(restart)
+    restart.on_finish = finished
+    report = self._reporter(settings)
+    def tick():
+      return report(restart,restart())
+    restartem = self._paced(tick,restart.progress,settings,restart.wave_wait)
+    self._follow(restart,restartem)
+    return restartem
+
+  def restartProcessGroups(self, names, options=None):
+    '''Restart several process groups at once, interleaving their
+    restarts. Each name may be an fnmatch style glob. Restart options apply
+    to each group, with the addition of concurrency which limits how many
+    processes may be unavailable across all groups together. Groups which
+    are already being restarted are not restarted again, their results are
+    those of the restarts in progress. A group configured to depend on
+    others is restarted once they have been, and not at all if any of them
+    fails.
+
+    @param array names          names or globs of process groups to restart
+    @param struct options       optional restart settings, as for
+                                restartProcessGroup(), plus concurrency
+    @return struct results      true or a list of faults for each group name
+    '''
+    self._update('restartProcessGroups')
+    if isinstance(names,basestring):
+      names = [names]
+    options = dict(options or {})
+    try:
+      concurrency = int(options.pop('concurrency',self.concurrency) or 0)
+    except (TypeError,ValueError):
+      raise RPCError(Faults.BAD_ARGUMENTS,'bad value for concurrency')
+    settings = self._restart_options(options)
+    if settings['processes']:
+      raise RPCError(Faults.BAD_ARGUMENTS,'processes cannot be used with restartProcessGroups')
+
+    groups = {}
+    for pattern in names:
+      matched = fnmatch.filter(self.supervisord.process_groups.keys(),pattern)
+      if not matched:
+        raise RPCError(RestarterFaults.BAD_GROUP,pattern)
+      for name in matched:
+        groups[name] = self.supervisord.process_groups[name]
+
+    budget = None
+    if concurrency > 0:
+      budget = ConcurrencyBudget(concurrency)
+    restarts = []
+    attached = []
+    for name in sorted(groups):
+      running = self._inflight.get(name)
+      if running is not None:
+        attached.append(running)
+      else:
+        restarts.append(self._make_restart(groups[name],settings,budget=budget))
+    report = None
+    if settings['faults'] == 'summary':
+      report = self._summarize
+    multi = MultiRestart(restarts + attached,self._make_tick_budget(settings),
+                         attached=attached,report=report,
+                         depends=self._prerequisites(set(groups)))
+    def moves():
+      counts = [restart.progress() for restart in multi.restarts]
+      if None in counts:
+        return None
+      return sum(counts)
+    def wait():
+      waits = [restart.wave_wait() for restart in multi.restarts]
+      waits = [seconds for seconds in waits if seconds is not None]
+      if not waits:
+        return None
+      return min(waits)
+    restartem = self._paced(multi,moves,settings,wait)
+    for restart in restarts:
+      self._follow(restart,restartem)
+    for restart in attached:
+      restart.waiters.append(Waker(self.supervisord.options.get_socket_map(),
+                                   restartem))
+    return restartem
+
+  def startRestartJob(self, name, options=None):
+    '''Start restarting all procs in a process group in the background.
+    Returns immediately, use getRestartJob() to follow progress. If the
+    group is already being restarted the job follows that restart, or with
+    coalesce set to "queue" is the single follow-up restart queued behind
+    it.
+
+    @param string name          name of process group to restart
+    @param struct options       optional restart settings, as for
+                                restartProcessGroup()
+    @return int id              restart job id
+    '''
+    self._update('startRestartJob')
+    group = self._get_group(name)
+    return self._start_job(group,self._restart_options(options))
+
+  def _start_job(self,group,settings):
+    running = self._running(group,settings)
+    if running is not None:
+      if settings['coalesce'] == 'queue':
+        return self._queue_follow_up(running,settings).id
+      if running.job is not None:
+        return running.job.id
+      job = self._new_job(running,settings,attached=True)
+      running.waiters.append(job)
+      self._get_driver().add(job)
+      return job.id
+
+    restart = self._make_restart(group,settings)
+    job = self._new_job(restart,settings)
+    restart.job = job
+    self._follow(restart,job)
+    self._get_driver().add(job)
+    return job.id
+
+  def _recycle_options(self,options):
+    '''Split per-call options into resource limits, the recycle limit
+    and the remaining restart options.
+    '''
+    limits = ResourceLimits(max_rss=self.limits.max_rss,
+                            max_cpu_percent=self.limits.max_cpu_percent,
+                            max_uptime=self.limits.max_uptime)
+    limit = self.recycle_limit
+    if not options:
+      return limits,limit,{}
+    if not isinstance(options,dict):
+      raise RPCError(Faults.BAD_ARGUMENTS,'options must be a struct')
+    options = dict(options)
+    for key,convert in RECYCLE_OPTIONS.items():
+      if key not in options:
+        continue
+      value = options.pop(key)
+      try:
+        value = convert(value)
+      except (TypeError,ValueError):
+        raise RPCError(Faults.BAD_ARGUMENTS,'bad value for %s: %r' % (key,value))
+      if key == 'recycle_limit':
+        limit = value
+      else:
+        setattr(limits,key,value)
+    return limits,limit,options
+
+  def _over_limits(self,group,limits,limit,now=None):
+    '''Return the names of the processes in group over limits, worst
+    first and at most limit of them.
+    '''
+    scored = []
+    for sample in self.sampler.sample_group(group,now):
+      score = limits.check(sample)
+      if score:
+        scored.append((-score,sample.name))
+    scored.sort()
+    count = _resolve_count(limit,len(group.processes))
+    if count:
+      scored = scored[:count]
+    return [name for score,name in scored]
+
+  def _recycle_groups(self,now):
+    '''Recycle the processes over the configured limits in every group
+    matching recycle_groups. A group already being restarted is left
+    alone until the next interval.
+    '''
+    logger = getattr(self.supervisord.options,'logger',None)
+    for name,group in self.supervisord.process_groups.items():
+      if name in self._inflight:
+        continue
+      for glob in self.recycle_groups:
+        if fnmatch.fnmatchcase(name,glob):
+          break
+      else:
+        continue
+      names = self._over_limits(group,self.limits,self.recycle_limit,now)
+      if not names:
+        continue
+      if logger is not None:
+        logger.info('restarter: recycling %s:%s over resource limits' % \
+                    (name,','.join(names)))
+      settings = self._restart_options({'processes':names})
+      settings['method'] = 'recycle_interval'
+      self._start_job(group,settings)
+
+  def getProcessResources(self, name):
+    '''Sample the resource use of the running procs in a process group.
+
+    @param string name          name of process group
+    @return array samples       name, pid, rss (bytes), cpu_seconds,
+                                cpu_percent, uptime and the configured
+                                limits each proc is over
+    '''
+    self._update('getProcessResources')
+    group = self._get_group(name)
+    samples = self.sampler.sample_group(group)
+    for sample in samples:
+      self.limits.check(sample)
+    samples.sort(key=lambda sample: sample.name)
+    return [sample.as_dict() for sample in samples]
+
+  def recycleProcessGroup(self, name, options=None):
+    '''Restart the procs in a process group which are over their resource
+    limits, worst first, as a background restart job.
+
+    @param string name          name of process group
+    @param struct options       optional overrides for max_rss,
+                                max_cpu_percent, max_uptime and
+                                recycle_limit, plus any restart settings
+                                as for restartProcessGroup()
+    @return struct result       group, processes being recycled and the id
+                                of their restart job (0 if none are)
+    '''
+    self._update('recycleProcessGroup')
+    group = self._get_group(name)
+    limits,limit,options = self._recycle_options(options)
+    if not limits.limited():
+      raise RPCError(Faults.BAD_ARGUMENTS,'no resource limits set')
+    names = self._over_limits(group,limits,limit)
+    job = 0
+    if names:
+      options['processes'] = names
+      job = self._start_job(group,self._restart_options(options))
+    return {'group':group.config.name,
+            'processes':names,
+            'job':job}
+
+  def getRestartJob(self, id):
+    '''Return the status of a restart job started by startRestartJob().
+
+    @param int id               restart job id
+    @return struct status       id, group, state, done, elapsed, ticks,
+                                pending, phases and faults
+    '''
+    self._update('getRestartJob')
+    return self._get_job(id).status()
+
+  def cancelRestartJob(self, id):
+    '''Cancel a running or queued restart job. No further processes are
+    stopped, those already stopped are started again.
+
+    @param int id               restart job id
+    @return boolean result      true if the job was running
+    '''
+    self._update('cancelRestartJob')
+    return self._get_job(id).cancel()
+
+  def getRestartFaults(self, report, offset=0, limit=100):
+    '''Return a page of the full list of faults behind a fault summary
+    (returned when the faults option is "summary").
+
+    @param int report           report id from the summary
+    @param int offset           index of the first fault to return
+    @param int limit            most faults to return, at most 1000
+    @return struct page         report, group, total, offset and faults
+    '''
+    self._update('getRestartFaults')
+    try:
+      group,faults = self._reports[int(report)]
+      offset = max(int(offset),0)
+      limit = min(max(int(limit),0),1000)
+    except (KeyError,TypeError,ValueError):
+      raise RPCError(RestarterFaults.BAD_REPORT,str(report))
+    return {'report':int(report),
+            'group':group,
+            'total':len(faults),
+            'offset':offset,
+            'faults':faults[offset:offset + limit]}
+
+  def getRestartStats(self):
+    '''Return restart latency histograms, counts of finished restarts by
+    result and summaries of the most recent restarts. Each histogram has
+    bucket upper bounds and counts, with one extra count for observations
+    above the last bound.
+
+    @return struct stats        histograms, results and restarts
+    '''
+    self._update('getRestartStats')
+    return self.stats.as_dict()
+
+  def getRestartSchedules(self):
+    '''Return the configured restart schedules, in group order.
+
+    @return array schedules     group, when, jitter (seconds), next (time
+                                of the next run, jitter included), last
+                                (time of the last run, 0 if none) and the
+                                id and state of the last run's job (0 and
+                                "" if none, "queued" while it waits for
+                                another scheduled restart to finish)
+    '''
+    self._update('getRestartSchedules')
+    if self.scheduler is None:
+      return []
+    return self.scheduler.status()
+
+  def _get_journal(self):
+    if self.journal is None:
+      raise RPCError(Faults.FAILED,'no restart journal is configured')
+    return self.journal
+
+  def getRestartJournal(self, name='', since=0, until=0, limit=100):
+    '''Return records of finished restarts from the journal, oldest first.
+    Each has the group, method, trigger, started, elapsed, result, procs,
+    fault counts by name in faults, mean and max seconds of each phase
+    (stop, spawn, start, settle, ready) and the stop and start seconds of
+    each process in times, plus the selector and signal if there were
+    any.
+
+    @param string name          group name or glob, empty for all groups
+    @param int since            earliest start time, 0 for no limit
+    @param int until            latest start time, 0 for no limit
+    @param int limit            most records to return, at most 1000
+    @return array records       the last limit matching records
+    '''
+    self._update('getRestartJournal')
+    journal = self._get_journal()
+    try:
+      since = float(since or 0)
+      until = float(until or 0)
+      limit = min(max(int(limit),0),1000)
+    except (TypeError,ValueError):
+      raise RPCError(Faults.BAD_ARGUMENTS,'bad time range or limit')
+    match = None
+    if name:
+      match = lambda group: group is not None and fnmatch.fnmatchcase(group,name)
+    return journal.query(match,since=since,until=until,limit=limit)
+
+  def planRestart(self, name, options=None):
+    '''Estimate how long restarting a process group would take with the
+    given restart options, from the stop and start times of its processes
+    in past restarts, without restarting anything. Processes never seen
+    restarted are taken to be as quick as the average of the others, or
+    to take their startsecs to start if none have been seen. stagger_factor
+    (whose waves are delay apart), batch_size, max_unavailable, canary,
+    canary_soak, by_priority and processes are taken into account, and with
+    use_events off so is delay between ticks.
+
+    @param string name          name of process group
+    @param struct options       restart settings, as for restartProcessGroup()
+    @return struct plan         group, procs, known (procs with history),
+                                estimate, stop and start (mean seconds
+                                used) and timeout
+    '''
+    self._update('planRestart')
+    group = self._get_group(name)
+    settings = self._restart_options(options)
+    known = self._get_journal().process_times(group.config.name)
+    only = self._select(group,settings)
+    processes = [p for p in group.processes.values()
+                   if only is None or p.config.name in only]
+    processes.sort(key=lambda p: (getattr(p.config,'priority',999),p.config.name))
+    running = set(p.config.name for p in group.get_unstopped_processes())
+
+    stops = [times[0] for times in known.itervalues() if times[0] is not None]
+    starts = [times[1] for times in known.itervalues() if times[1] is not None]
+    mean_stop = mean_start = None
+    if stops:
+      mean_stop = sum(stops) / len(stops)
+    if starts:
+      mean_start = sum(starts) / len(starts)
+    durations = []
+    seen = 0
+    for p in processes:
+      stop,start = known.get(p.config.name) or (None,None)
+      if stop is not None or start is not None:
+        seen += 1
+      if stop is None:
+        stop = mean_stop or 0.0
+      if start is None:
+        start = mean_start
+        if start is None:
+          start = float(getattr(p.config,'startsecs',1))
+      if p.config.name not in running:
+        stop = 0.0
+      durations.append((getattr(p.config,'priority',999),stop,start))
+
+    tick = 0.0
+    if not self.use_events:
+      tick = settings['delay'] or 0.0
+    limits = {'tick':tick,
+              'wave_delay':settings['delay'] or 0.0,
+              'stagger_factor':settings['stagger_factor'],
+              'batch_size':settings['batch_size'],
+              'max_unavailable':_resolve_count(settings['max_unavailable'] or 0,
+                                               len(durations))}
+    total = 0.0
+    canary = _resolve_count(settings['canary'] or 0,len(durations))
+    if canary:
+      total += estimate([(stop,start) for priority,stop,start in durations[:canary]],
+                        **limits) + settings['canary_soak']
+      durations = durations[canary:]
+    tiers = [durations]
+    if settings['by_priority']:
+      tiers = {}
+      for duration in durations:
+        tiers.setdefault(duration[0],[]).append(duration)
+      tiers = [tiers[priority] for priority in sorted(tiers)]
+    for tier in tiers:
+      total += estimate([(stop,start) for priority,stop,start in tier],**limits)
+
+    timeout = settings['timeout'] or 0.0
+    if timeout:
+      timeout += (settings['timeout_per_process'] or 0.0) * len(processes)
+      if canary:
+        timeout += settings['canary_soak']
+    return {'group':group.config.name,
+            'procs':len(processes),
+            'known':seen,
+            'estimate':round_seconds(total),
+            'stop':round_seconds(mean_stop or 0.0),
+            'start':round_seconds(mean_start or 0.0),
+            'timeout':timeout}
+
+def _group_names(supervisord):
+  '''Names of the groups in supervisord's configuration, or None if they
+  cannot be told.
+  '''
+  configs = getattr(supervisord.options,'process_group_configs',None)
+  if configs is None:
+    return None
+  return set([config.name for config in configs])
+
+def _journal_file(supervisord,value):
+  '''Resolve the journal_file option: NONE disables the journal and AUTO
+  puts it next to supervisord's log, or in childlogdir without one.
+  '''
+  value = str(value).strip()
+  if value.upper() == 'NONE' or not value:
+    return None
+  if value.upper() != 'AUTO':
+    return value
+  options = supervisord.options
+  logfile = getattr(options,'logfile',None)
+  if logfile and logfile.upper() not in ('NONE','SYSLOG'):
+    logdir = os.path.dirname(os.path.abspath(logfile))
+  else:
+    logdir = getattr(options,'childlogdir',None)
+  if not logdir:
+    return None
+  return os.path.join(logdir,'restarter-journal.log')
+
 def make_rpcinterface(supervisord,**config):  
+  readiness = {}
+  for key,value in config.items():
+    if key.startswith('readiness.'):
+      readiness[key.split('.',1)[1]] = ProbeSpec(value.strip())
+  depends = _dependencies(config)
   return RPCInterface(supervisord,delay=float(config.get('delay',0.2)),
+                                  min_delay=float(config.get('min_delay',MIN_DELAY)),
                                   timeout=float(config.get('timeout',5.0)),
-                                  stagger_factor=int(config.get('stagger_factor',1)))
+                                  stagger_factor=int(config.get('stagger_factor',1)),
+                                  use_events=boolean(config.get('use_events',True)),
+                                  job_history=int(config.get('job_history',100)),
+                                  batch_size=int(config.get('batch_size',0)),
+                                  max_unavailable=_count_or_percent(config.get('max_unavailable',0)),
+                                  readiness=readiness,
+                                  readiness_timeout=float(config.get('readiness_timeout',30.0)),
+                                  readiness_interval=float(config.get('readiness_interval',0.5)),
+                                  concurrency=int(config.get('concurrency',0)),
+                                  max_starting=int(config.get('max_starting',0)),
+                                  max_load=float(config.get('max_load',0.0)),
+                                  max_cpu_pressure=float(config.get('max_cpu_pressure',0.0)),
+                                  stats_history=int(config.get('stats_history',20)),
+                                  stats_textfile=config.get('stats_textfile') or None,
+                                  tick_budget_ms=float(config.get('tick_budget_ms',0.0)),
+                                  tick_budget_ops=int(config.get('tick_budget_ops',0)),
+                                  slow_tick_ms=float(config.get('slow_tick_ms',100.0)),
+                                  coalesce=_coalesce_mode(config.get('coalesce','attach')),
+                                  faults=_fault_mode(config.get('faults','list')),
+                                  fault_sample=int(config.get('fault_sample',20)),
+                                  fault_history=int(config.get('fault_history',20)),
+                                  recycle_interval=float(config.get('recycle_interval',0.0)),
+                                  recycle_groups=_globs(config.get('recycle_groups','')),
+                                  max_rss=_byte_size(config.get('max_rss',0)),
+                                  max_cpu_percent=float(config.get('max_cpu_percent',0.0)),
+                                  max_uptime=float(config.get('max_uptime',0.0)),
+                                  recycle_limit=_count_or_percent(config.get('recycle_limit',1)),
+                                  settle=float(config.get('settle',1.0)),
+                                  surge=_count_or_percent(config.get('surge',0)),
+                                  surge_policy=_surge_policy(config.get('surge_policy','park')),
+                                  stop_timeout=float(config.get('stop_timeout',0.0)),
+                                  start_timeout=float(config.get('start_timeout',0.0)),
+                                  idle_timeout=float(config.get('idle_timeout',0.0)),
+                                  timeout_per_process=float(config.get('timeout_per_process',0.0)),
+                                  by_priority=boolean(config.get('by_priority',False)),
+                                  canary=_count_or_percent(config.get('canary',0)),
+                                  canary_soak=float(config.get('canary_soak',10.0)),
+                                  journal_file=_journal_file(supervisord,config.get('journal_file','AUTO')),
+                                  journal_maxbytes=_byte_size(config.get('journal_maxbytes','10MB')),
+                                  journal_backups=int(config.get('journal_backups',5)),
+                                  journal_flush=float(config.get('journal_flush',5.0)),
+                                  schedules=_schedules(config,RESTART_OPTIONS,
+                                                       _group_names(supervisord)),
+                                  schedule_concurrency=int(config.get('schedule_concurrency',1)),
+                                  depends=depends)
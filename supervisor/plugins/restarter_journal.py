@@ -0,0 +1,263 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Restart journal for the restarter plugin.
+
+Every finished restart is appended to the journal as a single line of JSON
+holding the group, the processes selected, who asked for it, how it ended,
+per-phase durations, fault counts and each process's stop and start time.
+Records are buffered and written out in batches, at most flush_interval
+seconds after they were added. Like supervisord's own log the journal is
+rotated to path.1, path.2 ... once it grows past maxbytes, keeping backups
+old files.
+
+The stop and start times of each process are also kept in memory as a
+moving average, which estimate() uses to predict how long a restart will
+take. They are read back from the newest journal file the first time they
+are needed after supervisord starts.
+"""
+import os
+import json
+from heapq import heappush,heappop
+from time import time
+
+# weight of the latest restart in the moving average of a process's times
+ALPHA = 0.3
+
+# how much of a journal file is read at a time when reading it backwards
+BLOCK_SIZE = 64 * 1024
+
+def round_seconds(value):
+  if value is None:
+    return None
+  return round(value,3)
+
+def _lines_backwards(f,blocksize=BLOCK_SIZE):
+  '''Iterate over the lines of f, last first.'''
+  f.seek(0,2)
+  pos = f.tell()
+  tail = ''
+  while pos > 0:
+    size = min(blocksize,pos)
+    pos -= size
+    f.seek(pos)
+    lines = (f.read(size) + tail).split('\n')
+    # the first line may carry on into the previous block
+    tail = lines.pop(0)
+    for line in reversed(lines):
+      if line:
+        yield line
+  if tail:
+    yield tail
+
+def _parse(lines):
+  for line in lines:
+    try:
+      yield json.loads(line)
+    except ValueError:
+      # a line cut short by a crash
+      continue
+
+class RestartJournal(object):
+  def __init__(self,path,maxbytes=10*1024*1024,backups=5,flush_interval=5.0,
+                    batch=100,logger=None):
+    super(RestartJournal,self).__init__()
+    self.path = path
+    self.maxbytes = maxbytes
+    self.backups = backups
+    self.flush_interval = flush_interval
+    self.batch = batch
+    self.logger = logger
+    self.pending = []
+    self.next_flush = None
+    self.times = None
+
+  def append(self,record):
+    '''Queue record to be written, flushing the queue if it is full.'''
+    self.pending.append(record)
+    if self.times is not None:
+      self._learn(record)
+    if self.next_flush is None:
+      self.next_flush = time() + self.flush_interval
+    if len(self.pending) >= self.batch:
+      self.flush()
+
+  def due(self,now):
+    return self.next_flush is not None and now >= self.next_flush
+
+  def flush(self):
+    pending,self.pending = self.pending,[]
+    self.next_flush = None
+    if not pending:
+      return
+    data = ''.join([json.dumps(record,separators=(',',':'),sort_keys=True) + '\n'
+                    for record in pending])
+    try:
+      f = open(self.path,'a')
+      try:
+        f.write(data)
+        size = f.tell()
+      finally:
+        f.close()
+      if self.maxbytes and size >= self.maxbytes:
+        self._rotate()
+    except (IOError,OSError),e:
+      if self.logger is not None:
+        self.logger.warn('restarter: cannot write journal %s: %s' % (self.path,e))
+
+  def _rotate(self):
+    if not self.backups:
+      os.remove(self.path)
+      return
+    for i in xrange(self.backups - 1,0,-1):
+      old = '%s.%d' % (self.path,i)
+      if os.path.exists(old):
+        os.rename(old,'%s.%d' % (self.path,i + 1))
+    os.rename(self.path,self.path + '.1')
+
+  def files(self):
+    '''Journal files which exist, oldest first.'''
+    names = ['%s.%d' % (self.path,i) for i in xrange(self.backups,0,-1)]
+    names.append(self.path)
+    return [name for name in names if os.path.exists(name)]
+
+  def records(self,files=None):
+    '''Iterate over every record of files, by default all of them, oldest
+    first, followed by those not yet written out.
+    '''
+    if files is None:
+      files = self.files()
+    for name in files:
+      try:
+        f = open(name)
+      except IOError:
+        continue
+      try:
+        for record in _parse(f):
+          yield record
+      finally:
+        f.close()
+    for record in list(self.pending):
+      yield record
+
+  def newest_records(self):
+    '''Iterate over every record, newest first, starting with those not
+    yet written out. Files are read from the end so stopping early only
+    reads as much as was needed.
+    '''
+    for record in reversed(list(self.pending)):
+      yield record
+    for name in reversed(self.files()):
+      try:
+        f = open(name)
+      except IOError:
+        continue
+      try:
+        for record in _parse(_lines_backwards(f)):
+          yield record
+      finally:
+        f.close()
+
+  def query(self,match=None,since=0,until=0,limit=100):
+    '''Return the last limit records, oldest first, whose group match()es
+    and which started within since and until (0 for no bound).
+    '''
+    found = []
+    if limit <= 0:
+      return found
+    for record in self.newest_records():
+      started = record.get('started') or 0
+      if since and started < since:
+        continue
+      if until and started > until:
+        continue
+      if match is not None and not match(record.get('group')):
+        continue
+      found.append(record)
+      if len(found) >= limit:
+        break
+    found.reverse()
+    return found
+
+  def _learn(self,record):
+    if record.get('signal') is not None:
+      # reloads say nothing about how long a restart takes
+      return
+    group = self.times.setdefault(record.get('group'),{})
+    for name,times in (record.get('times') or {}).iteritems():
+      stop = times.get('stop')
+      start = times.get('start')
+      known = group.get(name)
+      if known is None:
+        group[name] = [stop,start]
+        continue
+      for i,value in ((0,stop),(1,start)):
+        if value is None:
+          continue
+        if known[i] is None:
+          known[i] = value
+        else:
+          known[i] += ALPHA * (value - known[i])
+
+  def process_times(self,group):
+    '''Return the averaged [stop, start] seconds of each process of group
+    seen in the journal, either of which may be None. Only the newest
+    journal file is read to seed them, older ones add little to a moving
+    average.
+    '''
+    if self.times is None:
+      self.times = {}
+      for record in self.records(self.files()[-1:]):
+        self._learn(record)
+    return self.times.get(group,{})
+
+  def close(self):
+    self.flush()
+
+def estimate(durations,tick=0.0,wave_delay=0.0,stagger_factor=1,batch_size=0,
+             max_unavailable=0):
+  '''Return how many seconds restarting processes with the given (stop,
+  start) durations, in restart order, should take. tick is how late a
+  state change is noticed.
+
+  Without batch_size or max_unavailable processes are stopped in
+  stagger_factor waves wave_delay apart. batch_size restarts that many at
+  a time and waits for all of them, max_unavailable keeps that many
+  restarting at once. When both are given batches are no bigger than
+  max_unavailable.
+  '''
+  n = len(durations)
+  if not n:
+    return 0.0
+  if not batch_size and not max_unavailable:
+    stagger = min(max(stagger_factor or 1,1),n)
+    end = 0.0
+    for i,(stop,start) in enumerate(durations):
+      end = max(end,(i % stagger) * wave_delay + stop + tick + start + tick)
+    return end
+  if batch_size:
+    size = batch_size
+    if max_unavailable:
+      size = min(size,max_unavailable)
+    total = 0.0
+    for i in xrange(0,n,size):
+      total += max([stop + tick + start for stop,start in durations[i:i + size]]) + tick
+    return total
+  slots = [0.0] * min(max_unavailable,n)
+  end = 0.0
+  for stop,start in durations:
+    done = heappop(slots) + stop + tick + start + tick
+    heappush(slots,done)
+    end = max(end,done)
+  return end
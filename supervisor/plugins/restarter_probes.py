@@ -0,0 +1,307 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Readiness probes for the restarter plugin.
+
+A probe decides when a freshly started process is actually serving rather
+than merely RUNNING. Probe specs are one of:
+
+  tcp://host:port           a tcp connect succeeds
+  http://host:port/path     a GET returns a 2xx or 3xx status
+  log:regex                 regex matches a line written to the process's
+                            stdout log since it was spawned
+
+Specs are expanded per process with %(process_name)s, %(group_name)s,
+%(process_num)d, %(pid)d and %(ENV_X)s (from supervisord's environment
+overlaid with the program's own environment).
+
+Network probes are asyncore dispatchers which live in supervisord's own
+socket map so they never block the daemon. Log probes tail the file from
+where it was when the process was spawned, reading at most LOG_READ_SIZE
+bytes per check.
+"""
+import os,re,socket,errno
+from time import time
+from supervisor.medusa import asyncore_25 as asyncore
+
+LOG_READ_SIZE = 65536
+
+def process_num(name):
+  '''Recover a process's process_num from the trailing digits of its name
+  (supervisord does not keep it once the name has been expanded).
+  '''
+  m = re.search(r'(\d+)$',name)
+  if m:
+    return int(m.group(1))
+  return None
+
+def _expansions(process):
+  name = process.config.name
+  group_name = ''
+  if process.group is not None:
+    group_name = process.group.config.name
+  d = dict(('ENV_%s' % k,v) for k,v in os.environ.items())
+  env = getattr(process.config,'environment',None) or {}
+  d.update(('ENV_%s' % k,v) for k,v in env.items())
+  d.update({'process_name':name,
+            'group_name':group_name,
+            'process_num':process_num(name) or 0,
+            'pid':process.pid or 0})
+  return d
+
+def _split_hostport(hostport,default_port=None):
+  if ':' in hostport:
+    host,port = hostport.rsplit(':',1)
+    port = int(port)
+  elif default_port is not None:
+    host,port = hostport,default_port
+  else:
+    raise ValueError('no port in %r' % (hostport,))
+  return host or '127.0.0.1',port
+
+class ProbeSpec(object):
+  '''A parsed, not yet expanded, readiness probe spec.'''
+  def __init__(self,spec):
+    super(ProbeSpec,self).__init__()
+    self.spec = spec
+    if spec.startswith('tcp://'):
+      self.kind = 'tcp'
+      self.template = spec[6:]
+    elif spec.startswith('http://'):
+      self.kind = 'http'
+      self.template = spec[7:]
+    elif spec.startswith('log:'):
+      self.kind = 'log'
+      self.template = spec[4:]
+      self.regex = re.compile(self.template)
+    else:
+      raise ValueError('unknown readiness probe %r' % (spec,))
+
+  def __repr__(self):
+    return '<ProbeSpec %s>' % (self.spec,)
+
+  def create(self,process,socket_map,interval=0.5,wake=None):
+    '''Return a Probe for process. Log probes remember the current end of the
+    log so this should be called as the process is spawned.
+    '''
+    if self.kind == 'log':
+      return LogProbe(process,self.regex,interval)
+    target = self.template % _expansions(process)
+    if self.kind == 'tcp':
+      return TCPProbe(_split_hostport(target),socket_map,interval,wake)
+    parts = target.split('/',1)
+    host,port = _split_hostport(parts[0],80)
+    path = '/'
+    if len(parts) > 1:
+      path += parts[1]
+    return HTTPProbe((host,port),path,socket_map,interval,wake)
+
+class Probe(object):
+  '''Base readiness probe. poll() is called every restart tick and must
+  never block.
+  '''
+  def __init__(self,interval=0.5):
+    super(Probe,self).__init__()
+    self.interval = interval
+    self.ready = False
+    self.error = None
+    self.next_try = 0
+
+  def start(self):
+    pass
+
+  def poll(self,now):
+    '''Return True once the process is ready.'''
+    return self.ready
+
+  def close(self):
+    pass
+
+class LogProbe(Probe):
+  def __init__(self,process,regex,interval=0.5):
+    super(LogProbe,self).__init__(interval)
+    self.regex = regex
+    self.path = process.config.stdout_logfile
+    self.offset = self._size()
+    self.partial = ''
+
+  def _size(self):
+    try:
+      return os.stat(self.path).st_size
+    except (OSError,TypeError):
+      return 0
+
+  def poll(self,now):
+    if self.ready or now < self.next_try:
+      return self.ready
+    self.next_try = now + self.interval
+    size = self._size()
+    if size < self.offset:
+      # log was rotated
+      self.offset = 0
+      self.partial = ''
+    if size == self.offset:
+      return False
+    try:
+      f = open(self.path,'rb')
+      try:
+        f.seek(self.offset)
+        data = f.read(LOG_READ_SIZE)
+      finally:
+        f.close()
+    except IOError,e:
+      self.error = str(e)
+      return False
+    self.offset += len(data)
+    lines = (self.partial + data).split('\n')
+    self.partial = lines.pop()
+    for line in lines:
+      if self.regex.search(line):
+        self.ready = True
+        break
+    return self.ready
+
+class TCPProbe(Probe):
+  def __init__(self,address,socket_map,interval=0.5,wake=None):
+    super(TCPProbe,self).__init__(interval)
+    self.address = address
+    self.socket_map = socket_map
+    self.wake = wake
+    self.dispatcher = None
+
+  def poll(self,now):
+    if self.ready:
+      return True
+    if self.dispatcher is None and now >= self.next_try:
+      self.dispatcher_class(self)
+    return False
+
+  def succeeded(self):
+    self.dispatcher = None
+    self.ready = True
+    if self.wake is not None:
+      self.wake()
+
+  def failed(self,error):
+    self.dispatcher = None
+    self.error = error
+    self.next_try = time() + self.interval
+
+  def close(self):
+    if self.dispatcher is not None:
+      self.dispatcher.close()
+      self.dispatcher = None
+    self.wake = None
+
+class ConnectDispatcher(asyncore.dispatcher):
+  '''Non-blocking connect from inside supervisord's main loop.'''
+  def __init__(self,probe):
+    asyncore.dispatcher.__init__(self,map=probe.socket_map)
+    self.probe = probe
+    probe.dispatcher = self
+    self.create_socket(socket.AF_INET,socket.SOCK_STREAM)
+    err = self.socket.connect_ex(probe.address)
+    if err not in (0,errno.EINPROGRESS,errno.EWOULDBLOCK,errno.EALREADY):
+      self.fail(os.strerror(err))
+
+  def readable(self):
+    return self.connected
+
+  def writable(self):
+    return not self.connected
+
+  def _check_connect(self):
+    if self.connected:
+      return True
+    err = self.socket.getsockopt(socket.SOL_SOCKET,socket.SO_ERROR)
+    if err:
+      self.fail(os.strerror(err))
+      return False
+    self.connected = True
+    self.handle_connect()
+    return self.probe is not None
+
+  def handle_read_event(self):
+    if self._check_connect():
+      self.handle_read()
+
+  def handle_write_event(self):
+    if self._check_connect():
+      self.handle_write()
+
+  def handle_connect(self):
+    self.succeed()
+
+  def handle_read(self):
+    pass
+
+  def handle_write(self):
+    pass
+
+  def handle_close(self):
+    self.fail('connection closed')
+
+  def handle_error(self):
+    self.fail('probe error')
+
+  def succeed(self):
+    probe,self.probe = self.probe,None
+    self.close()
+    if probe is not None:
+      probe.succeeded()
+
+  def fail(self,error):
+    probe,self.probe = self.probe,None
+    self.close()
+    if probe is not None:
+      probe.failed(error)
+
+TCPProbe.dispatcher_class = ConnectDispatcher
+
+class HTTPDispatcher(ConnectDispatcher):
+  def __init__(self,probe):
+    self.outbuf = 'GET %s HTTP/1.0\r\nHost: %s:%d\r\n\r\n' % \
+                  (probe.path,probe.address[0],probe.address[1])
+    self.inbuf = ''
+    ConnectDispatcher.__init__(self,probe)
+
+  def writable(self):
+    return not self.connected or bool(self.outbuf)
+
+  def handle_connect(self):
+    pass
+
+  def handle_write(self):
+    sent = self.send(self.outbuf)
+    self.outbuf = self.outbuf[sent:]
+
+  def handle_read(self):
+    data = self.recv(4096)
+    if not data:
+      return self.fail('no response')
+    self.inbuf += data
+    if '\n' not in self.inbuf:
+      return
+    status = self.inbuf.split('\n',1)[0].split()
+    if len(status) >= 2 and status[1][:1] in ('2','3'):
+      self.succeed()
+    else:
+      self.fail('http status %s' % (' '.join(status[1:2]) or 'unknown',))
+
+class HTTPProbe(TCPProbe):
+  dispatcher_class = HTTPDispatcher
+
+  def __init__(self,address,path,socket_map,interval=0.5,wake=None):
+    super(HTTPProbe,self).__init__(address,socket_map,interval,wake)
+    self.path = path
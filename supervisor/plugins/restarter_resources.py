@@ -0,0 +1,204 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Process resource sampling for the restarter plugin.
+
+Resident set size and cpu time both come from /proc/<pid>/stat, so sampling
+a process is a single read; uptime is taken from supervisord's own record
+of when the process was started. The stat file of each process sampled is
+kept open and read again from the start on the next sample rather than
+opened again, for up to MAX_OPEN processes. Once a process has exited
+reading its open file fails with ESRCH and it is opened afresh.
+
+Cpu usage is reported as a percentage of one core, averaged since the
+previous sample of the process at least CPU_WINDOW seconds earlier or,
+for the first sample, since the process started.
+"""
+import os
+from time import time
+from supervisor.states import ProcessStates
+
+PROC = '/proc'
+MAX_OPEN = 256
+STAT_READ_SIZE = 1024
+CPU_WINDOW = 1.0
+
+try:
+  PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+  CLOCK_TICKS = float(os.sysconf('SC_CLK_TCK'))
+except (AttributeError,ValueError,OSError):
+  PAGE_SIZE = 4096
+  CLOCK_TICKS = 100.0
+
+def _parse_stat(data):
+  '''Return (rss in bytes, cpu seconds) from the contents of
+  /proc/<pid>/stat. The command name in parentheses may itself hold spaces
+  and parentheses so fields are counted from the last ")".
+  '''
+  fields = data[data.rindex(')') + 2:].split()
+  cpu = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+  rss = int(fields[21]) * PAGE_SIZE
+  return rss,cpu
+
+def _close(fd):
+  try:
+    os.close(fd)
+  except OSError:
+    pass
+
+class ResourceSample(object):
+  __slots__ = ('name','pid','rss','cpu','cpu_percent','uptime','over')
+
+  def __init__(self,name,pid,rss,cpu,cpu_percent,uptime):
+    self.name = name
+    self.pid = pid
+    self.rss = rss
+    self.cpu = cpu
+    self.cpu_percent = cpu_percent
+    self.uptime = uptime
+    self.over = []
+
+  def as_dict(self):
+    # rss can exceed xmlrpc's 32 bit ints
+    return {'name':self.name,
+            'pid':self.pid,
+            'rss':float(self.rss),
+            'cpu_seconds':self.cpu,
+            'cpu_percent':self.cpu_percent,
+            'uptime':self.uptime,
+            'over':list(self.over)}
+
+class ResourceLimits(object):
+  '''Thresholds above which a process is recycled, 0 for no limit.'''
+  def __init__(self,max_rss=0,max_cpu_percent=0.0,max_uptime=0.0):
+    super(ResourceLimits,self).__init__()
+    self.max_rss = max_rss
+    self.max_cpu_percent = max_cpu_percent
+    self.max_uptime = max_uptime
+
+  def limited(self):
+    return bool(self.max_rss or self.max_cpu_percent or self.max_uptime)
+
+  def check(self,sample):
+    '''Set sample.over to the limits it exceeds and return how far over
+    the worst of them it is, as a ratio; 0 if it is within all of them.
+    '''
+    worst = 0.0
+    sample.over = []
+    for name,limit,value in (('rss',self.max_rss,sample.rss),
+                             ('cpu',self.max_cpu_percent,sample.cpu_percent),
+                             ('uptime',self.max_uptime,sample.uptime)):
+      if limit and value > limit:
+        sample.over.append(name)
+        worst = max(worst,float(value) / limit)
+    return worst
+
+class ProcSampler(object):
+  def __init__(self,proc=PROC,max_open=MAX_OPEN):
+    super(ProcSampler,self).__init__()
+    self.proc = proc
+    self.max_open = max_open
+    self.fds = {}
+    self.last = {}
+    self.groups = {}
+
+  def _read(self,pid):
+    fd = self.fds.get(pid)
+    if fd is not None:
+      try:
+        os.lseek(fd,0,os.SEEK_SET)
+        data = os.read(fd,STAT_READ_SIZE)
+        if data:
+          return data
+      except OSError:
+        pass
+      # the process has exited, its pid may since have been reused
+      del self.fds[pid]
+      _close(fd)
+    try:
+      fd = os.open(os.path.join(self.proc,str(pid),'stat'),os.O_RDONLY)
+    except OSError:
+      return None
+    try:
+      data = os.read(fd,STAT_READ_SIZE)
+    except OSError:
+      data = None
+    if data and len(self.fds) < self.max_open:
+      self.fds[pid] = fd
+    else:
+      _close(fd)
+    return data
+
+  def sample(self,process,now=None):
+    '''Return a ResourceSample for a RUNNING process, None if it is not
+    running or its stat file cannot be read.
+    '''
+    pid = process.pid
+    if not pid or process.get_state() != ProcessStates.RUNNING:
+      return None
+    data = self._read(pid)
+    if not data:
+      return None
+    try:
+      rss,cpu = _parse_stat(data)
+    except (ValueError,IndexError):
+      return None
+    if now is None:
+      now = time()
+    uptime = 0.0
+    if process.laststart:
+      uptime = max(now - process.laststart,0.0)
+    last = self.last.get(pid)
+    if last is not None and now - last[1] < CPU_WINDOW:
+      percent = last[2]
+    else:
+      if last is not None:
+        percent = 100.0 * (cpu - last[0]) / (now - last[1])
+      elif uptime:
+        percent = 100.0 * cpu / uptime
+      else:
+        percent = 0.0
+      self.last[pid] = (cpu,now,percent)
+    return ResourceSample(process.config.name,pid,rss,cpu,percent,uptime)
+
+  def sample_group(self,group,now=None):
+    '''Sample every running process in group and forget the processes of
+    the group which have gone since the last time.
+    '''
+    if now is None:
+      now = time()
+    samples = []
+    pids = set()
+    for process in group.processes.values():
+      sample = self.sample(process,now)
+      if sample is not None:
+        samples.append(sample)
+        pids.add(sample.pid)
+    for pid in self.groups.get(group.config.name,set()) - pids:
+      self.forget(pid)
+    self.groups[group.config.name] = pids
+    return samples
+
+  def forget(self,pid):
+    self.last.pop(pid,None)
+    fd = self.fds.pop(pid,None)
+    if fd is not None:
+      _close(fd)
+
+  def close(self):
+    for fd in self.fds.values():
+      _close(fd)
+    self.fds = {}
+    self.last = {}
+    self.groups = {}
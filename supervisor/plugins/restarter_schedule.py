@@ -0,0 +1,218 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Restart schedules for the restarter plugin.
+
+A schedule says when a group is restarted, either every so often
+("every 6h") or at the times a five field cron expression matches
+("30 3 * * *", in local time), followed by any number of key=value
+options. jitter=<duration> delays each run by a random amount up to that
+long so hosts sharing a schedule don't all restart at the same moment; the
+other options are restart options, as given to restartProcessGroup().
+
+    schedule.workers = 30 3 * * * jitter=20m max_unavailable=10%%
+    schedule.cache = every 6h jitter=5m batch_size=2
+
+Durations are in seconds unless they end in s, m, h or d.
+"""
+import random
+from time import time,localtime,mktime
+from datetime import date,timedelta
+
+DURATION_UNITS = {'s':1,'m':60,'h':3600,'d':86400}
+
+# how far ahead to look for a time matching a cron expression, an
+# expression like "0 0 31 2 *" never matches
+CRON_HORIZON_DAYS = 5 * 366
+
+CRON_MACROS = {'@yearly':'0 0 1 1 *',
+               '@annually':'0 0 1 1 *',
+               '@monthly':'0 0 1 * *',
+               '@weekly':'0 0 * * 0',
+               '@daily':'0 0 * * *',
+               '@midnight':'0 0 * * *',
+               '@hourly':'0 * * * *'}
+
+MONTH_NAMES = ('jan','feb','mar','apr','may','jun',
+               'jul','aug','sep','oct','nov','dec')
+DAY_NAMES = ('sun','mon','tue','wed','thu','fri','sat')
+
+# (low, high, names) for minute, hour, day of month, month, day of week
+CRON_FIELDS = ((0,59,None),
+               (0,23,None),
+               (1,31,None),
+               (1,12,MONTH_NAMES),
+               (0,7,DAY_NAMES))
+
+def duration(value):
+  '''Parse a number of seconds, or of minutes, hours or days with an m, h
+  or d suffix.
+  '''
+  value = str(value).strip().lower()
+  scale = 1
+  if value and value[-1] in DURATION_UNITS:
+    scale = DURATION_UNITS[value[-1]]
+    value = value[:-1]
+  seconds = float(value) * scale
+  if seconds < 0:
+    raise ValueError('negative duration: %r' % (value,))
+  return seconds
+
+def _cron_value(text,low,names):
+  if names is not None and text.lower() in names:
+    return names.index(text.lower()) + (low or 0)
+  return int(text)
+
+def _cron_field(text,low,high,names=None):
+  '''Return the set of values a cron field matches, or None for "*".'''
+  if text == '*':
+    return None
+  values = set()
+  for item in text.split(','):
+    step = 1
+    if '/' in item:
+      item,step = item.split('/',1)
+      step = int(step)
+      if step < 1:
+        raise ValueError('bad step: %r' % (text,))
+    if item == '*':
+      first,last = low,high
+    elif '-' in item:
+      first,last = [_cron_value(part,low,names) for part in item.split('-',1)]
+    else:
+      first = _cron_value(item,low,names)
+      last = first
+      if step > 1:
+        last = high
+    if first < low or last > high or first > last:
+      raise ValueError('out of range: %r' % (text,))
+    values.update(xrange(first,last + 1,step))
+  return frozenset(values)
+
+class CronExpression(object):
+  '''Five cron fields: minute, hour, day of month, month and day of week.
+  As with cron, when both day fields are restricted a day matching either
+  one will do.
+  '''
+  def __init__(self,text):
+    super(CronExpression,self).__init__()
+    self.text = text
+    fields = CRON_MACROS.get(text.lower(),text).split()
+    if len(fields) != 5:
+      raise ValueError('cron expressions have five fields: %r' % (text,))
+    self.minutes,self.hours,self.days,self.months,self.weekdays = \
+      [_cron_field(field,low,high,names)
+       for field,(low,high,names) in zip(fields,CRON_FIELDS)]
+    if self.weekdays is not None and 7 in self.weekdays:
+      # both 0 and 7 are sunday
+      self.weekdays = self.weekdays | frozenset([0])
+
+  def _day_matches(self,day):
+    if self.months is not None and day.month not in self.months:
+      return False
+    if self.days is None and self.weekdays is None:
+      return True
+    # date.weekday() counts from monday, cron from sunday
+    weekday = (day.weekday() + 1) % 7
+    if self.days is None:
+      return weekday in self.weekdays
+    if self.weekdays is None:
+      return day.day in self.days
+    return day.day in self.days or weekday in self.weekdays
+
+  def next(self,after):
+    '''Return the first time after after, in seconds since the epoch,
+    which the expression matches. Raises ValueError if none does.
+    '''
+    now = localtime(after)
+    day = date(now.tm_year,now.tm_mon,now.tm_mday)
+    hours = sorted(self.hours or xrange(24))
+    minutes = sorted(self.minutes or xrange(60))
+    for i in xrange(CRON_HORIZON_DAYS):
+      if self._day_matches(day):
+        for hour in hours:
+          if i == 0 and hour < now.tm_hour:
+            continue
+          for minute in minutes:
+            when = mktime((day.year,day.month,day.day,hour,minute,0,0,0,-1))
+            if when > after:
+              return when
+      day += timedelta(days=1)
+    raise ValueError('cron expression never matches: %r' % (self.text,))
+
+class RestartSchedule(object):
+  '''When and how to restart one group. next_run is the time of the next
+  run, jitter included.
+  '''
+  def __init__(self,group,when,every=0.0,cron=None,jitter=0.0,options=None):
+    super(RestartSchedule,self).__init__()
+    self.group = group
+    self.when = when
+    self.every = every
+    self.cron = cron
+    self.jitter = jitter
+    self.options = options or {}
+    self.base = None
+    self.next_run = None
+    self.last_run = None
+    self.job = None
+
+  def plan(self,now):
+    '''Work out the next run after now.'''
+    if self.cron is not None:
+      self.base = self.cron.next(now)
+    elif self.base is None:
+      self.base = now + self.every
+    else:
+      # keep to the interval rather than drifting by how late the last run was
+      self.base += self.every
+      while self.base <= now:
+        self.base += self.every
+    self.next_run = self.base
+    if self.jitter:
+      self.next_run += random.uniform(0,self.jitter)
+    return self.next_run
+
+def parse_schedule(group,text,options=None):
+  '''Parse a schedule spec for group. options maps the restart options
+  which may be given to functions validating their values.
+  '''
+  words = text.split()
+  when = ' '.join([word for word in words if '=' not in word])
+  settings = {}
+  jitter = 0.0
+  for word in words:
+    if '=' not in word:
+      continue
+    key,value = word.split('=',1)
+    if key == 'jitter':
+      jitter = duration(value)
+      continue
+    if options is None or key not in options:
+      raise ValueError('unknown restart option %r' % (key,))
+    try:
+      options[key](value)
+    except (TypeError,ValueError):
+      raise ValueError('bad value for %s: %r' % (key,value))
+    settings[key] = value
+  if when.lower().startswith('every '):
+    every = duration(when[6:])
+    if every <= 0:
+      raise ValueError('interval must be positive: %r' % (when,))
+    return RestartSchedule(group,when,every=every,jitter=jitter,options=settings)
+  if not when:
+    raise ValueError('no interval or cron expression')
+  cron = CronExpression(when)
+  cron.next(time())
+  return RestartSchedule(group,when,cron=cron,jitter=jitter,options=settings)
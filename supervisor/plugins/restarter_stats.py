@@ -0,0 +1,161 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Restart telemetry for the restarter plugin.
+
+Per process latencies (stop, spawn, start, settling after a reload and
+readiness) and per restart costs (duration, ticks and cpu time per tick)
+are counted into histograms with fixed buckets, so memory use does not
+grow with the number of restarts. Only summaries of the last few restarts
+are kept on top of that.
+
+The histograms can also be written to a file in the Prometheus text
+exposition format, for node_exporter's textfile collector to pick up.
+"""
+import os
+from bisect import bisect_left
+from collections import deque
+
+SECONDS_BUCKETS = (0.005,0.01,0.025,0.05,0.1,0.25,0.5,1.0,2.5,5.0,
+                   10.0,30.0,60.0,300.0)
+CPU_BUCKETS = (0.0001,0.00025,0.0005,0.001,0.0025,0.005,0.01,0.025,
+               0.05,0.1,0.25,1.0)
+COUNT_BUCKETS = (1,2,5,10,20,50,100,200,500,1000,5000)
+
+# name, buckets and help text of every histogram kept
+HISTOGRAMS = (
+  ('stop_seconds',SECONDS_BUCKETS,
+   'Time from stopping a process until it was seen stopped.'),
+  ('spawn_seconds',CPU_BUCKETS,
+   'Time spent spawning a process.'),
+  ('start_seconds',SECONDS_BUCKETS,
+   'Time from spawning a process until it was seen RUNNING.'),
+  ('settle_seconds',SECONDS_BUCKETS,
+   'Time a reloaded process was watched before it counted as reloaded.'),
+  ('ready_seconds',SECONDS_BUCKETS,
+   'Time from RUNNING until a process passed its readiness probe.'),
+  ('restart_seconds',SECONDS_BUCKETS,
+   'Duration of group restarts.'),
+  ('restart_ticks',COUNT_BUCKETS,
+   'Ticks taken by group restarts.'),
+  ('tick_cpu_seconds',CPU_BUCKETS,
+   'Cpu time used by a single restart tick.'),
+)
+
+RESULTS = ('done','failed','timeout','cancelled','aborted')
+
+METRIC_PREFIX = 'supervisor_restarter_'
+
+def _le(bound):
+  return '%g' % bound
+
+class Histogram(object):
+  '''Cumulative counts of observations in fixed buckets. counts has one
+  more entry than bounds for observations above the last bound.
+  '''
+  __slots__ = ('bounds','counts','sum','count')
+
+  def __init__(self,bounds):
+    super(Histogram,self).__init__()
+    self.bounds = tuple(bounds)
+    self.counts = [0] * (len(self.bounds) + 1)
+    self.sum = 0.0
+    self.count = 0
+
+  def observe(self,value):
+    self.counts[bisect_left(self.bounds,value)] += 1
+    self.sum += value
+    self.count += 1
+
+  def as_dict(self):
+    return {'bounds':list(self.bounds),
+            'counts':list(self.counts),
+            'sum':self.sum,
+            'count':self.count}
+
+  def exposition(self,name,help):
+    '''Return the histogram as lines of Prometheus text format.'''
+    lines = ['# HELP %s %s' % (name,help),
+             '# TYPE %s histogram' % (name,)]
+    total = 0
+    for bound,count in zip(self.bounds,self.counts):
+      total += count
+      lines.append('%s_bucket{le="%s"} %d' % (name,_le(bound),total))
+    lines.append('%s_bucket{le="+Inf"} %d' % (name,self.count))
+    lines.append('%s_sum %r' % (name,self.sum))
+    lines.append('%s_count %d' % (name,self.count))
+    return lines
+
+class RestartStats(object):
+  '''Telemetry shared by every restart run through one rpc interface.'''
+  def __init__(self,history=20,textfile=None,logger=None):
+    super(RestartStats,self).__init__()
+    self.history = history
+    self.textfile = textfile
+    self.logger = logger
+    self.histograms = dict((name,Histogram(bounds))
+                           for name,bounds,help in HISTOGRAMS)
+    self.results = dict((result,0) for result in RESULTS)
+    self.recent = deque()
+
+  def observe(self,name,value):
+    self.histograms[name].observe(value)
+
+  def restart_finished(self,summary):
+    '''Record the summary of a finished restart, see
+    GroupRestart.summary().
+    '''
+    self.results[summary['result']] = self.results.get(summary['result'],0) + 1
+    self.observe('restart_seconds',summary['elapsed'])
+    self.observe('restart_ticks',summary['ticks'])
+    if self.history > 0:
+      self.recent.append(summary)
+      while len(self.recent) > self.history:
+        self.recent.popleft()
+    if self.textfile:
+      self.write_textfile()
+
+  def as_dict(self):
+    return {'histograms':dict((name,h.as_dict())
+                              for name,h in self.histograms.iteritems()),
+            'results':dict(self.results),
+            'restarts':list(self.recent)}
+
+  def exposition(self):
+    lines = []
+    for name,bounds,help in HISTOGRAMS:
+      lines.extend(self.histograms[name].exposition(METRIC_PREFIX + name,help))
+    name = METRIC_PREFIX + 'restarts_total'
+    lines.append('# HELP %s Finished group restarts by result.' % (name,))
+    lines.append('# TYPE %s counter' % (name,))
+    for result in RESULTS:
+      lines.append('%s{result="%s"} %d' % (name,result,self.results.get(result,0)))
+    return '\n'.join(lines) + '\n'
+
+  def write_textfile(self):
+    '''Atomically replace textfile so that a collector never sees a
+    partially written file.
+    '''
+    tmp = '%s.%d.tmp' % (self.textfile,os.getpid())
+    try:
+      f = open(tmp,'w')
+      try:
+        f.write(self.exposition())
+      finally:
+        f.close()
+      os.rename(tmp,self.textfile)
+    except (IOError,OSError),e:
+      if self.logger is not None:
+        self.logger.warn('restarter: cannot write stats to %s: %s' % \
+                         (self.textfile,e))
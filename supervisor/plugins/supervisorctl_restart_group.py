@@ -14,16 +14,65 @@
 
 """supervisorctl_restart_group -- perform a fast restart of a supervisor process group.
 
-Usage: %s <group>
+Usage: %s [options] <group>[:<processes>]
 
 This script performs an xml rpc call to a supervisord server and requests a fast restart
-of an entire process group.
+of an entire process group or, given a comma separated list of process names, globs and
+process number ranges after a colon (e.g. web:web_0*,40-59), of just those processes.
+
+In addition to all supervisorctl options the following are understood:
+
+--job                 submit a background restart job and poll it until it completes
+                      instead of holding a single rpc call open for the whole restart
+--poll-interval=secs  seconds between job status polls (default 0.5)
+--all-faults          if the restart fails print every fault, fetched a page at a
+                      time, rather than a summary with a sample of them
+--hosts=hosts         restart the group on each of a comma separated list of servers
+                      (host, host:port or a supervisorctl serverurl) instead of one
+--inventory=file      read servers from a file, one per line; blank lines and lines
+                      starting with # are ignored
+--parallel=n          restart on at most n servers at once (default 10, 0 for all)
+--max-failures=n      start no more servers once n have failed (default 0, no limit)
+
+The exit status is the number of faults reported (at most 255), 0 on success. With
+--hosts or --inventory it is the number of servers that failed and a table of
+results for every server is printed.
 
 The supervisord server must be configured to use the restarter plugin.
 """
-import sys,socket,errno
+import sys,socket,errno,time,copy
+import types
+import threading
 import xmlrpclib
-from supervisor.options import ClientOptions
+
+class DeferredModule(types.ModuleType):
+  '''Stands in for a module until one of its attributes is used, when the
+  real module is imported in its place.
+  '''
+  def __getattr__(self,attr):
+    module = self.__dict__.get('_module')
+    if module is None:
+      if sys.modules.get(self.__name__) is self:
+        del sys.modules[self.__name__]
+      __import__(self.__name__)
+      module = self.__dict__['_module'] = sys.modules[self.__name__]
+    return getattr(module,attr)
+
+def client_options():
+  '''Return supervisorctl's ClientOptions. supervisor.options imports
+  pkg_resources, which only supervisord uses and which takes longer to
+  import than everything else the script needs, so it gets a
+  DeferredModule instead.
+  '''
+  deferred = None
+  if 'pkg_resources' not in sys.modules:
+    deferred = sys.modules['pkg_resources'] = DeferredModule('pkg_resources')
+  try:
+    from supervisor.options import ClientOptions
+  finally:
+    if deferred is not None and sys.modules.get('pkg_resources') is deferred:
+      del sys.modules['pkg_resources']
+  return ClientOptions()
 
 class Controller(object):
   def __init__(self,options,stdout=sys.stdout,stderr=sys.stderr,stdin=sys.stdin):
@@ -70,6 +119,7 @@ class Controller(object):
             'remote version is %s.' % (rpcinterface.API_VERSION, api))
         return False
     except xmlrpclib.Fault, e:
+      from supervisor import xmlrpc
       if e.faultCode == xmlrpc.Faults.UNKNOWN_METHOD:
         self.output(
             'Sorry, supervisord responded but did not recognize '
@@ -89,40 +139,325 @@ class Controller(object):
       raise
     return True
 
+def add_options(options):
+  '''Add the command line options this script understands on top of those
+  supervisorctl already has.
+  '''
+  options.add('job',None,None,'job',flag=1,default=0)
+  options.add('poll_interval',None,None,'poll-interval=',float,default=0.5)
+  options.add('all_faults',None,None,'all-faults',flag=1,default=0)
+  options.add('hosts',None,None,'hosts=',str,default=None)
+  options.add('inventory',None,None,'inventory=',str,default=None)
+  options.add('parallel',None,None,'parallel=',int,default=10)
+  options.add('max_failures',None,None,'max-failures=',int,default=0)
+
+class ClientError(Exception):
+  '''An rpc call failed, status is the exit status it calls for.'''
+  def __init__(self,status,message):
+    Exception.__init__(self,message)
+    self.status = status
+
+# ask for one aggregated fault struct rather than a fault per process
+RESTART_OPTIONS = {'faults':'summary'}
+FAULT_PAGE_SIZE = 500
+
+def parse_target(target):
+  '''Split "group:selector" into the group name and the restart options
+  selecting its processes.
+  '''
+  restart_options = dict(RESTART_OPTIONS)
+  if ':' in target:
+    target,selector = target.split(':',1)
+    selector = [item.strip() for item in selector.split(',') if item.strip()]
+    if selector and selector != ['*']:
+      restart_options['processes'] = selector
+  return target.strip(),restart_options
+
 def send_restart(group,restarter=None,options=None,ctl=None):
+  name,restart_options = parse_target(group)
+  fallback = None
+  if restart_options == RESTART_OPTIONS:
+    # older servers take just the group name and return a list of faults
+    fallback = (name,)
+  return send_rpc(group,restarter.restartProcessGroup,(name,restart_options),
+                  options=options,ctl=ctl,fallback=fallback)
+
+def send_restart_job(group,restarter=None,options=None,ctl=None):
+  name,restart_options = parse_target(group)
+  job_id = send_rpc(group,restarter.startRestartJob,(name,restart_options),
+                    options=options,ctl=ctl)
+  try:
+    while 1:
+      status = send_rpc(group,restarter.getRestartJob,(job_id,),options=options,ctl=ctl)
+      if status['done']:
+        break
+      time.sleep(getattr(options,'poll_interval',None) or 0.5)
+  except KeyboardInterrupt:
+    send_rpc(group,restarter.cancelRestartJob,(job_id,),options=options,ctl=ctl)
+    raise ClientError(3,'%s: restart job %d cancelled' % (group,job_id))
+  if status['state'] == 'done':
+    return True
+  return status['faults']
+
+def fetch_faults(group,report,restarter=None,options=None,ctl=None):
+  '''Page through the full list of faults behind a summary.'''
+  offset = 0
+  while 1:
+    page = send_rpc(group,restarter.getRestartFaults,(report,offset,FAULT_PAGE_SIZE),
+                    options=options,ctl=ctl)
+    for fault in page['faults']:
+      yield fault
+    offset += len(page['faults'])
+    if not page['faults'] or offset >= page['total']:
+      break
+
+def _counts(counts):
+  items = counts.items()
+  items.sort(key=lambda item: (-item[1],item[0]))
+  return ', '.join(['%s %d' % item for item in items])
+
+def output_faults(group,faults,restarter=None,options=None,ctl=None):
+  '''Print a list of faults or a fault summary, return how many faults
+  there were.
+  '''
+  if isinstance(faults,dict):
+    total = faults['total']
+    ctl.output_error('%s: %d faults (%s)' % (group,total,_counts(faults['codes'])))
+    if faults['states']:
+      ctl.output_error('%s: processes not restarted: %s' % (group,_counts(faults['states'])))
+    if getattr(options,'all_faults',0):
+      listed = fetch_faults(group,faults['report'],restarter=restarter,
+                            options=options,ctl=ctl)
+    else:
+      listed = faults['sample']
+    shown = 0
+    for e in listed:
+      ctl.output_error('ERROR (%s)' % e['text'])
+      shown += 1
+    if shown < total:
+      ctl.output_error('... %d more, use --all-faults to see them all' % (total - shown))
+    return total
+  for e in faults:
+    ctl.output_error('ERROR (%s)' % e['text'])
+  return len(faults)
+
+def send_rpc(group,method,args,options=None,ctl=None,fallback=None):
+  '''Call method with args. If the server says they are the wrong
+  parameters and fallback is given it is called again with those instead.
+  '''
   try:
-    result = restarter.restartProcessGroup(group)
+    result = method(*args)
   except xmlrpclib.Fault, e:
-    ctl.output_error('%s: ERROR (%s)' % (group,e.faultString))
-    sys.exit(2)
+    from supervisor import xmlrpc
+    if fallback is not None and e.faultCode == xmlrpc.Faults.INCORRECT_PARAMETERS:
+      return send_rpc(group,method,fallback,options=options,ctl=ctl)
+    raise ClientError(2,'%s: ERROR (%s)' % (group,e.faultString))
   except socket.error, e:
     if e[0] == errno.ECONNREFUSED:
-      ctl.output_error('%s: refused connection' % options.serverurl)
+      raise ClientError(1,'%s: refused connection' % options.serverurl)
     elif e[0] == errno.ENOENT:
-      ctl.output_error('%s: no such file' % options.serverurl)
-    else:
-      raise
-    sys.exit(1)
+      raise ClientError(1,'%s: no such file' % options.serverurl)
+    raise
   else:
     return result
 
+def server_url(host):
+  '''Turn host or host:port into a supervisorctl serverurl.'''
+  if '://' in host:
+    return host
+  if ':' not in host:
+    host = '%s:9001' % host
+  return 'http://%s' % host
+
+def read_inventory(path):
+  hosts = []
+  f = open(path)
+  try:
+    for line in f:
+      line = line.strip()
+      if line and not line.startswith('#'):
+        hosts.append(line.split()[0])
+  finally:
+    f.close()
+  return hosts
+
+class FleetHost(object):
+  '''One server of a fleet restart. Its server proxy is kept for every
+  call made to it, the transport keeps its connection open between calls.
+  '''
+  def __init__(self,host,options):
+    super(FleetHost,self).__init__()
+    self.host = host
+    self.options = copy.copy(options)
+    self.options.serverurl = server_url(host)
+    self.state = 'pending'
+    self.faults = None
+    self.count = 0
+    self.error = None
+    self.elapsed = 0.0
+    self._restarter = None
+
+  def get_restarter(self):
+    if self._restarter is None:
+      self._restarter = self.options.getServerProxy().restarter
+    return self._restarter
+
+class Fleet(object):
+  '''Restarts a group on many servers from a pool of threads, with at
+  most parallel servers restarting at once.
+  '''
+  def __init__(self,hosts,group,send,parallel=10,max_failures=0,ctl=None):
+    super(Fleet,self).__init__()
+    self.hosts = hosts
+    self.group = group
+    self.send = send
+    self.parallel = parallel or len(hosts)
+    self.max_failures = max_failures
+    self.ctl = ctl
+    self.failed = 0
+    self.stopped = False
+    self.lock = threading.Lock()
+    self._next = 0
+
+  def _take(self):
+    self.lock.acquire()
+    try:
+      if self.stopped or self._next >= len(self.hosts):
+        return None
+      if self.max_failures and self.failed >= self.max_failures:
+        return None
+      host = self.hosts[self._next]
+      self._next += 1
+      return host
+    finally:
+      self.lock.release()
+
+  def _restart(self,host):
+    host.state = 'restarting'
+    started = time.time()
+    try:
+      result = self.send(self.group,restarter=host.get_restarter(),
+                         options=host.options,ctl=self.ctl)
+    except ClientError, e:
+      host.state = 'error'
+      host.error = str(e)
+    except (xmlrpclib.Error,socket.error,IOError), e:
+      host.state = 'error'
+      host.error = '%s: %s' % (host.options.serverurl,e)
+    else:
+      if result is True:
+        host.state = 'restarted'
+      elif isinstance(result,dict):
+        host.state = 'failed'
+        host.faults = result
+        host.count = result['total']
+      elif isinstance(result,(list,tuple)):
+        host.state = 'failed'
+        host.faults = result
+        host.count = len(result)
+      else:
+        host.state = 'unknown'
+    host.elapsed = time.time() - started
+    self.lock.acquire()
+    try:
+      if host.state != 'restarted':
+        self.failed += 1
+      self.ctl.output('%s: %s' % (host.host,host.state))
+    finally:
+      self.lock.release()
+
+  def _work(self):
+    while 1:
+      host = self._take()
+      if host is None:
+        break
+      self._restart(host)
+
+  def run(self):
+    threads = []
+    for i in xrange(min(self.parallel,len(self.hosts))):
+      thread = threading.Thread(target=self._work)
+      thread.setDaemon(True)
+      thread.start()
+      threads.append(thread)
+    try:
+      for thread in threads:
+        while thread.isAlive():
+          # a timeout keeps the main thread responsive to ^C
+          thread.join(0.5)
+    except KeyboardInterrupt:
+      self.stopped = True
+      self.ctl.output_error('interrupted, waiting for restarts in progress (^C again to abandon them)')
+      for thread in threads:
+        while thread.isAlive():
+          thread.join(0.5)
+    return self.failed
+
+  def output_table(self):
+    width = max([len('HOST')] + [len(host.host) for host in self.hosts])
+    self.ctl.output('%-*s  %-10s  %6s  %8s' % (width,'HOST','RESULT','FAULTS','ELAPSED'))
+    for host in self.hosts:
+      self.ctl.output('%-*s  %-10s  %6d  %7.1fs' % (width,host.host,host.state,
+                                                  host.count,host.elapsed))
+
+  def output_faults(self):
+    for host in self.hosts:
+      label = '%s %s' % (host.host,self.group)
+      if host.error:
+        self.ctl.output_error(host.error)
+      elif host.faults:
+        try:
+          output_faults(label,host.faults,restarter=host.get_restarter(),
+                        options=host.options,ctl=self.ctl)
+        except ClientError, e:
+          self.ctl.output_error(str(e))
+
+def fleet_main(group,hosts,send,options,ctl):
+  hosts = [FleetHost(host,options) for host in hosts]
+  fleet = Fleet(hosts,group,send,parallel=getattr(options,'parallel',10),
+                max_failures=getattr(options,'max_failures',0),ctl=ctl)
+  failed = fleet.run()
+  fleet.output_table()
+  fleet.output_faults()
+  sys.exit(min(failed,255))
+
 def main(args=None,options=None):
   if options is None:
-    options = ClientOptions()
+    options = client_options()
+    add_options(options)
   options.realize(args,doc=__doc__)
   ctl = Controller(options)
   if len(options.args) != 1:
     ctl.output_error('Invalid number of arguments (expected 1, got %d)' % len(options.args))
     sys.exit(5)
-  ctl.upcheck()
 
   group = options.args[0].strip()
-  restarter = ctl.get_restarter()
   result = None
+  if getattr(options,'job',0):
+    send = send_restart_job
+  else:
+    send = send_restart
+
+  hosts = []
+  if getattr(options,'hosts',None):
+    hosts.extend([host.strip() for host in options.hosts.split(',') if host.strip()])
+  if getattr(options,'inventory',None):
+    try:
+      hosts.extend(read_inventory(options.inventory))
+    except IOError, e:
+      ctl.output_error('%s: %s' % (options.inventory,e))
+      sys.exit(5)
+  if hosts:
+    fleet_main(group,hosts,send,options,ctl)
 
+  ctl.upcheck()
+  restarter = ctl.get_restarter()
   while 1:
     try:
-      result = send_restart(group,options=options,ctl=ctl,restarter=restarter)
+      result = send(group,options=options,ctl=ctl,restarter=restarter)
+    except ClientError, e:
+      ctl.output_error(str(e))
+      sys.exit(e.status)
     except xmlrpclib.ProtocolError,e:
       if e.errcode == 401:
         if options.interactive:
@@ -142,10 +477,13 @@ def main(args=None,options=None):
     break
 
   if result:
-    if isinstance(result,(list,tuple)):
-      for e in result:
-        ctl.output_error('ERROR (%s)' % e['text'])
-      sys.exit(len(result))
+    if isinstance(result,(list,tuple,dict)):
+      try:
+        count = output_faults(group,result,restarter=restarter,options=options,ctl=ctl)
+      except ClientError, e:
+        ctl.output_error(str(e))
+        sys.exit(e.status)
+      sys.exit(min(count,255))
     ctl.output('%s: restarted' % group)
   else:
     ctl.output('%s: unknown state, server did not send a response' % group)
@@ -0,0 +1,123 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Helpers shared by the restarter tests.
+
+Each test gets a FakeSupervisord (from bench/) on a virtual clock, so a
+restart taking minutes of simulated time runs in milliseconds, and a
+StateLog recording every process state change it makes.
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               '..','bench'))
+
+from supervisor import events
+from supervisor.states import ProcessStates
+from supervisor.plugins import restarter
+from fakesupervisord import FakeSupervisord,FakeProcess,install_clock
+
+EVENT_STATES = dict((event_class,state)
+                    for state,event_class in FakeProcess.event_map.items())
+
+class StateLog(object):
+  '''Records the state changes of every process and the fewest processes
+  of each group which were RUNNING at once.
+  '''
+  def __init__(self,supervisord):
+    super(StateLog,self).__init__()
+    self.clock = supervisord.clock
+    self.supervisord = supervisord
+    self.changes = []
+    self.running = None
+    self.fewest = {}
+    events.subscribe(events.ProcessStateEvent,self.record)
+
+  def start(self):
+    '''Start counting from the processes running now.'''
+    self.running = {}
+    for name,group in self.supervisord.process_groups.items():
+      self.running[name] = set([p.config.name for p in group.processes.itervalues()
+                                if p.get_state() == ProcessStates.RUNNING])
+      self.fewest[name] = len(self.running[name])
+
+  def record(self,event):
+    state = EVENT_STATES[event.__class__]
+    group = event.process.group.config.name
+    name = event.process.config.name
+    self.changes.append((self.clock(),group,name,state))
+    if self.running is None:
+      return
+    running = self.running[group]
+    if state == ProcessStates.RUNNING:
+      running.add(name)
+    else:
+      running.discard(name)
+    self.fewest[group] = min(self.fewest[group],len(running))
+
+  def times(self,state,group=None,name=None):
+    '''When processes, of group or just name, entered state.'''
+    return [when for when,g,n,s in self.changes
+            if s == state and group in (None,g) and name in (None,n)]
+
+  def names(self,state,group=None):
+    '''Processes of group which entered state, in order.'''
+    found = []
+    for when,g,n,s in self.changes:
+      if s == state and group in (None,g) and n not in found:
+        found.append(n)
+    return found
+
+class RestartTestCase(unittest.TestCase):
+  def setUp(self):
+    events.clear()
+    self.supervisord = FakeSupervisord(virtual=True,seed=1)
+    self.restore = install_clock(self.supervisord.clock)
+    self.log = StateLog(self.supervisord)
+
+  def tearDown(self):
+    self.restore()
+    events.clear()
+
+  def rpc(self,**config):
+    config.setdefault('delay',0.2)
+    config.setdefault('timeout',300.0)
+    return restarter.RPCInterface(self.supervisord,**config)
+
+  def call(self,callback):
+    '''Run a restart to completion, returns its result.'''
+    self.log.start()
+    self.started = self.supervisord.clock()
+    result,ticks = self.supervisord.call(callback)
+    self.elapsed = self.supervisord.clock() - self.started
+    return result
+
+  def fault_names(self,result):
+    '''Names of the faults a restart returned, or raised.'''
+    if result is True:
+      return []
+    if not isinstance(result,(list,tuple)):
+      result = [result]
+    return sorted(set([restarter._fault_name(fault['code'])
+                       for fault in restarter._fault_dicts(result)]))
+
+  def down(self,group):
+    '''Processes of group which are not running.'''
+    return [p.config.name for p in group.processes.itervalues()
+            if p.get_state() != ProcessStates.RUNNING]
+
+  def pids(self,group):
+    return dict([(name,p.pid) for name,p in group.processes.items()])
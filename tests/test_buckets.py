@@ -0,0 +1,76 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from supervisor.plugins.restarter import RestartPhases
+from support import RestartTestCase
+
+class PhaseBucketTests(RestartTestCase):
+  def watch(self,rpc,callback,name):
+    '''Run callback through the fake main loop, checking the buckets of
+    the restart of group name after every iteration. Returns the result,
+    the restart and the phases seen.
+    '''
+    supervisord = self.supervisord
+    self.log.start()
+    channel = supervisord.defer(callback)
+    restart = None
+    seen = set()
+    try:
+      while not channel.done:
+        supervisord.loop_once()
+        current = rpc._inflight.get(name)
+        if current is not None:
+          restart = current
+        if restart is not None:
+          self.check(restart)
+          seen.update([rec.phase for rec in restart.records.itervalues()])
+    finally:
+      supervisord.hangup(channel)
+    return channel.result,restart,seen
+
+  def check(self,restart):
+    total = 0
+    for phase,bucket in restart.buckets.iteritems():
+      total += len(bucket)
+      for rec in bucket:
+        self.assertEqual(rec.phase,phase)
+    self.assertEqual(total,len(restart.records))
+
+  def test_records_live_in_their_phase_bucket(self):
+    self.supervisord.add_group('bench',50,startsecs=1.0)
+    rpc = self.rpc()
+    result,restart,seen = self.watch(rpc,rpc.restartProcessGroup('bench',
+                                                                 {'max_unavailable':5}),
+                                     'bench')
+    self.assertEqual(result,True)
+    for phase in (RestartPhases.PENDING_STOP,RestartPhases.STOPPING,
+                  RestartPhases.STARTING,RestartPhases.DONE):
+      self.assertTrue(phase in seen)
+    self.assertEqual(restart.phase_counts()['done'],50)
+
+  def test_failed_and_cancelled_buckets(self):
+    self.supervisord.add_group('bench',10,spawn_error_rate=1.0,startretries=1)
+    rpc = self.rpc()
+    result,restart,seen = self.watch(rpc,rpc.restartProcessGroup('bench',
+                                                                 {'batch_size':2}),
+                                     'bench')
+    self.assertNotEqual(result,True)
+    counts = restart.phase_counts()
+    self.assertEqual(counts['failed'],2)
+    self.assertEqual(counts['cancelled'],8)
+    self.assertEqual(restart.pending(),0)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,70 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from supervisor.states import ProcessStates
+from support import RestartTestCase
+
+class CanaryTests(RestartTestCase):
+  def test_canaries_soak_before_the_rest(self):
+    group = self.supervisord.add_group('bench',6)
+    before = self.pids(group)
+    result = self.call(self.rpc().restartProcessGroup('bench',
+                                                      {'canary':2,'canary_soak':5}))
+    self.assertEqual(result,True)
+    stopped = self.log.names(ProcessStates.STOPPING)
+    self.assertEqual(stopped[:2],['bench_000','bench_001'])
+    canaries_up = max(self.log.times(ProcessStates.RUNNING,name='bench_001'))
+    rest = min(self.log.times(ProcessStates.STOPPING,name='bench_002'))
+    self.assertTrue(rest >= canaries_up + 5.0)
+    after = self.pids(group)
+    for name in before:
+      self.assertNotEqual(before[name],after[name])
+
+  def test_failed_canary_aborts(self):
+    group = self.supervisord.add_group('bench',10,spawn_error_rate=1.0,
+                                       startretries=1)
+    before = self.pids(group)
+    result = self.call(self.rpc().restartProcessGroup('bench',{'canary':1}))
+    self.assertTrue('CANARY_FAILED' in self.fault_names(result))
+    self.assertEqual(self.log.names(ProcessStates.STOPPING),['bench_000'])
+    after = self.pids(group)
+    for i in xrange(1,10):
+      name = 'bench_%03d' % i
+      self.assertEqual(before[name],after[name])
+
+  def test_canary_exiting_during_soak_aborts(self):
+    supervisord = self.supervisord
+    group = supervisord.add_group('bench',4)
+    canary = group.processes['bench_000']
+    pid = canary.pid
+    rpc = self.rpc()
+    callback = rpc.restartProcessGroup('bench',{'canary':1,'canary_soak':10})
+    self.log.start()
+    channel = supervisord.defer(callback)
+    try:
+      supervisord.run_until(lambda: canary.get_state() == ProcessStates.RUNNING and \
+                                    canary.pid != pid)
+      # the canary crashes a little way into its soak
+      up = supervisord.clock()
+      supervisord.run_until(lambda: supervisord.clock() >= up + 2.0)
+      canary.stop()
+      supervisord.run_until(lambda: channel.done)
+    finally:
+      supervisord.hangup(channel)
+    self.assertTrue('CANARY_FAILED' in self.fault_names(channel.result))
+    self.assertEqual(self.log.names(ProcessStates.STOPPING),['bench_000'])
+
+if __name__ == '__main__':
+  unittest.main()
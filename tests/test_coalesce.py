@@ -0,0 +1,68 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from supervisor.states import ProcessStates
+from support import RestartTestCase
+
+class CoalesceTests(RestartTestCase):
+  def setUp(self):
+    super(CoalesceTests,self).setUp()
+    self.group = self.supervisord.add_group('bench',5)
+    self.rpc = self.rpc()
+
+  def restart_twice(self,*followers):
+    '''Start restarting the group, then once it is under way ask for the
+    restarts followers gives the options of. Returns the results in the
+    same order.
+    '''
+    supervisord = self.supervisord
+    self.log.start()
+    first = supervisord.defer(self.rpc.restartProcessGroup('bench',{'max_unavailable':1}))
+    channels = [first]
+    try:
+      supervisord.run_until(lambda: self.log.times(ProcessStates.STOPPING,'bench'))
+      for options in followers:
+        channels.append(supervisord.defer(self.rpc.restartProcessGroup('bench',options)))
+      supervisord.run_until(lambda: not [c for c in channels if not c.done])
+    finally:
+      for channel in channels:
+        supervisord.hangup(channel)
+    return [channel.result for channel in channels]
+
+  def stops(self,name):
+    return self.log.times(ProcessStates.STOPPING,'bench',name)
+
+  def test_attached_restart_stops_each_process_once(self):
+    results = self.restart_twice({},{'coalesce':'attach'})
+    self.assertEqual(results,[True,True,True])
+    for name in self.group.processes:
+      self.assertEqual(len(self.stops(name)),1)
+    self.assertEqual(self.rpc._inflight,{})
+
+  def test_queued_follow_up_runs_after(self):
+    results = self.restart_twice({'coalesce':'queue'},{'coalesce':'queue'})
+    self.assertEqual(results,[True,True,True])
+    # both queued requests shared one follow-up
+    for name in self.group.processes:
+      self.assertEqual(len(self.stops(name)),2)
+    # which only started once the first restart had everything back up
+    restarted = max([self.log.times(ProcessStates.RUNNING,'bench',name)[0]
+                     for name in self.group.processes])
+    followed = min([self.stops(name)[1] for name in self.group.processes])
+    self.assertTrue(followed >= restarted,(restarted,followed))
+    self.assertEqual(self.rpc._inflight,{})
+
+if __name__ == '__main__':
+  unittest.main()
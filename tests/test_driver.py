@@ -0,0 +1,65 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from supervisor.plugins.restarter import TickDriver
+
+class Job(object):
+  def __init__(self,broken=False):
+    self.broken = broken
+    self.ticks = 0
+    self.aborted = None
+
+  def running(self):
+    return self.aborted is None
+
+  def due(self,now):
+    return True
+
+  def tick(self,now):
+    self.ticks += 1
+    if self.broken:
+      raise ZeroDivisionError('broken job')
+    return False
+
+  def abort(self,err):
+    self.aborted = err
+
+class TickDriverTests(unittest.TestCase):
+  def setUp(self):
+    self.driver = TickDriver({})
+
+  def tearDown(self):
+    self.driver.close()
+
+  def tick(self):
+    try:
+      self.driver.handle_write()
+    except ZeroDivisionError:
+      self.driver.handle_error()
+
+  def test_broken_job_leaves_the_others_alone(self):
+    before,broken,after = Job(),Job(broken=True),Job()
+    for job in (before,broken,after):
+      self.driver.add(job)
+    self.tick()
+    self.assertEqual(self.driver.jobs,[before,after])
+    self.assertNotEqual(broken.aborted,None)
+    self.assertEqual(before.aborted,None)
+    self.assertEqual(after.aborted,None)
+    self.tick()
+    self.assertEqual((before.ticks,broken.ticks,after.ticks),(2,1,1))
+
+if __name__ == '__main__':
+  unittest.main()
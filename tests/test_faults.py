@@ -0,0 +1,69 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from supervisor.plugins.restarter import RPCError,RestarterFaults
+from support import RestartTestCase
+
+class FaultSummaryTests(RestartTestCase):
+  def setUp(self):
+    super(FaultSummaryTests,self).setUp()
+    self.supervisord.add_group('bench',10,spawn_error_rate=1.0,startretries=1)
+
+  def names(self,faults):
+    return [fault['text'].split(': ',1)[1] for fault in faults]
+
+  def test_summary_sample(self):
+    rpc = self.rpc(faults='summary',fault_sample=3)
+    summary = self.call(rpc.restartProcessGroup('bench'))
+    self.assertEqual(summary['group'],'bench')
+    self.assertEqual(summary['total'],10)
+    self.assertEqual(summary['codes'],{'SPAWN_ERROR':10})
+    self.assertEqual(summary['states'],{'BACKOFF':10})
+    self.assertEqual(self.names(summary['sample']),['bench_000','bench_001','bench_002'])
+    # a sample bigger than the faults holds them all
+    rpc.fault_sample = 20
+    summary = self.call(rpc.restartProcessGroup('bench'))
+    self.assertEqual(len(summary['sample']),10)
+
+  def test_paging(self):
+    rpc = self.rpc(faults='summary',fault_sample=3)
+    report = self.call(rpc.restartProcessGroup('bench'))['report']
+    page = rpc.getRestartFaults(report,offset=4,limit=3)
+    self.assertEqual((page['report'],page['group'],page['total'],page['offset']),
+                     (report,'bench',10,4))
+    self.assertEqual(self.names(page['faults']),['bench_004','bench_005','bench_006'])
+    self.assertEqual(self.names(rpc.getRestartFaults(report,offset=8,limit=5)['faults']),
+                     ['bench_008','bench_009'])
+    self.assertEqual(rpc.getRestartFaults(report,offset=10)['faults'],[])
+    self.assertEqual(len(rpc.getRestartFaults(report)['faults']),10)
+    self.assertEqual(rpc.getRestartFaults(report,limit=0)['faults'],[])
+
+  def test_history_evicts_oldest_reports(self):
+    rpc = self.rpc(faults='summary',fault_history=2)
+    reports = [self.call(rpc.restartProcessGroup('bench'))['report']
+               for i in xrange(3)]
+    self.assertEqual(len(set(reports)),3)
+    for report in reports[1:]:
+      self.assertEqual(rpc.getRestartFaults(report)['total'],10)
+    for report in (reports[0],999,'x'):
+      try:
+        rpc.getRestartFaults(report)
+      except RPCError, e:
+        self.assertEqual(e.code,RestarterFaults.BAD_REPORT)
+      else:
+        self.fail('report %r was kept' % (report,))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,189 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import errno
+import socket
+import shutil
+import tempfile
+import threading
+import unittest
+from StringIO import StringIO
+from supervisor.plugins import supervisorctl_restart_group as client
+
+class StubRestarter(object):
+  '''The restarter namespace of one server. result is what restarting
+  returns, or an exception to raise.
+  '''
+  def __init__(self,servers,result=True):
+    super(StubRestarter,self).__init__()
+    self.servers = servers
+    self.result = result
+    self.calls = []
+
+  def restartProcessGroup(self,name,options=None):
+    servers = self.servers
+    servers.lock.acquire()
+    try:
+      servers.active += 1
+      servers.most = max(servers.most,servers.active)
+    finally:
+      servers.lock.release()
+    try:
+      self.calls.append((name,options))
+      # long enough for the other threads to pile in
+      time.sleep(0.01)
+      if isinstance(self.result,Exception):
+        raise self.result
+      return self.result
+    finally:
+      servers.lock.acquire()
+      try:
+        servers.active -= 1
+      finally:
+        servers.lock.release()
+
+class StubServers(object):
+  '''Stub restarters by serverurl, and how many were busy at once.'''
+  def __init__(self):
+    super(StubServers,self).__init__()
+    self.restarters = {}
+    self.lock = threading.Lock()
+    self.active = 0
+    self.most = 0
+
+  def add(self,host,result=True):
+    restarter = StubRestarter(self,result)
+    self.restarters[client.server_url(host)] = restarter
+    return restarter
+
+class StubProxy(object):
+  def __init__(self,restarter):
+    super(StubProxy,self).__init__()
+    self.restarter = restarter
+
+class StubOptions(object):
+  def __init__(self,servers,parallel=10,max_failures=0):
+    super(StubOptions,self).__init__()
+    self.servers = servers
+    self.serverurl = None
+    self.parallel = parallel
+    self.max_failures = max_failures
+
+  def getServerProxy(self):
+    return StubProxy(self.servers.restarters[self.serverurl])
+
+def summary(total):
+  return {'group':'web','total':total,'codes':{'SPAWN_ERROR':total},'states':{},
+          'sample':[{'code':50,'text':'SPAWN_ERROR: web_%03d' % (i,)} for i in xrange(total)],
+          'report':1}
+
+class InventoryTests(unittest.TestCase):
+  def test_read_inventory(self):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      path = os.path.join(tmpdir,'hosts')
+      f = open(path,'w')
+      try:
+        f.write('# web servers\n\nweb1\n  web2:9002  rack 4\n'
+                'http://web3:9001\n   # spare\nunix:///tmp/supervisor.sock\n')
+      finally:
+        f.close()
+      self.assertEqual(client.read_inventory(path),
+                       ['web1','web2:9002','http://web3:9001',
+                        'unix:///tmp/supervisor.sock'])
+    finally:
+      shutil.rmtree(tmpdir)
+
+  def test_server_url(self):
+    self.assertEqual(client.server_url('web1'),'http://web1:9001')
+    self.assertEqual(client.server_url('web2:9002'),'http://web2:9002')
+    self.assertEqual(client.server_url('unix:///tmp/supervisor.sock'),
+                     'unix:///tmp/supervisor.sock')
+
+class FleetTests(unittest.TestCase):
+  def setUp(self):
+    self.servers = StubServers()
+    self.stdout = StringIO()
+    self.stderr = StringIO()
+
+  def fleet(self,names,parallel=10,max_failures=0):
+    options = StubOptions(self.servers,parallel,max_failures)
+    self.ctl = client.Controller(options,stdout=self.stdout,stderr=self.stderr)
+    hosts = [client.FleetHost(name,options) for name in names]
+    return client.Fleet(hosts,'web',client.send_restart,parallel=parallel,
+                        max_failures=max_failures,ctl=self.ctl)
+
+  def test_parallel_limit(self):
+    names = ['web%d' % (i,) for i in xrange(10)]
+    for name in names:
+      self.servers.add(name)
+    fleet = self.fleet(names,parallel=3)
+    self.assertEqual(fleet.run(),0)
+    self.assertTrue(1 < self.servers.most <= 3,self.servers.most)
+    self.assertEqual([host.state for host in fleet.hosts],['restarted'] * 10)
+    for restarter in self.servers.restarters.values():
+      self.assertEqual(restarter.calls,[('web',client.RESTART_OPTIONS)])
+
+  def test_results(self):
+    self.servers.add('ok')
+    self.servers.add('faults',summary(3))
+    self.servers.add('old',[{'code':50,'text':'SPAWN_ERROR: web_000'}])
+    self.servers.add('down',socket.error(errno.ECONNREFUSED,'refused'))
+    fleet = self.fleet(['ok','faults','old','down'])
+    self.assertEqual(fleet.run(),3)
+    self.assertEqual([(host.state,host.count) for host in fleet.hosts],
+                     [('restarted',0),('failed',3),('failed',1),('error',0)])
+    self.assertTrue('refused connection' in fleet.hosts[3].error)
+
+  def test_max_failures(self):
+    names = ['web%d' % (i,) for i in xrange(6)]
+    for name in names:
+      self.servers.add(name,summary(1))
+    fleet = self.fleet(names,parallel=1,max_failures=2)
+    self.assertEqual(fleet.run(),2)
+    self.assertEqual([host.state for host in fleet.hosts],
+                     ['failed','failed'] + ['pending'] * 4)
+    for name in names[2:]:
+      self.assertEqual(self.servers.restarters[client.server_url(name)].calls,[])
+
+  def exit_status(self,names,**kw):
+    options = StubOptions(self.servers,**kw)
+    ctl = client.Controller(options,stdout=self.stdout,stderr=self.stderr)
+    try:
+      client.fleet_main('web',names,client.send_restart,options,ctl)
+    except SystemExit, e:
+      return e.code
+    self.fail('fleet_main did not exit')
+
+  def test_exit_status(self):
+    self.servers.add('ok1')
+    self.servers.add('ok2')
+    self.assertEqual(self.exit_status(['ok1','ok2']),0)
+    self.servers.add('bad1',summary(2))
+    self.servers.add('bad2',summary(5))
+    self.assertEqual(self.exit_status(['ok1','bad1','ok2','bad2']),2)
+    table = self.stdout.getvalue()
+    self.assertTrue('HOST' in table and 'bad2  failed' in table,table)
+    self.assertTrue('bad1 web: 2 faults' in self.stderr.getvalue())
+
+  def test_exit_status_is_capped(self):
+    names = ['web%d' % (i,) for i in xrange(300)]
+    for name in names:
+      self.servers.add(name,socket.error(errno.ECONNREFUSED,'refused'))
+    self.assertEqual(self.exit_status(names,parallel=0),255)
+
+if __name__ == '__main__':
+  unittest.main()
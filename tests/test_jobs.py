@@ -0,0 +1,84 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from supervisor.states import ProcessStates
+from supervisor.plugins.restarter import RPCError,RestarterFaults,JobStates
+from support import RestartTestCase
+
+class RestartJobTests(RestartTestCase):
+  def setUp(self):
+    super(RestartJobTests,self).setUp()
+    self.group = self.supervisord.add_group('bench',10)
+    self.rpc = self.rpc()
+
+  def poll(self,id,until=None):
+    '''Run the main loop, polling job id after every iteration until it is
+    done or until() is true. Returns the states the job was seen in.
+    '''
+    seen = []
+    while True:
+      status = self.rpc.getRestartJob(id)
+      if status['state'] not in seen:
+        seen.append(status['state'])
+      if status['done'] or (until is not None and until()):
+        return seen
+      self.supervisord.loop_once()
+
+  def test_poll_until_done(self):
+    before = self.pids(self.group)
+    self.log.start()
+    id = self.rpc.startRestartJob('bench',{'max_unavailable':2})
+    self.assertEqual(self.poll(id),[JobStates.RUNNING,JobStates.DONE])
+    status = self.rpc.getRestartJob(id)
+    self.assertEqual(status['id'],id)
+    self.assertEqual(status['group'],'bench')
+    self.assertEqual(status['pending'],0)
+    self.assertEqual(status['phases']['done'],10)
+    self.assertEqual(status['faults'],[])
+    after = self.pids(self.group)
+    for name in before:
+      self.assertNotEqual(before[name],after[name])
+    self.assertEqual(self.log.fewest['bench'],8)
+    self.assertTrue(self.rpc.startRestartJob('bench') > id)
+
+  def test_cancel_while_running(self):
+    before = self.pids(self.group)
+    self.log.start()
+    id = self.rpc.startRestartJob('bench',{'max_unavailable':1})
+    self.poll(id,until=lambda: len(self.log.times(ProcessStates.RUNNING,'bench')) >= 2)
+    self.assertEqual(self.rpc.cancelRestartJob(id),True)
+    self.assertEqual(self.poll(id)[-1],JobStates.CANCELLED)
+    self.assertEqual(self.rpc.getRestartJob(id)['state'],JobStates.CANCELLED)
+    # nothing is left down and the rest were never touched
+    self.assertEqual(self.down(self.group),[])
+    after = self.pids(self.group)
+    untouched = [name for name in before if before[name] == after[name]]
+    self.assertTrue(untouched)
+    for name in untouched:
+      self.assertEqual(self.log.times(ProcessStates.STOPPING,'bench',name),[])
+    self.assertEqual(self.rpc.cancelRestartJob(id),False)
+
+  def test_unknown_job(self):
+    for method,id in ((self.rpc.getRestartJob,999),(self.rpc.getRestartJob,'x'),
+                      (self.rpc.cancelRestartJob,999)):
+      try:
+        method(id)
+      except RPCError, e:
+        self.assertEqual(e.code,RestarterFaults.BAD_JOB)
+      else:
+        self.fail('no fault for unknown job %r' % (id,))
+
+if __name__ == '__main__':
+  unittest.main()
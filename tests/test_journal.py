@@ -0,0 +1,185 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from supervisor.plugins.restarter_journal import RestartJournal
+from support import RestartTestCase
+
+def record(n,group='a',**kw):
+  # about a hundred bytes once written out
+  record = {'group':group,'started':float(n),'n':n,'pad':'x' * 60}
+  record.update(kw)
+  return record
+
+class JournalTestCase(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.path = os.path.join(self.tmpdir,'journal.log')
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def lines(self,path=None):
+    f = open(path or self.path)
+    try:
+      return f.read().splitlines()
+    finally:
+      f.close()
+
+  def write(self,path,*records):
+    f = open(path,'a')
+    try:
+      for record in records:
+        f.write(json.dumps(record) + '\n')
+    finally:
+      f.close()
+
+class RestartJournalTests(JournalTestCase):
+  def test_batched_flush(self):
+    journal = RestartJournal(self.path,batch=3,flush_interval=5.0)
+    journal.append(record(0))
+    journal.append(record(1))
+    self.assertFalse(os.path.exists(self.path))
+    self.assertEqual(len(journal.pending),2)
+    # the first record sets the deadline
+    deadline = journal.next_flush
+    self.assertFalse(journal.due(deadline - 0.1))
+    self.assertTrue(journal.due(deadline))
+    journal.append(record(2))
+    self.assertEqual(len(self.lines()),3)
+    self.assertEqual(journal.pending,[])
+    self.assertEqual(journal.next_flush,None)
+    self.assertFalse(journal.due(deadline))
+
+  def test_rotation(self):
+    journal = RestartJournal(self.path,maxbytes=200,backups=2,batch=1)
+    for n in xrange(10):
+      journal.append(record(n))
+    # rotated every second record, the oldest files are gone
+    self.assertFalse(os.path.exists(self.path))
+    self.assertFalse(os.path.exists(self.path + '.3'))
+    self.assertEqual(journal.files(),[self.path + '.2',self.path + '.1'])
+    self.assertEqual([r['n'] for r in journal.records()],[6,7,8,9])
+    journal.append(record(10))
+    self.assertEqual([r['n'] for r in journal.records()],[6,7,8,9,10])
+
+  def test_rotation_without_backups(self):
+    journal = RestartJournal(self.path,maxbytes=200,backups=0,batch=1)
+    journal.append(record(0))
+    journal.append(record(1))
+    self.assertEqual(journal.files(),[])
+    journal.append(record(2))
+    self.assertEqual(journal.files(),[self.path])
+    self.assertEqual([r['n'] for r in journal.records()],[2])
+
+  def test_query_across_rotated_files(self):
+    journal = RestartJournal(self.path,maxbytes=200,backups=5,batch=1)
+    for n in xrange(9):
+      journal.append(record(n,group='ab'[n % 2]))
+    # and one not yet written out
+    journal.batch = 100
+    journal.append(record(9,group='b'))
+    self.assertEqual(len(journal.files()),5)
+    query = lambda **kw: [r['n'] for r in journal.query(**kw)]
+    self.assertEqual(query(),range(10))
+    self.assertEqual(query(limit=3),[7,8,9])
+    self.assertEqual(query(since=3,until=7),[3,4,5,6,7])
+    self.assertEqual(query(match=lambda group: group == 'a'),[0,2,4,6,8])
+    self.assertEqual(query(match=lambda group: group == 'b',since=2,until=8,limit=2),
+                     [5,7])
+    self.assertEqual(query(limit=0),[])
+
+  def test_truncated_last_line_is_skipped(self):
+    self.write(self.path,record(0),record(1))
+    f = open(self.path,'a')
+    try:
+      f.write('{"group":"a","sta')
+    finally:
+      f.close()
+    journal = RestartJournal(self.path)
+    self.assertEqual([r['n'] for r in journal.records()],[0,1])
+    self.assertEqual([r['n'] for r in journal.query()],[0,1])
+
+  def test_times_seeded_from_newest_file(self):
+    self.write(self.path + '.1',record(0,times={'p':{'stop':100.0,'start':100.0}}))
+    self.write(self.path,record(1,times={'p':{'stop':1.0,'start':2.0}}),
+                         record(2,times={'p':{'stop':2.0,'start':None}}),
+                         record(3,times={'p':{'stop':50.0,'start':50.0}},signal='HUP'))
+    journal = RestartJournal(self.path)
+    stop,start = journal.process_times('a')['p']
+    self.assertAlmostEqual(stop,1.3)
+    self.assertAlmostEqual(start,2.0)
+    # later restarts carry on the same average
+    journal.append(record(4,times={'p':{'stop':3.0,'start':4.0}}))
+    stop,start = journal.process_times('a')['p']
+    self.assertAlmostEqual(stop,1.81)
+    self.assertAlmostEqual(start,2.6)
+    self.assertEqual(journal.process_times('b'),{})
+
+class JournalRestartTests(RestartTestCase):
+  def setUp(self):
+    super(JournalRestartTests,self).setUp()
+    self.tmpdir = tempfile.mkdtemp()
+    self.path = os.path.join(self.tmpdir,'journal.log')
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+    super(JournalRestartTests,self).tearDown()
+
+  def test_flushed_by_the_deadline(self):
+    self.supervisord.add_group('bench',2)
+    rpc = self.rpc(journal_file=self.path,journal_flush=5.0)
+    self.assertEqual(self.call(rpc.restartProcessGroup('bench')),True)
+    deadline = rpc.journal.next_flush
+    self.assertFalse(os.path.exists(self.path))
+    clock = self.supervisord.clock
+    while clock() < deadline - 0.5:
+      self.supervisord.loop_once()
+    self.assertFalse(os.path.exists(self.path))
+    while clock() < deadline + 1.5:
+      self.supervisord.loop_once()
+    records = RestartJournal(self.path).query()
+    self.assertEqual([r['group'] for r in records],['bench'])
+
+  def plan(self,use_events):
+    '''Plan a restart from the last one, then restart again. Returns the
+    estimate and how long the restart took.
+    '''
+    self.supervisord.add_group('bench',10)
+    rpc = self.rpc(journal_file=self.path,delay=1.0,use_events=use_events)
+    options = {'stagger_factor':5}
+    self.assertEqual(self.call(rpc.restartProcessGroup('bench',options)),True)
+    plan = rpc.planRestart('bench',options)
+    self.assertEqual(plan['known'],10)
+    self.assertEqual(self.call(rpc.restartProcessGroup('bench',options)),True)
+    # the five waves are a second apart, which the estimate must count
+    self.assertTrue(self.elapsed > 4.0)
+    return plan['estimate'],self.elapsed
+
+  def test_plan_matches_restart_with_events(self):
+    estimate,elapsed = self.plan(True)
+    self.assertTrue(abs(estimate - elapsed) < 0.15 * elapsed,(estimate,elapsed))
+
+  def test_plan_covers_restart_polling(self):
+    # times seen by polling already carry some of the delay between
+    # ticks, so the estimate errs on the long side
+    estimate,elapsed = self.plan(False)
+    self.assertTrue(elapsed <= estimate < 1.5 * elapsed,(estimate,elapsed))
+
+if __name__ == '__main__':
+  unittest.main()
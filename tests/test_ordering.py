@@ -0,0 +1,83 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from supervisor.states import ProcessStates
+from supervisor.plugins import restarter
+from support import RestartTestCase
+
+class DependencyTests(RestartTestCase):
+  def first_stop(self,group):
+    return min(self.log.times(ProcessStates.STOPPING,group=group))
+
+  def last_up(self,group):
+    return max(self.log.times(ProcessStates.RUNNING,group=group))
+
+  def test_groups_wait_for_dependencies(self):
+    for name in ('db','app','web','other'):
+      self.supervisord.add_group(name,3,startsecs=2.0)
+    rpc = self.rpc(depends={'web':['app'],'app':['db']})
+    result = self.call(rpc.restartProcessGroups(['db','app','web','other']))
+    self.assertEqual(result,{'db':True,'app':True,'web':True,'other':True})
+    self.assertTrue(self.first_stop('app') >= self.last_up('db'))
+    self.assertTrue(self.first_stop('web') >= self.last_up('app'))
+    # other depends on nothing and goes alongside db
+    self.assertEqual(self.first_stop('other'),self.first_stop('db'))
+
+  def test_dependencies_followed_through_other_groups(self):
+    for name in ('db','app','web'):
+      self.supervisord.add_group(name,2,startsecs=2.0)
+    rpc = self.rpc(depends={'web':['app'],'app':['db']})
+    result = self.call(rpc.restartProcessGroups(['db','web']))
+    self.assertEqual(result,{'db':True,'web':True})
+    self.assertTrue(self.first_stop('web') >= self.last_up('db'))
+    self.assertEqual(self.log.times(ProcessStates.STOPPING,group='app'),[])
+
+  def test_failed_dependency_skips_dependents(self):
+    self.supervisord.add_group('db',2,spawn_error_rate=1.0,startretries=1)
+    web = self.supervisord.add_group('web',2)
+    before = self.pids(web)
+    rpc = self.rpc(depends={'web':['db']})
+    result = self.call(rpc.restartProcessGroups(['db','web']))
+    self.assertNotEqual(result['db'],True)
+    self.assertEqual(self.fault_names(result['web']),['BAD_STATE'])
+    self.assertEqual(self.pids(web),before)
+
+  def test_cycles_are_refused(self):
+    self.assertRaises(ValueError,restarter._dependencies,
+                      {'depends.a':'b','depends.b':'c','depends.c':'a'})
+
+class PriorityTests(RestartTestCase):
+  def test_by_priority_finishes_each_priority_first(self):
+    group = self.supervisord.add_group('bench',6,startsecs=2.0)
+    for i,p in enumerate(sorted(group.processes)):
+      group.processes[p].config.priority = 100 * (i % 3)
+    result = self.call(self.rpc().restartProcessGroup('bench',{'by_priority':True}))
+    self.assertEqual(result,True)
+    for low,high in ((0,100),(100,200)):
+      lows = [name for name,p in group.processes.items() if p.config.priority == low]
+      highs = [name for name,p in group.processes.items() if p.config.priority == high]
+      low_up = max([max(self.log.times(ProcessStates.RUNNING,name=name)) for name in lows])
+      high_stop = min([min(self.log.times(ProcessStates.STOPPING,name=name)) for name in highs])
+      self.assertTrue(high_stop >= low_up)
+
+  def test_stop_order_follows_priority(self):
+    group = self.supervisord.add_group('bench',4)
+    group.processes['bench_003'].config.priority = 1
+    self.call(self.rpc().restartProcessGroup('bench',{'batch_size':1}))
+    self.assertEqual(self.log.names(ProcessStates.STOPPING),
+                     ['bench_003','bench_000','bench_001','bench_002'])
+
+if __name__ == '__main__':
+  unittest.main()
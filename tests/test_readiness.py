@@ -0,0 +1,83 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from supervisor.states import ProcessStates
+from supervisor.plugins.restarter_probes import Probe
+from support import RestartTestCase
+
+class ClockProbe(Probe):
+  '''Passes once it has been polled for warmup seconds.'''
+  def __init__(self,clock,warmup,interval=0.5):
+    super(ClockProbe,self).__init__(interval)
+    self.clock = clock
+    self.ready_at = clock() + warmup
+
+  def poll(self,now):
+    if now >= self.ready_at:
+      self.ready = True
+    return self.ready
+
+class ClockProbeSpec(object):
+  '''Stands in for a ProbeSpec. Processes named in never don't pass.'''
+  spec = 'clock'
+
+  def __init__(self,clock,warmup,never=()):
+    super(ClockProbeSpec,self).__init__()
+    self.clock = clock
+    self.warmup = warmup
+    self.never = never
+    self.created = []
+
+  def create(self,process,socket_map,interval=0.5,wake=None):
+    self.created.append(process.config.name)
+    warmup = self.warmup
+    if process.config.name in self.never:
+      warmup = 1e9
+    return ClockProbe(self.clock,warmup,interval)
+
+class ReadinessTests(RestartTestCase):
+  def test_batch_waits_for_probe(self):
+    self.supervisord.add_group('bench',4)
+    spec = ClockProbeSpec(self.supervisord.clock,5.0)
+    rpc = self.rpc(readiness={'bench':spec})
+    result = self.call(rpc.restartProcessGroup('bench',{'batch_size':2}))
+    self.assertEqual(result,True)
+    self.assertEqual(sorted(spec.created),['bench_%03d' % i for i in xrange(4)])
+    stops = sorted(self.log.times(ProcessStates.STOPPING))
+    spawned = sorted(self.log.times(ProcessStates.STARTING))
+    # the second batch waits for the first to pass its probe, not just run
+    self.assertTrue(stops[2] >= spawned[1] + 5.0)
+    self.assertTrue(self.elapsed >= 10.0)
+
+  def test_probe_timeout_fails_process(self):
+    group = self.supervisord.add_group('bench',4)
+    spec = ClockProbeSpec(self.supervisord.clock,1.0,never=('bench_000',))
+    rpc = self.rpc(readiness={'bench':spec},readiness_timeout=3.0)
+    result = self.call(rpc.restartProcessGroup('bench',{'batch_size':1}))
+    self.assertTrue('NOT_READY' in self.fault_names(result))
+    # a process which never got ready is running but holds up the rest
+    self.assertEqual(self.down(group),[])
+    self.assertEqual(self.log.names(ProcessStates.STOPPING),['bench_000'])
+
+  def test_readiness_option_overrides_config(self):
+    self.supervisord.add_group('bench',2)
+    spec = ClockProbeSpec(self.supervisord.clock,1.0)
+    rpc = self.rpc(readiness={'bench':spec})
+    result = self.call(rpc.restartProcessGroup('bench',{'readiness':''}))
+    self.assertEqual(result,True)
+    self.assertEqual(spec.created,[])
+
+if __name__ == '__main__':
+  unittest.main()
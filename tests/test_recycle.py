@@ -0,0 +1,119 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+from supervisor.plugins import restarter_resources
+from supervisor.plugins.restarter_resources import ProcSampler
+from support import RestartTestCase
+
+MB = 1024 * 1024
+
+class RecycleTimerTests(RestartTestCase):
+  def setUp(self):
+    super(RecycleTimerTests,self).setUp()
+    # the sampler reads stat files written here rather than /proc
+    self.proc = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.proc)
+    super(RecycleTimerTests,self).tearDown()
+
+  def stat(self,p,rss=10*MB,cpu=0.0,uptime=None):
+    '''Give running process p a stat file, and a start time uptime
+    seconds ago.
+    '''
+    fields = ['S'] + ['0'] * 22
+    fields[11] = str(int(cpu * restarter_resources.CLOCK_TICKS))
+    fields[21] = str(rss / restarter_resources.PAGE_SIZE)
+    os.mkdir(os.path.join(self.proc,str(p.pid)))
+    f = open(os.path.join(self.proc,str(p.pid),'stat'),'w')
+    try:
+      f.write('%d (%s) %s\n' % (p.pid,p.config.name,' '.join(fields)))
+    finally:
+      f.close()
+    if uptime is not None:
+      p.laststart = self.supervisord.clock() - uptime
+
+  def add_group(self,name,numprocs,**over):
+    '''Add a group whose processes are well within limits, except those
+    over maps to stat() arguments for.
+    '''
+    group = self.supervisord.add_group(name,numprocs)
+    for process_name,p in group.processes.items():
+      self.stat(p,**over.get(process_name,{}))
+    return group
+
+  def rpc(self,**config):
+    config.setdefault('recycle_interval',10.0)
+    config.setdefault('recycle_groups','web*')
+    rpc = super(RecycleTimerTests,self).rpc(**config)
+    rpc.sampler = ProcSampler(proc=self.proc)
+    return rpc
+
+  def run_for(self,seconds):
+    clock = self.supervisord.clock
+    until = clock() + seconds
+    while clock() < until:
+      self.supervisord.loop_once()
+
+  def recycled(self,group,before):
+    after = self.pids(group)
+    return sorted([name for name in before if before[name] != after[name]])
+
+  def test_over_each_limit_is_recycled(self):
+    # by the first sample web_002 has used 18 cpu seconds in 20
+    group = self.add_group('web',5,web_001={'rss':500*MB},
+                                   web_002={'cpu':18.0,'uptime':10.0},
+                                   web_003={'uptime':7200.0})
+    before = self.pids(group)
+    self.rpc(max_rss=100*MB,max_cpu_percent=50,max_uptime=3600,recycle_limit=0)
+    self.log.start()
+    self.run_for(9.0)
+    self.assertEqual(self.recycled(group,before),[])
+    self.run_for(6.0)
+    self.assertEqual(self.recycled(group,before),['web_001','web_002','web_003'])
+    self.assertEqual(self.down(group),[])
+
+  def test_recycle_limit_per_interval(self):
+    group = self.add_group('web',5,web_001={'rss':200*MB},
+                                   web_002={'rss':400*MB},
+                                   web_003={'rss':300*MB})
+    before = self.pids(group)
+    self.rpc(max_rss=100*MB,recycle_limit=1)
+    self.log.start()
+    # worst first, one an interval
+    self.run_for(15.0)
+    self.assertEqual(self.recycled(group,before),['web_002'])
+    self.run_for(10.0)
+    self.assertEqual(self.recycled(group,before),['web_002','web_003'])
+    self.run_for(10.0)
+    self.assertEqual(self.recycled(group,before),['web_001','web_002','web_003'])
+    self.run_for(10.0)
+    self.assertEqual(self.recycled(group,before),['web_001','web_002','web_003'])
+
+  def test_other_groups_left_alone(self):
+    web = self.add_group('web',2,web_000={'rss':500*MB})
+    db = self.add_group('db',2,db_000={'rss':500*MB})
+    web_before,db_before = self.pids(web),self.pids(db)
+    self.rpc(max_rss=100*MB,recycle_limit=0)
+    self.log.start()
+    self.run_for(15.0)
+    self.assertEqual(self.recycled(web,web_before),['web_000'])
+    self.assertEqual(self.recycled(db,db_before),[])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,50 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import signal
+import unittest
+from supervisor.states import ProcessStates
+from support import RestartTestCase
+
+class ReloadTests(RestartTestCase):
+  def setUp(self):
+    super(ReloadTests,self).setUp()
+    self.group = self.supervisord.add_group('bench',5)
+
+  def test_reload_signals_and_settles(self):
+    before = self.pids(self.group)
+    rpc = self.rpc()
+    result = self.call(rpc.reloadProcessGroup('bench','HUP',{'settle':2.0}))
+    self.assertEqual(result,True)
+    for p in self.group.processes.itervalues():
+      self.assertEqual(p.signals,[signal.SIGHUP])
+    # nothing was restarted, but the reload waited for them to settle
+    self.assertEqual(self.pids(self.group),before)
+    self.assertEqual(self.log.changes,[])
+    self.assertTrue(self.elapsed >= 2.0)
+
+  def test_unsettled_process_is_restarted(self):
+    self.group.processes['bench_001'].config.reload_error_rate = 1.0
+    before = self.pids(self.group)
+    rpc = self.rpc()
+    result = self.call(rpc.reloadProcessGroup('bench','HUP',{'settle':2.0}))
+    self.assertEqual(result,True)
+    after = self.pids(self.group)
+    self.assertEqual([name for name in sorted(before) if before[name] != after[name]],
+                     ['bench_001'])
+    self.assertEqual(self.log.names(ProcessStates.STARTING,'bench'),['bench_001'])
+    self.assertEqual(self.down(self.group),[])
+
+if __name__ == '__main__':
+  unittest.main()
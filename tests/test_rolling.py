@@ -0,0 +1,67 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from supervisor.states import ProcessStates
+from support import RestartTestCase
+
+class RollingRestartTests(RestartTestCase):
+  def test_batch_size_limits_processes_down(self):
+    group = self.supervisord.add_group('bench',10)
+    before = self.pids(group)
+    result = self.call(self.rpc().restartProcessGroup('bench',{'batch_size':3}))
+    self.assertEqual(result,True)
+    self.assertEqual(self.log.fewest['bench'],7)
+    after = self.pids(group)
+    for name in before:
+      self.assertNotEqual(before[name],after[name])
+
+  def test_batch_waits_for_whole_batch(self):
+    self.supervisord.add_group('bench',4,startsecs=2.0)
+    result = self.call(self.rpc().restartProcessGroup('bench',{'batch_size':2}))
+    self.assertEqual(result,True)
+    stops = sorted(self.log.times(ProcessStates.STOPPING))
+    starts = sorted(self.log.times(ProcessStates.RUNNING))
+    # the second batch is stopped once the first is back up
+    self.assertTrue(stops[2] >= starts[1])
+
+  def test_max_unavailable_limits_processes_down(self):
+    self.supervisord.add_group('bench',10)
+    result = self.call(self.rpc().restartProcessGroup('bench',{'max_unavailable':'20%'}))
+    self.assertEqual(result,True)
+    self.assertEqual(self.log.fewest['bench'],8)
+
+  def test_failed_batch_stops_restart(self):
+    group = self.supervisord.add_group('bench',10,spawn_error_rate=1.0,
+                                       startretries=1)
+    result = self.call(self.rpc().restartProcessGroup('bench',{'batch_size':2}))
+    self.assertTrue('BAD_STATE' in self.fault_names(result))
+    self.assertEqual(len(self.down(group)),2)
+
+  def test_failures_count_against_max_unavailable(self):
+    group = self.supervisord.add_group('bench',10,spawn_error_rate=1.0,
+                                       startretries=1)
+    result = self.call(self.rpc().restartProcessGroup('bench',{'max_unavailable':2}))
+    self.assertTrue('BAD_STATE' in self.fault_names(result))
+    self.assertEqual(len(self.down(group)),2)
+
+  def test_backoff_counts_against_batch_size(self):
+    group = self.supervisord.add_group('bench',10,backoff_rate=1.0,
+                                       startretries=1)
+    result = self.call(self.rpc().restartProcessGroup('bench',{'batch_size':2}))
+    self.assertEqual(self.fault_names(result),['BAD_STATE','START_FAILED'])
+    self.assertEqual(len(self.down(group)),2)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,145 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from time import mktime
+from supervisor.states import ProcessStates
+from supervisor.plugins.restarter import JobStates
+from supervisor.plugins.restarter_schedule import CronExpression,RestartSchedule,\
+                                                  parse_schedule
+from support import RestartTestCase
+
+def local(year,month,day,hour=0,minute=0):
+  return mktime((year,month,day,hour,minute,0,0,0,-1))
+
+# a monday
+MONDAY = local(2024,1,1)
+
+class CronTests(unittest.TestCase):
+  def test_macros(self):
+    for macro,fields in (('@daily','0 0 * * *'),('@hourly','0 * * * *'),
+                         ('@weekly','0 0 * * 0'),('@yearly','0 0 1 1 *')):
+      self.assertEqual(CronExpression(macro).next(MONDAY),
+                       CronExpression(fields).next(MONDAY))
+    self.assertEqual(CronExpression('@weekly').next(MONDAY),local(2024,1,7))
+    self.assertEqual(CronExpression('@yearly').next(MONDAY),local(2025,1,1))
+
+  def test_month_and_day_names(self):
+    cron = CronExpression('0 0 * jan,MAR mon-wed')
+    self.assertEqual(cron.months,frozenset([1,3]))
+    self.assertEqual(cron.weekdays,frozenset([1,2,3]))
+    self.assertEqual(CronExpression('30 4 * * fri').next(MONDAY),local(2024,1,5,4,30))
+
+  def test_ranges_and_steps(self):
+    cron = CronExpression('*/15 9-17/4 * * *')
+    self.assertEqual(cron.minutes,frozenset([0,15,30,45]))
+    self.assertEqual(cron.hours,frozenset([9,13,17]))
+    self.assertEqual(CronExpression('5/20 * * * *').minutes,frozenset([5,25,45]))
+    self.assertEqual(cron.next(local(2024,1,1,9,50)),local(2024,1,1,13,0))
+
+  def test_seven_is_sunday(self):
+    self.assertEqual(CronExpression('0 0 * * 7').next(MONDAY),local(2024,1,7))
+    self.assertEqual(CronExpression('0 0 * * 7').next(MONDAY),
+                     CronExpression('0 0 * * 0').next(MONDAY))
+
+  def test_either_day_field_matches(self):
+    # the 13th or any friday
+    cron = CronExpression('0 0 13 * fri')
+    self.assertEqual(cron.next(MONDAY),local(2024,1,5))
+    self.assertEqual(cron.next(local(2024,1,5)),local(2024,1,12))
+    self.assertEqual(cron.next(local(2024,1,12)),local(2024,1,13))
+
+  def test_never_matching(self):
+    self.assertRaises(ValueError,CronExpression('0 0 31 2 *').next,MONDAY)
+    self.assertRaises(ValueError,parse_schedule,'bench','0 0 31 2 *')
+
+  def test_bad_fields(self):
+    for text in ('60 * * * *','* * * *','* * * 13 *','*/0 * * * *','5-1 * * * *'):
+      self.assertRaises(ValueError,CronExpression,text)
+
+class ScheduleTests(unittest.TestCase):
+  def test_every_keeps_to_the_interval(self):
+    schedule = RestartSchedule('bench','every 10s',every=10.0)
+    self.assertEqual(schedule.plan(100.0),110.0)
+    # ran late, the next run is still on the interval
+    self.assertEqual(schedule.plan(117.0),120.0)
+    # so late a run was missed altogether
+    self.assertEqual(schedule.plan(135.0),140.0)
+
+  def test_options(self):
+    schedule = parse_schedule('bench','every 6h jitter=5m batch_size=2',{'batch_size':int})
+    self.assertEqual(schedule.every,6 * 3600.0)
+    self.assertEqual(schedule.jitter,300.0)
+    self.assertEqual(schedule.options,{'batch_size':'2'})
+    self.assertRaises(ValueError,parse_schedule,'bench','every 6h nope=1',{})
+    self.assertRaises(ValueError,parse_schedule,'bench','every 6h batch_size=x',
+                      {'batch_size':int})
+
+class RestartSchedulerTests(RestartTestCase):
+  def run_until(self,predicate,limit=600):
+    clock = self.supervisord.clock
+    deadline = clock() + limit
+    while not predicate():
+      self.assertTrue(clock() < deadline,'ran out of time')
+      self.supervisord.loop_once()
+
+  def restarted(self,group):
+    '''When group's first process was stopped and last one running again.'''
+    stops = self.log.times(ProcessStates.STOPPING,group)
+    starts = self.log.times(ProcessStates.RUNNING,group)
+    return min(stops),max(starts)
+
+  def test_concurrency_limit(self):
+    for name in ('a','b','c'):
+      self.supervisord.add_group(name,3,stop_latency=1.0)
+    schedules = [parse_schedule(name,'every 60s') for name in ('a','b','c')]
+    rpc = self.rpc(schedules=schedules,schedule_concurrency=1)
+    self.log.start()
+    self.run_until(lambda: [s for s in schedules if s.job is not None])
+    self.assertEqual(sorted([status['state'] for status in rpc.scheduler.status()]),
+                     [JobStates.QUEUED,JobStates.QUEUED,JobStates.RUNNING])
+    self.run_until(lambda: [s.job.state for s in schedules if s.job is not None] == \
+                           [JobStates.DONE] * 3)
+    # one after the other, in the order they came due
+    a,b,c = [self.restarted(name) for name in ('a','b','c')]
+    self.assertTrue(a[1] <= b[0] and b[1] <= c[0],(a,b,c))
+
+  def test_no_concurrency_limit(self):
+    for name in ('a','b'):
+      self.supervisord.add_group(name,3,stop_latency=1.0)
+    schedules = [parse_schedule(name,'every 60s') for name in ('a','b')]
+    rpc = self.rpc(schedules=schedules,schedule_concurrency=0)
+    self.log.start()
+    self.run_until(lambda: [s for s in schedules if s.job is None] == [])
+    self.assertEqual([status['state'] for status in rpc.scheduler.status()],
+                     [JobStates.RUNNING,JobStates.RUNNING])
+
+  def test_skipped_while_last_run_unfinished(self):
+    self.supervisord.add_group('a',2,stop_latency=5.0)
+    schedule = parse_schedule('a','every 2s')
+    rpc = self.rpc(schedules=[schedule])
+    self.log.start()
+    self.run_until(lambda: schedule.job is not None)
+    first = schedule.job
+    self.run_until(lambda: not first.running())
+    self.assertEqual(first.state,JobStates.DONE)
+    # it came due twice more while running and neither run was queued
+    self.assertTrue(self.supervisord.clock() - first.created > 4.0)
+    self.assertEqual(len(self.log.times(ProcessStates.STOPPING,'a','a_000')),1)
+    self.assertEqual(len(rpc.scheduler.waiting),0)
+    self.run_until(lambda: schedule.job is not first)
+    self.assertEqual(schedule.job.id,first.id + 1)
+
+if __name__ == '__main__':
+  unittest.main()
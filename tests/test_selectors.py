@@ -0,0 +1,62 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from supervisor.xmlrpc import Faults
+from supervisor.plugins import restarter
+from support import RestartTestCase
+
+class SelectorTests(RestartTestCase):
+  def setUp(self):
+    super(SelectorTests,self).setUp()
+    self.group = self.supervisord.add_group('bench',20)
+
+  def select(self,*selector):
+    return sorted(restarter._select_processes(self.group,selector))
+
+  def test_names_globs_and_ranges(self):
+    self.assertEqual(self.select('bench_004'),['bench_004'])
+    self.assertEqual(self.select('bench_01[2-3]'),['bench_012','bench_013'])
+    self.assertEqual(self.select('3-5','bench_019'),
+                     ['bench_003','bench_004','bench_005','bench_019'])
+    self.assertEqual(self.select('7'),['bench_007'])
+
+  def test_unmatched_item_is_refused(self):
+    try:
+      self.select('bench_004','nope*')
+    except restarter.RPCError, e:
+      self.assertEqual(e.code,Faults.BAD_NAME)
+    else:
+      self.fail('no fault for an unmatched selector')
+
+  def test_only_selected_processes_restart(self):
+    before = self.pids(self.group)
+    rpc = self.rpc()
+    result = self.call(rpc.restartProcesses('bench',['0-4','bench_01*'],
+                                            {'max_unavailable':2}))
+    self.assertEqual(result,True)
+    after = self.pids(self.group)
+    changed = sorted([name for name in before if before[name] != after[name]])
+    self.assertEqual(changed,self.select('0-4','bench_01*'))
+    self.assertEqual(self.log.fewest['bench'],18)
+
+  def test_max_unavailable_percent_of_selection(self):
+    rpc = self.rpc()
+    result = self.call(rpc.restartProcesses('bench',['0-9'],{'max_unavailable':'20%'}))
+    self.assertEqual(result,True)
+    # 20% of the ten selected processes, not of the twenty in the group
+    self.assertEqual(self.log.fewest['bench'],18)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,52 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from supervisor.states import ProcessStates
+from support import RestartTestCase
+
+class StaggerTests(RestartTestCase):
+  def waves(self):
+    '''Times at which each wave of processes was stopped.'''
+    times = []
+    for when in sorted(self.log.times(ProcessStates.STOPPING)):
+      if not times or when - times[-1] > 0.001:
+        times.append(when)
+    return [when - self.started for when in times]
+
+  def check_waves(self,use_events):
+    self.supervisord.add_group('bench',9)
+    rpc = self.rpc(delay=1.0,stagger_factor=3,use_events=use_events)
+    result = self.call(rpc.restartProcessGroup('bench'))
+    self.assertEqual(result,True)
+    waves = self.waves()
+    self.assertEqual(len(waves),3)
+    for earlier,later in zip(waves,waves[1:]):
+      self.assertTrue(later - earlier >= 0.95,waves)
+
+  def test_waves_a_delay_apart_with_events(self):
+    # processes coming back up must not hurry the next wave along
+    self.check_waves(True)
+
+  def test_waves_a_delay_apart_polling(self):
+    self.check_waves(False)
+
+  def test_no_stagger_stops_everything_at_once(self):
+    self.supervisord.add_group('bench',9)
+    result = self.call(self.rpc(delay=1.0).restartProcessGroup('bench'))
+    self.assertEqual(result,True)
+    self.assertEqual(len(self.waves()),1)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,86 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+from supervisor.plugins.restarter_stats import Histogram,METRIC_PREFIX
+from support import RestartTestCase
+
+class HistogramTests(unittest.TestCase):
+  def test_buckets(self):
+    h = Histogram((1,5,10))
+    for value in (0.5,1,3,10,50):
+      h.observe(value)
+    self.assertEqual(h.counts,[2,1,1,1])
+    self.assertEqual(h.count,5)
+    self.assertEqual(h.sum,64.5)
+
+  def test_exposition_is_cumulative(self):
+    h = Histogram((1,5))
+    for value in (0.5,3,7):
+      h.observe(value)
+    lines = h.exposition('x','Help.')
+    self.assertEqual(lines[:2],['# HELP x Help.','# TYPE x histogram'])
+    self.assertEqual(lines[2:5],['x_bucket{le="1"} 1',
+                                 'x_bucket{le="5"} 2',
+                                 'x_bucket{le="+Inf"} 3'])
+    self.assertEqual(lines[-1],'x_count 3')
+
+class RestartStatsTests(RestartTestCase):
+  def test_restarts_are_counted(self):
+    self.supervisord.add_group('good',5)
+    self.supervisord.add_group('bad',2,spawn_error_rate=1.0,startretries=1)
+    rpc = self.rpc()
+    self.assertEqual(self.call(rpc.restartProcessGroup('good')),True)
+    self.call(rpc.restartProcessGroup('bad'))
+    stats = rpc.getRestartStats()
+    self.assertEqual(stats['results']['done'],1)
+    self.assertEqual(stats['results']['failed'],1)
+    histograms = stats['histograms']
+    self.assertEqual(histograms['stop_seconds']['count'],7)
+    self.assertEqual(histograms['start_seconds']['count'],5)
+    self.assertEqual(histograms['restart_seconds']['count'],2)
+    self.assertEqual([summary['group'] for summary in stats['restarts']],
+                     ['good','bad'])
+
+  def test_history_is_bounded(self):
+    self.supervisord.add_group('bench',2)
+    rpc = self.rpc(stats_history=2)
+    for i in xrange(4):
+      self.call(rpc.restartProcessGroup('bench'))
+    stats = rpc.getRestartStats()
+    self.assertEqual(len(stats['restarts']),2)
+    self.assertEqual(stats['results']['done'],4)
+
+  def test_textfile(self):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      path = os.path.join(tmpdir,'restarter.prom')
+      self.supervisord.add_group('bench',2)
+      rpc = self.rpc(stats_textfile=path)
+      self.call(rpc.restartProcessGroup('bench'))
+      f = open(path)
+      try:
+        text = f.read()
+      finally:
+        f.close()
+      self.assertTrue('%srestarts_total{result="done"} 1\n' % (METRIC_PREFIX,) in text)
+      self.assertEqual(os.listdir(tmpdir),['restarter.prom'])
+    finally:
+      shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+  unittest.main()
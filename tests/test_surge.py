@@ -0,0 +1,58 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from supervisor.states import ProcessStates
+from support import RestartTestCase
+
+class SurgeTests(RestartTestCase):
+  def running(self,group):
+    return sorted([p.config.name for p in group.processes.itervalues()
+                   if p.get_state() == ProcessStates.RUNNING])
+
+  def test_capacity_never_drops(self):
+    group = self.supervisord.add_group('bench',8,spares=2)
+    before = self.pids(group)
+    result = self.call(self.rpc().restartProcessGroup('bench',{'surge':2}))
+    self.assertEqual(result,True)
+    self.assertTrue(self.log.fewest['bench'] >= 8)
+    # spares are parked again afterwards
+    self.assertEqual(self.running(group),['bench_%03d' % i for i in xrange(8)])
+    after = self.pids(group)
+    for i in xrange(8):
+      name = 'bench_%03d' % i
+      self.assertNotEqual(before[name],after[name])
+
+  def test_keep_leaves_spares_running(self):
+    group = self.supervisord.add_group('bench',4,spares=1)
+    result = self.call(self.rpc().restartProcessGroup('bench',
+                                                      {'surge':1,'surge_policy':'keep'}))
+    self.assertEqual(result,True)
+    self.assertEqual(len(self.running(group)),5)
+
+  def test_spares_failing_leave_group_alone(self):
+    group = self.supervisord.add_group('bench',4,spares=2)
+    for i in (4,5):
+      group.processes['bench_%03d' % i].config.spawn_error_rate = 1.0
+    before = self.pids(group)
+    result = self.call(self.rpc().restartProcessGroup('bench',{'surge':2}))
+    self.assertNotEqual(result,True)
+    self.assertEqual(self.log.fewest['bench'],4)
+    after = self.pids(group)
+    for i in xrange(4):
+      name = 'bench_%03d' % i
+      self.assertEqual(before[name],after[name])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,90 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from supervisor.states import ProcessStates
+from supervisor.plugins.restarter import TickBudget
+from support import RestartTestCase
+
+class TickBudgetTests(unittest.TestCase):
+  def test_ops(self):
+    budget = TickBudget(ops=3)
+    budget.start()
+    for i in xrange(3):
+      self.assertFalse(budget.exhausted())
+      budget.spend()
+    self.assertTrue(budget.exhausted())
+    budget.start()
+    self.assertFalse(budget.exhausted())
+
+  def test_one_op_always_allowed(self):
+    # a deadline which has already passed
+    budget = TickBudget(ms=-1)
+    budget.start()
+    self.assertFalse(budget.exhausted())
+    budget.spend()
+    self.assertTrue(budget.exhausted())
+
+  def test_unlimited(self):
+    budget = TickBudget()
+    self.assertFalse(budget.limited())
+    budget.start()
+    for i in xrange(1000):
+      budget.spend()
+    self.assertFalse(budget.exhausted())
+
+class TimeSlicedRestartTests(RestartTestCase):
+  def stops_per_iteration(self,callback):
+    '''Run callback through the fake main loop, returns the result and
+    how many processes were stopped by each loop iteration.
+    '''
+    supervisord = self.supervisord
+    self.log.start()
+    channel = supervisord.defer(callback)
+    counts = []
+    try:
+      while not channel.done:
+        seen = len(self.log.changes)
+        supervisord.loop_once()
+        counts.append(len([change for change in self.log.changes[seen:]
+                           if change[3] == ProcessStates.STOPPING]))
+    finally:
+      supervisord.hangup(channel)
+    return channel.result,counts
+
+  def test_ops_budget_spreads_stops_over_ticks(self):
+    self.supervisord.add_group('bench',200)
+    result,counts = self.stops_per_iteration(self.rpc().restartProcessGroup('bench',
+                                                                           {'tick_budget_ops':20}))
+    self.assertEqual(result,True)
+    self.assertEqual(sum(counts),200)
+    self.assertTrue(max(counts) <= 20)
+
+  def test_without_budget_one_tick_stops_everything(self):
+    self.supervisord.add_group('bench',200)
+    result,counts = self.stops_per_iteration(self.rpc().restartProcessGroup('bench'))
+    self.assertEqual(result,True)
+    self.assertEqual(max(counts),200)
+
+  def test_budget_does_not_slow_restart_much(self):
+    self.supervisord.add_group('bench',200)
+    rpc = self.rpc()
+    self.call(rpc.restartProcessGroup('bench'))
+    unlimited = self.elapsed
+    self.call(rpc.restartProcessGroup('bench',{'tick_budget_ops':20}))
+    # yielded ticks carry on at once rather than waiting out the delay
+    self.assertTrue(self.elapsed < unlimited + 1.0)
+
+if __name__ == '__main__':
+  unittest.main()
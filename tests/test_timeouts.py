@@ -0,0 +1,63 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from supervisor.states import ProcessStates
+from support import RestartTestCase
+
+class TimeoutTests(RestartTestCase):
+  def test_stop_timeout_fails_one_process(self):
+    group = self.supervisord.add_group('bench',4)
+    group.processes['bench_002'].config.stop_latency = 100.0
+    result = self.call(self.rpc().restartProcessGroup('bench',{'stop_timeout':3}))
+    self.assertEqual(self.fault_names(result),['STOP_FAILED'])
+    self.assertTrue(self.elapsed < 10.0)
+    # the others are restarted all the same
+    self.assertEqual(len(self.log.names(ProcessStates.RUNNING)),3)
+
+  def test_start_timeout_fails_one_process(self):
+    group = self.supervisord.add_group('bench',4)
+    group.processes['bench_001'].config.startsecs = 100.0
+    result = self.call(self.rpc().restartProcessGroup('bench',{'start_timeout':5}))
+    self.assertEqual(self.fault_names(result),['START_FAILED'])
+    self.assertTrue(self.elapsed < 10.0)
+    self.assertEqual(len(self.log.names(ProcessStates.RUNNING)),3)
+
+  def test_idle_timeout_ends_stuck_restart(self):
+    self.supervisord.add_group('bench',4,startsecs=100.0)
+    result = self.call(self.rpc(timeout=0).restartProcessGroup('bench',
+                                                               {'idle_timeout':5}))
+    self.assertTrue('TIMEOUT' in self.fault_names(result))
+    self.assertTrue(self.elapsed < 10.0)
+
+  def test_idle_timeout_allows_steady_progress(self):
+    self.supervisord.add_group('bench',6,startsecs=3.0)
+    result = self.call(self.rpc(timeout=0).restartProcessGroup('bench',
+                                                               {'idle_timeout':5,
+                                                                'batch_size':1}))
+    self.assertEqual(result,True)
+    # far longer than idle_timeout, but never idle for that long
+    self.assertTrue(self.elapsed > 15.0)
+
+  def test_timeout_per_process(self):
+    self.supervisord.add_group('bench',4,startsecs=3.0)
+    rpc = self.rpc(timeout=2.0)
+    result = self.call(rpc.restartProcessGroup('bench',{'batch_size':1}))
+    self.assertTrue('TIMEOUT' in self.fault_names(result))
+    result = self.call(rpc.restartProcessGroup('bench',{'batch_size':1,
+                                                        'timeout_per_process':5}))
+    self.assertEqual(result,True)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,106 @@
+# Copyright 2013 Jesse Sipprell <jessesipprell@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import unittest
+from supervisor.states import ProcessStates
+from supervisor.xmlrpc import Faults
+from supervisor.plugins import restarter
+from support import RestartTestCase
+from fakesupervisord import ProcessConfig,ProcessGroupConfig
+
+class UpdateTests(RestartTestCase):
+  def setUp(self):
+    super(UpdateTests,self).setUp()
+    self.group = self.supervisord.add_group('bench',5)
+
+  def reread(self,changed={},added=(),removed=()):
+    '''Give supervisord a new config for the group, as reread would.'''
+    process_configs = []
+    for process_config in self.group.config.process_configs:
+      if process_config.name in removed:
+        continue
+      process_config = copy.copy(process_config)
+      for attr,value in changed.get(process_config.name,{}).items():
+        setattr(process_config,attr,value)
+      process_configs.append(process_config)
+    process_configs.extend(added)
+    config = ProcessGroupConfig('bench',process_configs)
+    self.supervisord.options.process_group_configs = [config]
+    return config
+
+  def update(self):
+    result = self.rpc().updateProcessGroup('bench')
+    if callable(result):
+      result = self.call(result)
+    return result
+
+  def check_configs(self,config):
+    '''The group's processes and configs are those of config.'''
+    names = [process_config.name for process_config in config.process_configs]
+    self.assertEqual(sorted(self.group.processes),sorted(names))
+    self.assertEqual([process_config.name for process_config in self.group.config.process_configs],
+                     names)
+    for process_config in config.process_configs:
+      self.assertEqual(self.group.processes[process_config.name].config,process_config)
+    self.assertEqual(self.group.config.process_configs,config.process_configs)
+
+  def test_changed_process_is_restarted(self):
+    before = self.pids(self.group)
+    config = self.reread(changed={'bench_001':{'stop_latency':0.1}})
+    self.assertEqual(self.update(),True)
+    after = self.pids(self.group)
+    self.assertEqual([name for name in sorted(before) if before[name] != after[name]],
+                     ['bench_001'])
+    self.assertEqual(self.group.processes['bench_001'].config.stop_latency,0.1)
+    self.check_configs(config)
+
+  def test_added_process_is_started(self):
+    before = self.pids(self.group)
+    config = self.reread(added=[ProcessConfig('bench_005')])
+    self.assertEqual(self.update(),True)
+    self.assertEqual(self.group.processes['bench_005'].get_state(),ProcessStates.RUNNING)
+    after = self.pids(self.group)
+    for name in before:
+      self.assertEqual(before[name],after[name])
+    self.check_configs(config)
+
+  def test_stopped_process_is_removed(self):
+    self.group.processes['bench_004'].state = ProcessStates.STOPPED
+    before = self.pids(self.group)
+    config = self.reread(removed=['bench_004'])
+    self.assertEqual(self.update(),True)
+    self.assertFalse('bench_004' in self.group.processes)
+    after = self.pids(self.group)
+    for name in after:
+      self.assertEqual(before[name],after[name])
+    self.check_configs(config)
+
+  def test_running_process_is_not_removed(self):
+    original = list(self.group.config.process_configs)
+    self.reread(removed=['bench_004'])
+    try:
+      self.update()
+    except restarter.RPCError, e:
+      self.assertEqual(e.code,Faults.STILL_RUNNING)
+      self.assertTrue(e.text.endswith('bench_004'))
+    else:
+      self.fail('a running process was removed')
+    self.assertEqual(sorted(self.group.processes),
+                     ['bench_%03d' % (i,) for i in xrange(5)])
+    self.assertEqual(self.group.config.process_configs,original)
+    self.assertEqual(self.down(self.group),[])
+
+if __name__ == '__main__':
+  unittest.main()